@@ -1,14 +1,23 @@
 """Admin configuration for the catalog app."""
 
 
-from django.contrib import admin
+import logging
+from itertools import islice
+
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.models import Group, User 
 from django.contrib.auth.admin import UserAdmin
+from django.db import IntegrityError
 
 
 #Everything under here I added
 from django import forms
-from .models import Owner, VehicleType, CarMake, CarInstance, FooterContent
+from .models import Owner, VehicleType, CarMake, CarInstance, FooterContent, PageVisit, DueBackReminder, CarStatusChange
+from . import bulk, roles, vin
+from .owners import save_user_and_owner
+
+logger = logging.getLogger('catalog.bulk')
 
 # Register your models here.
 # admin.site.register(CarMake)
@@ -26,9 +35,110 @@ class VehicleTypeAdmin(admin.ModelAdmin):
 class CarMakeAdmin(admin.ModelAdmin):
     list_display = ("manuName", "carModel", "vehicleType")
 
+class BatchProgress:
+    """
+    The progress callback for the bulk actions. Counts the batches and how far they got, for
+    the message the admin sees when the action is done, and logs selections too big to finish
+    in one batch as they go (the admin only hears back once the whole request is over).
+    """
+
+    def __init__(self, request, label):
+        self.request = request
+        self.label = label
+        self.batches = 0
+        self.done = 0
+
+    def __call__(self, done, total):
+        self.batches += 1
+        self.done = done
+        if total > bulk.BATCH_SIZE:
+            logger.info('%s (%s): %d of %d done', self.label, self.request.user, done, total)
+
+    def summary(self):
+        """' in 3 batches', or nothing when it all went in one."""
+        return f' in {self.batches} batches' if self.batches > 1 else ''
+
+class CarChangeForm(forms.Form):
+    # The values the car bulk actions set, shown next to the admin's action dropdown
+    status = forms.ChoiceField(choices=[('', 'Status...')] + list(CarInstance.CAR_STATUS), required=False)
+    due_back = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    mechanic = forms.ModelChoiceField(
+        queryset=User.objects.filter(groups__name=roles.MECHANICS).order_by('username'),
+        required=False,
+        empty_label='No mechanic',
+    )
+
+class CarActionForm(ActionForm, CarChangeForm):
+    pass
+
+def bulk_update_cars(modeladmin, request, queryset, label, **changes):
+    progress = BatchProgress(request, label)
+    updated = bulk.update_cars(queryset, progress=progress, user=request.user, **changes)
+    modeladmin.message_user(request, f'{label}: updated {updated} cars{progress.summary()}.', messages.SUCCESS)
+
+def change_form(modeladmin, request):
+    form = CarChangeForm(request.POST)
+    if not form.is_valid():
+        modeladmin.message_user(request, f'Invalid bulk change: {form.errors.as_text()}', messages.ERROR)
+        return None
+    return form.cleaned_data
+
+@admin.action(description="Set status of selected cars")
+def set_status(modeladmin, request, queryset):
+    data = change_form(modeladmin, request)
+    if data is None:
+        return
+    if not data['status']:
+        modeladmin.message_user(request, 'Pick a status to set.', messages.WARNING)
+        return
+    label = f'Set status to {dict(CarInstance.CAR_STATUS)[data["status"]]}'
+    bulk_update_cars(modeladmin, request, queryset, label, status=data['status'])
+
+@admin.action(description="Set due back date of selected cars")
+def set_due_back(modeladmin, request, queryset):
+    data = change_form(modeladmin, request)
+    if data is None:
+        return
+    if not data['due_back']:
+        modeladmin.message_user(request, 'Pick a due back date to set.', messages.WARNING)
+        return
+    bulk_update_cars(modeladmin, request, queryset, f'Set due back to {data["due_back"]}', due_back=data['due_back'])
+
+@admin.action(description="Assign selected cars to a mechanic (or none)")
+def assign_mechanic(modeladmin, request, queryset):
+    data = change_form(modeladmin, request)
+    if data is None:
+        return
+    mechanic = data['mechanic']
+    label = f'Assign to {mechanic}' if mechanic else 'Unassign mechanic'
+    bulk_update_cars(modeladmin, request, queryset, label, mechanic_stat=mechanic)
+
+@admin.action(description="Check VINs of selected cars")
+def check_vins(modeladmin, request, queryset):
+    # Decoded a batch at a time, offline, see catalog/vin.py
+    checked = 0
+    bad = []
+    rows = queryset.exclude(vinNum__isnull=True).exclude(vinNum='').values_list('license_plate', 'vinNum')
+    rows = rows.iterator(chunk_size=bulk.BATCH_SIZE)
+    while batch := list(islice(rows, bulk.BATCH_SIZE)):
+        checked += len(batch)
+        bad.extend(invalid_vins(batch))
+    if not bad:
+        modeladmin.message_user(request, f'All {checked} VINs checked are valid.', messages.SUCCESS)
+        return
+    examples = '; '.join(f'{plate}: {error}' for plate, error in bad[:10])
+    modeladmin.message_user(request, f'{len(bad)} of {checked} VINs are invalid. {examples}', messages.WARNING)
+
+def invalid_vins(rows):
+    decoded = vin.decode_many(number for _, number in rows)
+    return [(plate, decoded[number].errors[0]) for plate, number in rows if not decoded[number].valid]
+
 class CarInstanceAdmin(admin.ModelAdmin):
     list_display = ("car", "license_plate", "mechanic_stat", "color", "modelYear", "owner")
     list_filter = ("modelYear", "status")
+    list_select_related = ("car", "owner", "mechanic_stat")
+    action_form = CarActionForm
+    actions = [set_status, set_due_back, assign_mechanic, check_vins]
 
     fieldsets = (
         (None, {
@@ -47,19 +157,20 @@ class UserOwnerForm(forms.ModelForm):
     def save(self, commit=True):
         user = super().save(commit=False)
         if commit:
-            user.save()
-            Owner.objects.update_or_create(
-                user=user,
-                defaults={'first_name': user.first_name, 'last_name': user.last_name}
-            )
+            save_user_and_owner(user)
         return user
 
 def sync_with_owner(modeladmin, request, queryset):
-    for user in queryset:
-        Owner.objects.update_or_create(
-            user=user,
-            defaults={'first_name': user.first_name, 'last_name': user.last_name}
-        )
+    # A few statements per batch of users instead of an update_or_create per user
+    progress = BatchProgress(request, 'Sync owners')
+    try:
+        created, renamed = bulk.sync_owners(queryset, progress=progress)
+    except IntegrityError as exc:
+        # Batches before the failing one are already saved
+        saved = f' The first {progress.done} users ({progress.batches} batches) were synced before it.' if progress.batches else ''
+        modeladmin.message_user(request, f'Could not sync all owners, two would share a name and phone number: {exc}.{saved}', messages.ERROR)
+        return
+    modeladmin.message_user(request, f'Owners synced: {created} created, {renamed} renamed{progress.summary()}.', messages.SUCCESS)
 sync_with_owner.short_description = "Sync selected users with owner model"
 
 class CustomUserAdmin(UserAdmin):
@@ -76,7 +187,8 @@ class CustomUserAdmin(UserAdmin):
     def save_model(self, request, obj, form, change):
         if not change:  # Only for new users
             obj.is_staff = True
-        super().save_model(request, obj, form, change)
+        # The admin saves with commit=False, so the owner is written here rather than in UserOwnerForm.save
+        save_user_and_owner(obj)
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -113,11 +225,41 @@ class FooterContentAdmin(admin.ModelAdmin):
         # Prevent deletion of the FooterContent
         return False
 
+class PageVisitAdmin(admin.ModelAdmin):
+    list_display = ('page', 'user', 'count')
+    search_fields = ('page',)
+
+class DueBackReminderAdmin(admin.ModelAdmin):
+    list_display = ('car', 'recipient', 'level', 'due_back', 'sent_at', 'skipped_at')
+    list_filter = ('level',)
+    list_select_related = ('car', 'recipient')
+    raw_id_fields = ('car', 'recipient')
+
+class CarStatusChangeAdmin(admin.ModelAdmin):
+    # The status history is append-only, written by catalog/history.py
+    list_display = ('car', 'field', 'old_value', 'new_value', 'changed_at', 'changed_by')
+    list_filter = ('field', 'new_value')
+    list_select_related = ('car', 'changed_by')
+    raw_id_fields = ('car', 'changed_by')
+    date_hierarchy = 'changed_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # Register the admin class with the associated model
 admin.site.register(Owner, OwnerAdmin)
 admin.site.register(VehicleType, VehicleTypeAdmin)
 admin.site.register(CarMake, CarMakeAdmin)
 admin.site.register(CarInstance, CarInstanceAdmin)
+admin.site.register(PageVisit, PageVisitAdmin)
+admin.site.register(DueBackReminder, DueBackReminderAdmin)
+admin.site.register(CarStatusChange, CarStatusChangeAdmin)
 
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -0,0 +1,208 @@
+"""
+Fleet analytics for the admin dashboard and ``/catalog/api/analytics/``: cars per status,
+vehicle type, make, model year and mechanic, and status changes per day.
+
+Each breakdown is one GROUP BY that SQLite answers from an index alone:
+
+    status        car_status_due_back_idx
+    make, type    the car_id foreign key index, rolled up with the (small) CarMake table
+    model year    car_model_year_idx
+    mechanic      car_mechanic_due_back_idx
+    per day       status_change_entered_idx, the last TIMELINE_DAYS days of the status history
+
+At a million cars that is still about half a second all told, so the results are cached together for
+CATALOG_ANALYTICS_TIMEOUT seconds under a key that includes the 'fleet' cache version. Any
+car, owner or make change (the receivers in signals.py, and the bulk writes) moves it on and
+the next read recomputes. The mechanic chart's names aren't part of the results: they're
+looked up per read (one small cached query), so renaming a user doesn't throw the results away.
+
+Results, versions and the "someone is computing" flag all live in the shared cache (see
+caching.py), so every worker and manage.py command sees the same ones. While one process
+recomputes, the others get the previous results rather than all running the same queries
+(the file cache's add() isn't atomic, so at worst two of them compute at once). Run
+``manage.py warm_analytics`` after deploys or big imports (or with --loop) and the
+dashboard never has to wait for them.
+"""
+
+# Standard library imports
+import datetime
+from collections import Counter, defaultdict
+
+# Django core imports
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Local application imports
+from .caching import cache_version, shared_cache
+from .models import CarInstance, CarMake, CarStatusChange
+
+TIMEOUT = getattr(settings, 'CATALOG_ANALYTICS_TIMEOUT', 600)
+TIMELINE_DAYS = getattr(settings, 'CATALOG_ANALYTICS_TIMELINE_DAYS', 30)
+
+CACHE_KEY = 'catalog:analytics'
+_PREVIOUS_KEY = 'catalog:analytics:previous'  # The last results computed, served while new ones are
+_COMPUTING_KEY = 'catalog:analytics:computing'
+
+# The breakdowns and their chart titles, in the order the dashboard shows them
+BREAKDOWNS = (
+    ('status', 'Cars by status'),
+    ('vehicle_type', 'Cars by vehicle type'),
+    ('make', 'Cars by make'),
+    ('model_year', 'Cars by model year'),
+    ('mechanic', 'Cars by mechanic'),
+)
+
+
+def grouped(lookup):
+    """(value, cars) rows for one car column, a single GROUP BY."""
+    cars = CarInstance.objects.order_by()  # No default ordering, or due_back ends up in the GROUP BY
+    return cars.values_list(lookup).annotate(total=Count('id'))
+
+
+def _counts(lookup):
+    return dict(grouped(lookup))
+
+
+def _rows(counts, label, by_key=False):
+    """
+    [{key, label, count, percent}], biggest first (or in key order). ``percent`` is of the
+    biggest count, it's the bar width in the charts.
+    """
+    top = max(counts.values(), default=0)
+    rows = [
+        {'key': key, 'label': label(key), 'count': count, 'percent': round(100 * count / top, 1) if top else 0}
+        for key, count in counts.items()
+    ]
+    if by_key:
+        return sorted(rows, key=lambda row: row['label'])
+    return sorted(rows, key=lambda row: (-row['count'], row['label']))
+
+
+def _make_counts():
+    """(cars per manufacturer, cars per vehicle type, vehicle type names), from one GROUP BY car_id."""
+    per_make = _counts('car_id')
+    makes = {
+        pk: (manufacturer, type_id, type_name)
+        for pk, manufacturer, type_id, type_name in CarMake.objects.filter(pk__in=[pk for pk in per_make if pk])
+        .values_list('id', 'manuName', 'vehicleType_id', 'vehicleType__name')
+    }
+    manufacturers, types, type_names = Counter(), Counter(), {}
+    for pk, count in per_make.items():
+        manufacturer, type_id, type_name = makes.get(pk, (None, None, None))
+        manufacturers[manufacturer] += count
+        types[type_id] += count
+        type_names[type_id] = type_name
+    return manufacturers, types, type_names
+
+
+def changes_per_day(since):
+    """(day, status, changes into it) rows since ``since``, a single GROUP BY."""
+    codes = [code for code, _ in CarInstance.CAR_STATUS]
+    # field and new_value IN (...) let the changed_at range run on status_change_entered_idx
+    return (
+        CarStatusChange.objects.filter(field=CarStatusChange.STATUS, new_value__in=codes, changed_at__gte=since)
+        .annotate(day=TruncDate('changed_at'))
+        .order_by()
+        .values_list('day', 'new_value')
+        .annotate(total=Count('id'))
+    )
+
+
+def status_timeline(now=None, days=TIMELINE_DAYS):
+    """
+    Status changes per day for the last ``days`` days (today included), oldest first:
+    [{day, counts: {status: changes into it}, count, percent}]. Days without changes are in it too.
+    """
+    today = timezone.localdate(now or timezone.now())
+    first_day = today - datetime.timedelta(days=days - 1)
+    since = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min))
+    per_day = defaultdict(dict)
+    for day, status, total in changes_per_day(since):
+        per_day[day][status] = total
+    top = max((sum(counts.values()) for counts in per_day.values()), default=0)
+    timeline = []
+    for offset in range(days):
+        day = first_day + datetime.timedelta(days=offset)
+        counts = per_day.get(day, {})
+        count = sum(counts.values())
+        timeline.append({
+            'day': day.isoformat(), 'counts': counts, 'count': count,
+            'percent': round(100 * count / top, 1) if top else 0,
+        })
+    return timeline
+
+
+def compute_analytics(now=None):
+    """Runs every breakdown against the database, returns the analytics as a JSON ready dict."""
+    now = now or timezone.now()
+    statuses = dict(CarInstance.CAR_STATUS)
+    per_status = _counts('status')
+    manufacturers, types, type_names = _make_counts()
+    per_mechanic = _counts('mechanic_stat_id')
+    return {
+        'computed_at': now.isoformat(),
+        'total': sum(per_status.values()),
+        'status': _rows(per_status, lambda code: statuses.get(code, code or 'None')),
+        'vehicle_type': _rows(types, lambda pk: type_names.get(pk) or 'No type'),
+        'make': _rows(manufacturers, lambda name: name or 'No make'),
+        'model_year': _rows(_counts('modelYear'), lambda year: year or 'Unknown', by_key=True),
+        'mechanic': _rows(per_mechanic, lambda pk: ''),  # Labelled per read, see with_mechanic_names()
+        'status_changes': status_timeline(now),
+    }
+
+
+def _cache_key():
+    return f'{CACHE_KEY}:{cache_version("fleet")}'
+
+
+def mechanic_names(pks):
+    """{user id: username} for ``pks``, cached until the fleet or an account changes."""
+    pks = {pk for pk in pks if pk}
+    key = f'{CACHE_KEY}:mechanics:{cache_version("fleet")}:{cache_version("accounts")}'
+    names = shared_cache.get(key)
+    if names is None or not pks <= names.keys():  # e.g. cached for the previous results
+        # None for users that are gone, so they aren't looked up again every time
+        names = dict.fromkeys(pks) | dict(User.objects.filter(pk__in=pks).values_list('id', 'username'))
+        shared_cache.set(key, names, TIMEOUT)
+    return names
+
+
+def with_mechanic_names(analytics):
+    """Fills in the mechanic chart's labels, returns ``analytics``."""
+    names = mechanic_names(row['key'] for row in analytics['mechanic'])
+    for row in analytics['mechanic']:
+        row['label'] = (names.get(row['key']) or 'Unknown') if row['key'] else 'Unassigned'
+    return analytics
+
+
+def warm_analytics():
+    """Computes the analytics and caches them, returns them."""
+    key = _cache_key()  # Read first, a change made while computing must still count as new
+    analytics = compute_analytics()
+    shared_cache.set(key, analytics, TIMEOUT)
+    shared_cache.set(_PREVIOUS_KEY, analytics, None)
+    return with_mechanic_names(analytics)
+
+
+def fleet_analytics():
+    """
+    The analytics, from the cache while they're current. See the module docstring.
+
+    A few cache reads (the versions, the results and the mechanic names), no queries on a hit.
+    """
+    analytics = shared_cache.get(_cache_key())
+    if analytics is not None:
+        return with_mechanic_names(analytics)
+    computing = not shared_cache.add(_COMPUTING_KEY, True, 60)
+    if computing:
+        previous = shared_cache.get(_PREVIOUS_KEY)
+        if previous is not None:
+            return with_mechanic_names(previous)
+    try:
+        return warm_analytics()
+    finally:
+        if not computing:
+            shared_cache.delete(_COMPUTING_KEY)
@@ -0,0 +1,236 @@
+"""
+Read-only JSON API for vehicles, owners, makes and vehicle types.
+
+    GET /catalog/api/cars/?fields=id,license_plate,status&status=M&limit=100
+    GET /catalog/api/cars/?cursor=<next cursor from the previous page>
+
+Every resource takes ``fields`` (comma separated, see API_RESOURCES for the names), its own
+filters, ``limit`` (up to MAX_LIMIT) and ``cursor``. Rows come straight from values() and
+are keyset paginated, so a deep page costs the same as the first. The response is
+{"results": [...], "next": <url of the next page or null>}.
+
+The same rules as the HTML pages apply: admins and mechanics see every car, customers only
+their own; admins see every owner, anyone else only their own owner record.
+
+    GET /catalog/api/analytics/
+
+Fleet wide breakdowns (admins only), see catalog/analytics.py.
+"""
+
+# Django core imports
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+# Local application imports
+from . import roles
+from .analytics import fleet_analytics
+from .middleware import query_budget
+from .models import CarInstance, Owner, CarMake, VehicleType
+from .pagination import KeysetPaginator, InvalidCursor
+from .roles import has_role
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class ApiResource:
+    """Describes one API collection: the fields it exposes, how it filters and who sees what."""
+
+    def __init__(self, model, fields, default_fields, filters, order_key=None, scope=None):
+        self.model = model
+        self.fields = fields  # API field name -> ORM lookup
+        self.default_fields = default_fields
+        self.filters = filters  # query parameter -> ORM lookup
+        self.order_key = order_key  # Keyset pagination key, the primary key breaks ties
+        self.scope = scope  # (queryset, user) -> queryset the user may see
+
+    def queryset(self, user):
+        queryset = self.model.objects.all()
+        return self.scope(queryset, user) if self.scope else queryset
+
+
+def _car_scope(queryset, user):
+    if has_role(user, roles.ADMIN, roles.MECHANICS):
+        return queryset
+    if has_role(user, roles.CUSTOMER):
+        return queryset.filter(owner__user=user)
+    return queryset.none()
+
+
+def _owner_scope(queryset, user):
+    if has_role(user, roles.ADMIN):
+        return queryset
+    return queryset.filter(user=user)
+
+
+API_RESOURCES = {
+    'cars': ApiResource(
+        CarInstance,
+        fields={
+            'id': 'id',
+            'license_plate': 'license_plate',
+            'vinNum': 'vinNum',
+            'modelYear': 'modelYear',
+            'color': 'color',
+            'status': 'status',
+            'due_back': 'due_back',
+            'make_id': 'car_id',
+            'manuName': 'car__manuName',
+            'carModel': 'car__carModel',
+            'vehicleType': 'car__vehicleType__name',
+            'owner_id': 'owner_id',
+            'owner_first_name': 'owner__first_name',
+            'owner_last_name': 'owner__last_name',
+            'mechanic_id': 'mechanic_stat_id',
+            'mechanic': 'mechanic_stat__username',
+        },
+        default_fields=['id', 'license_plate', 'status', 'due_back', 'manuName', 'carModel', 'owner_id'],
+        filters={
+            'id': 'id',
+            'status': 'status',
+            'owner': 'owner_id',
+            'mechanic': 'mechanic_stat_id',
+            'make': 'car_id',
+            'license_plate': 'license_plate',
+            'vin': 'vinNum',
+            'due_before': 'due_back__lt',
+            'due_after': 'due_back__gt',
+        },
+        order_key='due_back',
+        scope=_car_scope,
+    ),
+    'owners': ApiResource(
+        Owner,
+        fields={
+            'id': 'id',
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'phone_num': 'phone_num',
+            'address': 'address',
+            'has_insurance': 'has_insurance',
+            'insurance_provider': 'insurance_provider',
+            'insurance_policy_number': 'insurance_policy_number',
+            'user_id': 'user_id',
+        },
+        default_fields=['id', 'first_name', 'last_name', 'phone_num'],
+        filters={
+            'id': 'id',
+            'last_name': 'last_name',
+            'phone_num': 'phone_num',
+            'has_insurance': 'has_insurance',
+        },
+        scope=_owner_scope,
+    ),
+    'makes': ApiResource(
+        CarMake,
+        fields={
+            'id': 'id',
+            'manuName': 'manuName',
+            'carModel': 'carModel',
+            'vehicleType_id': 'vehicleType_id',
+            'vehicleType': 'vehicleType__name',
+        },
+        default_fields=['id', 'manuName', 'carModel', 'vehicleType'],
+        filters={
+            'id': 'id',
+            'manuName': 'manuName',
+            'vehicleType': 'vehicleType_id',
+        },
+    ),
+    'vehicle-types': ApiResource(
+        VehicleType,
+        fields={
+            'id': 'id',
+            'name': 'name',
+        },
+        default_fields=['id', 'name'],
+        filters={
+            'id': 'id',
+            'name': 'name',
+        },
+    ),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _selected_fields(resource, params):
+    requested = params.get('fields')
+    if not requested:
+        return resource.default_fields
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in resource.fields]
+    if unknown:
+        raise ApiError(f'Unknown field(s): {", ".join(unknown)}. Choose from: {", ".join(resource.fields)}.')
+    return fields
+
+
+def _apply_filters(resource, queryset, params):
+    for param, lookup in resource.filters.items():
+        value = params.get(param)
+        if value is None:
+            continue
+        if lookup == 'has_insurance':
+            value = value.lower() in ('1', 'true', 'yes')
+        try:
+            queryset = queryset.filter(**{lookup: value})
+        except (ValueError, TypeError, ValidationError) as exc:  # e.g. an id of "abc" or a bad date
+            raise ApiError(f'Invalid value for {param}: {value!r}.') from exc
+    return queryset
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be a number.')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+@require_GET
+@query_budget(6)
+def api_list(request, resource_name):
+    resource = API_RESOURCES.get(resource_name)
+    if resource is None:
+        return JsonResponse({'error': f'Unknown resource "{resource_name}".'}, status=404)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+
+    try:
+        fields = _selected_fields(resource, request.GET)
+        queryset = _apply_filters(resource, resource.queryset(request.user), request.GET)
+        # The pagination key and id have to be in every row, even when the client didn't ask for them
+        lookups = [resource.fields[name] for name in fields]
+        extra = [lookup for lookup in ('id', resource.order_key) if lookup and lookup not in lookups]
+        rows = queryset.values(*lookups, *extra)
+        paginator = KeysetPaginator(rows, resource.order_key, _limit(request.GET))
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as exc:
+            raise ApiError(str(exc))
+    except ApiError as exc:
+        return JsonResponse({'error': exc.message}, status=exc.status)
+
+    results = [{name: row[resource.fields[name]] for name in fields} for row in page.object_list]
+    next_url = None
+    if page.has_next:
+        query = request.GET.copy()
+        query['cursor'] = page.next_cursor
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return JsonResponse({'results': results, 'next': next_url})
+
+
+@require_GET
+@query_budget(12)  # A cache miss runs the breakdowns, a hit just the session and user
+def api_analytics(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    if not has_role(request.user, roles.ADMIN):
+        return JsonResponse({'error': 'Only admins can see the fleet analytics.'}, status=403)
+    return JsonResponse(fleet_analytics())
@@ -1,6 +1,7 @@
 """ Explains all the apps that should be called by catalog"""
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class CatalogConfig(AppConfig):
     """Configuration class for the catalog application."""
@@ -10,3 +11,6 @@ class CatalogConfig(AppConfig):
 
     def ready(self):
         import catalog.signals  # This line imports your signals
+        import catalog.checks  # Registers the query plan check
+        from .search import create_search_tables
+        post_migrate.connect(create_search_tables, sender=self)  # The FTS tables have no migration
@@ -0,0 +1,152 @@
+"""
+Async versions of the home page and the admin and customer dashboards.
+
+They render the same templates as their counterparts in views.py, but the independent
+queries behind a page (counts, visits, footer, the owner and their cars) are sent off
+together and awaited with asyncio.gather. Each query runs with
+sync_to_async(thread_sensitive=False), so they run side by side in worker threads on
+their own connections, and the event loop is never blocked waiting on the database.
+Serve them through myfleetmanager/asgi.py (e.g. ``uvicorn myfleetmanager.asgi:application``).
+Under WSGI they still work, but each request runs them on a throwaway event loop.
+Like the sync views they're cached whole by cached_page, the gathering only happens on a miss.
+"""
+
+# Standard library imports
+import asyncio
+
+# Django core imports
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import Http404
+from django.shortcuts import render, redirect
+
+# Local application imports
+from . import roles
+from .caching import cached_page, get_footer_content
+from .models import Owner, CarInstance
+from .roles import get_roles, has_role
+from .stats import TOTAL, fleet_stats
+from .views import dashboard_charts
+from .visits import record_visit
+
+
+async def run_query(function, *args, **kwargs):
+    """
+    Runs one blocking query in a worker thread, so several can be awaited together.
+
+    The worker's connection is closed afterwards the way Django does at the end of a
+    request, i.e. only when CONN_MAX_AGE says it's due.
+    """
+    def query():
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return await sync_to_async(query, thread_sensitive=False)()
+
+
+async def gather_queries(**queries):
+    """Runs {name: (function, *args)} concurrently and returns {name: result}."""
+    results = await asyncio.gather(*(run_query(*query) for query in queries.values()))
+    return dict(zip(queries, results))
+
+
+def _load_user(request):
+    # Resolves the lazy request.user and caches its roles on it, both need the database
+    user = request.user
+    if user.is_authenticated:
+        get_roles(user)
+    return user
+
+
+async def get_user(request):
+    return await sync_to_async(_load_user)(request)
+
+
+async def render_async(request, template_name, context):
+    # Template rendering may still touch the database (context processors, lazy relations)
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def _count(queryset):
+    return queryset.count()
+
+
+def _visits(request, user, page_name):
+    request.visit_page_name = page_name  # cached_page counts later visits under the same name
+    return record_visit(page_name, user.pk if user.is_authenticated else None)
+
+
+def _customer_cars(user):
+    return list(CarInstance.objects.filter(owner__user=user).select_related('car'))
+
+
+def _owner_or_none(user):
+    return Owner.objects.filter(user=user).first()
+
+
+@cached_page()
+async def async_home_page(request):
+    user = await get_user(request)
+    if not user.is_authenticated:
+        context = await gather_queries(
+            num_visits=(_visits, request, user, 'no_auth_home'),
+            footer_content=(get_footer_content,),
+        )
+        return await render_async(request, 'no_auth_home.html', context)
+
+    # Redirect to respective dashboards based on user group, before counting anything
+    if has_role(user, roles.CUSTOMER):
+        return redirect('async_customer_dashboard')
+    if has_role(user, roles.ADMIN):
+        return redirect('async_admin_dashboard')
+    if has_role(user, roles.MECHANICS):
+        return redirect('mechanics_dashboard')
+
+    context = await gather_queries(
+        num_visits=(_visits, request, user, 'home'),
+        num_instances=(_count, CarInstance.objects.all()),
+        num_owners=(_count, Owner.objects.all()),
+        footer_content=(get_footer_content,),
+    )
+    return await render_async(request, 'no_auth_home.html', context)
+
+
+@cached_page()
+async def async_admin_dashboard(request):
+    user = await get_user(request)
+    if not has_role(user, roles.ADMIN):
+        return redirect_to_login(request.get_full_path())
+
+    context = await gather_queries(
+        num_visits=(_visits, request, user, 'admin_dashboard'),
+        fleet=(fleet_stats,),
+        num_overdue=(_count, CarInstance.objects.overdue()),
+        footer_content=(get_footer_content,),
+        charts=(dashboard_charts,),
+    )
+    fleet = context.pop('fleet')
+    context['num_instances'] = fleet['cars'][TOTAL]
+    context['num_owners'] = fleet['owners'][TOTAL]
+    context['user'] = user
+    return await render_async(request, 'dashboards/admin_dashboard.html', context)
+
+
+@cached_page()
+async def async_customer_dashboard(request):
+    user = await get_user(request)
+    if not has_role(user, roles.CUSTOMER):
+        return redirect_to_login(request.get_full_path())
+
+    # The cars are looked up through the user, so they don't have to wait for the owner row
+    context = await gather_queries(
+        owner=(_owner_or_none, user),
+        customer_cars=(_customer_cars, user),
+        num_visits=(_visits, request, user, 'customer_dashboard'),
+        footer_content=(get_footer_content,),
+    )
+    if context['owner'] is None:
+        raise Http404('No owner record for this user.')
+    context['user'] = user
+    return await render_async(request, 'dashboards/customer_dashboard.html', context)
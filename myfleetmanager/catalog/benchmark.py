@@ -0,0 +1,405 @@
+"""
+Synthetic fleet data and the view benchmarks behind ``manage.py benchmark_catalog`` and
+``manage.py benchmark_dashboards``.
+
+seed_fleet() fills an (empty, throwaway) database with a reproducible fleet of the given
+size. run_benchmark() then requests every URL in catalog/urls.py through the test client
+as a user with the right role and records wall time, query count and peak memory.
+run_dashboard_load() puts the sync dashboards (WSGI) and their async versions (ASGI)
+under the same concurrent load and records the latency percentiles of each, rendered every
+time and then served from the page cache.
+run_write_load() has several mechanics submit edit_car_instance forms at once and records
+write throughput and failed writes (e.g. "database is locked").
+"""
+
+# Standard library imports
+import asyncio
+import random
+import threading
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+# Django core imports
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, resolve, reverse
+
+# Local application imports
+from . import roles
+from . import urls as catalog_urls
+from .middleware import query_budget_for
+from .forms import CarInstanceForm
+from .models import Owner, VehicleType, CarMake, CarInstance, Feedback
+
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+_FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth']
+_LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez']
+_MAKES = {
+    'Toyota': ['Camry', 'Corolla', 'RAV4', 'Tacoma', 'Sienna'],
+    'Ford': ['F-150', 'Escape', 'Explorer', 'Transit', 'Mustang'],
+    'Honda': ['Civic', 'Accord', 'CR-V', 'Odyssey', 'Pilot'],
+    'Chevrolet': ['Silverado', 'Malibu', 'Equinox', 'Tahoe', 'Express'],
+    'Nissan': ['Altima', 'Sentra', 'Rogue', 'Frontier', 'NV200'],
+}
+_VEHICLE_TYPES = ['Sedan', 'SUV', 'Truck', 'Van', 'Coupe', 'Minivan']
+_COLORS = ['Red', 'Blue', 'Black', 'White', 'Silver', 'Grey', 'Green']
+_CATEGORIES = [value for value, _ in Feedback.CATEGORY_CHOICES]
+_STATUSES = [value for value, _ in CarInstance.CAR_STATUS]
+
+# URL name -> the role that requests it. Anything not listed is requested as an admin.
+URL_ROLES = {
+    'index': 'anonymous',
+    'async_index': 'anonymous',
+    'register': 'anonymous',
+    'feedback': 'customer',
+    'feedback_success': 'customer',
+    'customer_car_list': 'customer',
+    'customer_cars': 'customer',
+    'customer_dashboard': 'customer',
+    'async_customer_dashboard': 'customer',
+    'mechanics_dashboard': 'mechanic',
+}
+
+
+def seed_fleet(num_cars, seed=0, batch_size=5000):
+    """
+    Creates a fleet of ``num_cars`` cars plus owners, makes, users and feedback in proportion.
+
+    Rows go in with bulk_create in batches, so even the 1M fleet never sits in memory at once.
+    The same seed always gives the same data. Returns the sample objects run_benchmark needs.
+    """
+    rng = random.Random(seed)
+    num_owners = max(num_cars // 2, 10)
+    num_users = max(num_cars // 20, 10)
+    num_mechanics = max(num_users // 100, 2)
+    num_feedback = max(num_cars // 10, 10)
+
+    vehicle_types = VehicleType.objects.bulk_create([VehicleType(name=name) for name in _VEHICLE_TYPES])
+    makes = CarMake.objects.bulk_create([
+        CarMake(manuName=manu, carModel=model, vehicleType=rng.choice(vehicle_types))
+        for manu, models in _MAKES.items() for model in models
+    ])
+
+    # Users share one password hash, hashing per user would dominate the run
+    groups = {name: Group.objects.get_or_create(name=name)[0] for name in (roles.ADMIN, roles.MECHANICS, roles.CUSTOMER)}
+    password = make_password(BENCHMARK_PASSWORD)
+    for start in range(0, num_users, batch_size):
+        User.objects.bulk_create([
+            User(username=f'user{i}', password=password, email=f'user{i}@example.com', first_name=f'User{i}')
+            for i in range(start, min(start + batch_size, num_users))
+        ])
+    user_ids = list(User.objects.filter(username__startswith='user').order_by('id').values_list('id', flat=True))
+    admin_ids, mechanic_ids, customer_ids = user_ids[:2], user_ids[2:2 + num_mechanics], user_ids[2 + num_mechanics:]
+    memberships = []
+    for group, ids in ((groups[roles.ADMIN], admin_ids), (groups[roles.MECHANICS], mechanic_ids), (groups[roles.CUSTOMER], customer_ids)):
+        memberships.extend(User.groups.through(user_id=user_id, group_id=group.id) for user_id in ids)
+    User.groups.through.objects.bulk_create(memberships, batch_size=batch_size)
+
+    # The first owners belong to the customer accounts, the rest are walk-in owners
+    for start in range(0, num_owners, batch_size):
+        Owner.objects.bulk_create([
+            Owner(
+                user_id=customer_ids[i] if i < len(customer_ids) else None,
+                first_name=rng.choice(_FIRST_NAMES),
+                last_name=f'{rng.choice(_LAST_NAMES)}{i}',
+                phone_num=str(5550000000 + i),
+                address=f'{i} Main Street',
+                has_insurance=rng.random() < 0.8,
+            )
+            for i in range(start, min(start + batch_size, num_owners))
+        ])
+    owner_ids = list(Owner.objects.order_by('id').values_list('id', flat=True))
+
+    today = date.today()
+    for start in range(0, num_cars, batch_size):
+        cars = []
+        for i in range(start, min(start + batch_size, num_cars)):
+            due_back = today + timedelta(days=rng.randint(-60, 90)) if rng.random() < 0.9 else None
+            cars.append(CarInstance(
+                car=rng.choice(makes),
+                # Car 0 goes to the first customer so the customer pages have something to show
+                owner_id=owner_ids[0] if i == 0 else rng.choice(owner_ids),
+                vinNum=f'BENCH{i:012d}',
+                modelYear=str(rng.randint(1995, today.year)),
+                color=rng.choice(_COLORS),
+                license_plate=f'BM{i:07d}',
+                due_back=due_back,
+                mechanic_stat_id=rng.choice(mechanic_ids) if rng.random() < 0.7 else None,
+                status=rng.choice(_STATUSES),
+            ))
+        CarInstance.objects.bulk_create(cars)
+
+    for start in range(0, num_feedback, batch_size):
+        Feedback.objects.bulk_create([
+            Feedback(
+                user_id=rng.choice(customer_ids),
+                content=f'Benchmark feedback {i}',
+                category=rng.choice(_CATEGORIES),
+                resolved=rng.random() < 0.5,
+            )
+            for i in range(start, min(start + batch_size, num_feedback))
+        ])
+    return sample_objects()
+
+
+def sample_objects():
+    """Picks the users and rows the benchmark requests pages for, from an already seeded database."""
+    customer = User.objects.filter(groups__name=roles.CUSTOMER, owner__carinstance__isnull=False).order_by('id').first()
+    return {
+        'users': {
+            'admin': User.objects.filter(groups__name=roles.ADMIN).order_by('id').first(),
+            'mechanic': User.objects.filter(groups__name=roles.MECHANICS).order_by('id').first(),
+            'customer': customer,
+        },
+        'car': CarInstance.objects.filter(owner__user=customer).order_by('id').first(),
+        'owner': Owner.objects.filter(user=customer).first(),
+        'user': User.objects.filter(groups__name=roles.CUSTOMER).order_by('-id').first(),
+        'feedback': Feedback.objects.order_by('id').first(),
+    }
+
+
+def benchmark_urls(samples):
+    """Yields (url name, role, path) for every named URL in catalog/urls.py."""
+    # Path arguments by URL name for the generic <int:pk>, then by argument name for the rest
+    by_name = {
+        'car-detail': samples['car'].pk,
+        'owner-detail': samples['owner'].pk,
+        'edit_owner': samples['owner'].pk,
+    }
+    by_argument = {
+        'car_id': samples['car'].pk,
+        'user_id': samples['user'].pk,
+        'feedback_id': samples['feedback'].pk,
+        'kind': 'cars',
+        'resource_name': 'cars',
+    }
+    for pattern in catalog_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        kwargs = {}
+        for argument in pattern.pattern.converters:
+            kwargs[argument] = by_name[pattern.name] if argument == 'pk' else by_argument[argument]
+        yield pattern.name, URL_ROLES.get(pattern.name, 'admin'), reverse(pattern.name, kwargs=kwargs)
+
+
+def _fetch(client, path):
+    response = client.get(path)
+    if response.streaming:
+        b''.join(response.streaming_content)  # Exports only do their work as they're read
+    return response
+
+
+def run_benchmark(samples, repeat=5, progress=None):
+    """Requests every catalog URL ``repeat`` times and returns the measurements by URL name."""
+    # Errors come back as 500 responses and get recorded, rather than stopping the run
+    clients = {'anonymous': Client(raise_request_exception=False)}
+    for role, user in samples['users'].items():
+        clients[role] = Client(raise_request_exception=False)
+        clients[role].force_login(user)
+
+    results = {}
+    for name, role, path in benchmark_urls(samples):
+        client = clients[role]
+        _fetch(client, path)  # Warm up caches and the session before measuring
+
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = _fetch(client, path)
+                timings.append((time.perf_counter() - started) * 1000)
+            num_queries = len(queries)  # Read now, the next request clears the query log
+
+        # Memory is measured on its own request, tracemalloc slows everything down
+        tracemalloc.start()
+        try:
+            _fetch(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        budget = query_budget_for(resolve(path))
+        results[name] = {
+            'path': path,
+            'role': role,
+            'status': response.status_code,
+            'wall_ms_median': round(statistics.median(timings), 3),
+            'wall_ms_max': round(max(timings), 3),
+            'queries': num_queries,
+            'query_budget': budget,
+            'over_budget': budget is not None and num_queries > budget,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+# (name, sync URL name, async URL name, role)
+DASHBOARD_PAIRS = [
+    ('home', 'index', 'async_index', 'anonymous'),
+    ('admin_dashboard', 'admin_dashboard', 'async_admin_dashboard', 'admin'),
+    ('customer_dashboard', 'customer_dashboard', 'async_customer_dashboard', 'customer'),
+]
+
+
+def latency_summary(timings, elapsed):
+    """p50/p99/max latency in ms plus throughput for one load run."""
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentiles[49], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'max_ms': round(max(timings), 3),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+    }
+
+
+def _session_cookies(user):
+    # Log in once up front, every load client shares the session instead of writing its own
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    return client.cookies
+
+
+def wsgi_load(path, cookies, requests, concurrency):
+    """Requests ``path`` ``requests`` times from ``concurrency`` threads through the WSGI handler."""
+    local = threading.local()
+
+    def fetch(_):
+        if not hasattr(local, 'client'):
+            local.client = Client(raise_request_exception=False)
+            local.client.cookies = cookies
+        started = time.perf_counter()
+        response = local.client.get(path)
+        timing = (time.perf_counter() - started) * 1000
+        close_old_connections()  # What request_finished does for a real WSGI worker (the test client skips it)
+        return response.status_code, timing
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(fetch, range(requests)))
+    return outcomes, time.perf_counter() - started
+
+
+def asgi_load(path, cookies, requests, concurrency):
+    """Requests ``path`` ``requests`` times, ``concurrency`` at a time, through the ASGI handler."""
+    async def load():
+        client = AsyncClient(raise_request_exception=False)
+        client.cookies = cookies
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(path)
+                return response.status_code, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(fetch() for _ in range(requests)))
+        return outcomes, time.perf_counter() - started
+
+    return asyncio.run(load())
+
+
+def run_dashboard_load(samples, requests=200, concurrency=10, progress=None):
+    """
+    Runs every DASHBOARD_PAIRS page under WSGI (sync view) and ASGI (async view) load.
+
+    The wsgi and asgi runs have the page cache turned off, so every request runs the view's
+    queries, which is what the two handlers differ on. wsgi_cached and asgi_cached then run
+    the same pages from the page cache, for comparison.
+    """
+    results = {}
+    runs = (
+        ('wsgi', 'sync', wsgi_load, False), ('asgi', 'async', asgi_load, False),
+        ('wsgi_cached', 'sync', wsgi_load, True), ('asgi_cached', 'async', asgi_load, True),
+    )
+    for name, sync_name, async_name, role in DASHBOARD_PAIRS:
+        cookies = _session_cookies(samples['users'].get(role))
+        results[name] = {}
+        for mode, kind, load, page_cache in runs:
+            path = reverse(sync_name if kind == 'sync' else async_name)
+            with override_settings(CATALOG_PAGE_CACHE=page_cache):
+                load(path, cookies, concurrency, concurrency)  # Warm up
+                outcomes, elapsed = load(path, cookies, requests, concurrency)
+            result = latency_summary([timing for _, timing in outcomes], elapsed)
+            result['path'] = path
+            result['errors'] = sum(1 for status, _ in outcomes if status >= 400)
+            results[name][mode] = result
+            if progress:
+                progress(name, mode, result)
+    return results
+
+
+def _edit_form_data(car, status, due_back):
+    # What the browser posts back from edit_car.html, with a new status and due date
+    data = {name: value for name, value in CarInstanceForm(instance=car).initial.items() if value is not None}
+    data.update(status=status, due_back=due_back.isoformat())
+    return data
+
+
+def run_write_load(samples, requests=200, concurrency=10, seed=0):
+    """
+    Posts ``requests`` edit_car_instance forms from ``concurrency`` mechanics at once.
+
+    Each request edits a random car, so the writes contend for the database the way a busy
+    shop floor does. Returns latency percentiles, writes per second and the failed requests.
+    """
+    rng = random.Random(seed)
+    mechanic_ids = list(User.objects.filter(groups__name=roles.MECHANICS).order_by('id').values_list('id', flat=True))
+    mechanics = list(User.objects.filter(pk__in=mechanic_ids[:concurrency]))
+    mechanics = (mechanics * concurrency)[:concurrency]  # Fewer mechanics than threads share logins
+    car_ids = list(CarInstance.objects.filter(owner__isnull=False).order_by('id').values_list('id', flat=True)[:5000])
+    today = date.today()
+    jobs = []
+    for car in CarInstance.objects.filter(pk__in=rng.sample(car_ids, min(requests, len(car_ids)))):
+        jobs.append((
+            reverse('edit_car_instance', args=[car.pk]),
+            _edit_form_data(car, rng.choice(_STATUSES), today + timedelta(days=rng.randint(-10, 30))),
+        ))
+    jobs = (jobs * (requests // max(len(jobs), 1) + 1))[:requests]
+
+    cookies = [_session_cookies(mechanic) for mechanic in mechanics]
+    local = threading.local()
+    slots = iter(range(concurrency))
+    slot_lock = threading.Lock()
+
+    def submit(job):
+        if not hasattr(local, 'client'):
+            with slot_lock:
+                slot = next(slots)
+            local.client = Client(raise_request_exception=False)
+            local.client.cookies = cookies[slot]
+        path, data = job
+        started = time.perf_counter()
+        response = local.client.post(path, data)
+        timing = (time.perf_counter() - started) * 1000
+        close_old_connections()
+        return response.status_code, timing
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(submit, jobs))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [timing for status, timing in outcomes if status == 302]
+    result = latency_summary([timing for _, timing in outcomes], elapsed)
+    result['writes_per_second'] = round(len(succeeded) / elapsed, 1)
+    result['failed'] = len(outcomes) - len(succeeded)
+    return result
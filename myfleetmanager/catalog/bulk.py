@@ -0,0 +1,117 @@
+"""
+Set-based bulk changes, used by the admin actions and ``manage.py bulk_update_cars``.
+
+A selection is worked through in primary key ranges of BATCH_SIZE rows, and each range is
+written with one or two UPDATE / INSERT statements, however many rows it holds. Every range
+is its own transaction, so a huge selection doesn't hold the database's write lock the whole
+time, and ``progress(done, total)`` is called after each one.
+
+Queryset updates and bulk_create send no model signals, so the search index, fleet stats and
+page caches are brought up to date here once the rows are written, like import_fleet does.
+Status and mechanic changes are logged to the status history (catalog/history.py) in the
+same transaction as each range's UPDATE.
+"""
+
+# Django core imports
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+# Local application imports
+from .caching import bump_cache_version
+from .history import log_bulk_change
+from .models import CarInstance, Owner
+from .search import CAR_INDEX, OWNER_INDEX
+from .stats import rebuild_fleet_stats
+
+BATCH_SIZE = 2000
+
+# Car fields the fleet stats, status history and search index are built from
+_STAT_FIELDS = {'status', 'mechanic_stat', 'mechanic_stat_id', 'car', 'car_id'}
+_HISTORY_FIELDS = {'status', 'mechanic_stat', 'mechanic_stat_id'}
+_SEARCH_FIELDS = {'license_plate', 'vinNum', 'owner', 'owner_id', 'car', 'car_id'}
+
+
+def pk_ranges(queryset, batch_size=BATCH_SIZE):
+    """
+    Yields (first_pk, last_pk) ranges covering ``queryset`` in primary key order, batch_size rows each.
+
+    Each range is found with one keyset query, so the walk never slows down with depth and
+    the statements run on a range keep the same two parameters whatever its size.
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        page = pks if last is None else pks.filter(pk__gt=last)
+        ids = list(page[:batch_size])
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last = ids[-1]
+
+
+def update_cars(queryset, progress=None, batch_size=BATCH_SIZE, user=None, **changes):
+    """
+    Sets ``changes`` (e.g. status='M') on every car in ``queryset``, returns how many were updated.
+
+    Status and mechanic changes go in the status history first, tagged with ``user``.
+    """
+    total = queryset.count()
+    updated = 0
+    try:
+        for first, last in pk_ranges(queryset, batch_size):
+            with transaction.atomic():
+                in_range = queryset.filter(pk__gte=first, pk__lte=last)
+                if _HISTORY_FIELDS & changes.keys():
+                    log_bulk_change(in_range, user, **changes)
+                updated += in_range.update(**changes)
+                if _SEARCH_FIELDS & changes.keys():
+                    CAR_INDEX.refresh(CarInstance.objects.filter(pk__gte=first, pk__lte=last))
+            if progress:
+                progress(updated, total)
+    finally:
+        # Also after a failed batch, the ones before it are committed
+        if updated:
+            if _STAT_FIELDS & changes.keys():
+                rebuild_fleet_stats()
+            bump_cache_version('fleet')
+    return updated
+
+
+def sync_owners(users, progress=None, batch_size=BATCH_SIZE):
+    """
+    Gives every user in ``users`` an Owner named like them, returns (created, renamed).
+
+    Per range: one UPDATE renames the owners whose name no longer matches their user's, one
+    SELECT finds the users without an owner and one INSERT creates theirs.
+    """
+    total = users.count()
+    created = renamed = done = 0
+    user = User.objects.filter(pk=OuterRef('user_id'))
+    try:
+        for first, last in pk_ranges(users, batch_size):
+            batch = users.filter(pk__gte=first, pk__lte=last)
+            with transaction.atomic():
+                renamed += (
+                    Owner.objects.filter(user__in=batch)
+                    .exclude(first_name=F('user__first_name'), last_name=F('user__last_name'))
+                    .update(
+                        first_name=Subquery(user.values('first_name')[:1]),
+                        last_name=Subquery(user.values('last_name')[:1]),
+                    )
+                )
+                missing = batch.filter(owner__isnull=True).values_list('pk', 'first_name', 'last_name')
+                created += len(Owner.objects.bulk_create(
+                    Owner(user_id=pk, first_name=first_name, last_name=last_name, phone_num=None) for pk, first_name, last_name in missing
+                ))
+                OWNER_INDEX.refresh(Owner.objects.filter(user__in=batch))
+                CAR_INDEX.refresh(CarInstance.objects.filter(owner__user__in=batch))
+            done = min(done + batch_size, total)
+            if progress:
+                progress(done, total)
+    finally:
+        if created:
+            rebuild_fleet_stats()
+        if created or renamed:
+            bump_cache_version('fleet')
+    return created, renamed
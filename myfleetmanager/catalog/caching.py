@@ -0,0 +1,197 @@
+"""
+Cache helpers shared by the catalog views and context processors.
+
+Cached pages and template fragments are keyed on version numbers rather than deleted one
+by one. bump_cache_version('fleet') (called from the receivers in signals.py) moves every
+key that includes the fleet version on at once, and the stale entries just expire.
+
+    fleet     cars, owners, makes and vehicle types
+    footer    the footer content
+    accounts  users and their groups (names and roles show up in the page header)
+
+The versions and the footer live in the 'shared' cache (files by default, see CACHES in
+settings.py), so a bump in one worker, or in a manage.py command, reaches all the others.
+The pages themselves stay in each worker's own memory, a version move orphans them there.
+"""
+
+# Standard library imports
+import asyncio
+import time
+from functools import wraps
+
+# Django core imports
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.safestring import mark_safe
+
+# Local application imports
+from .models import FooterContent
+from .roles import get_roles
+from .visits import record_visit
+
+FOOTER_CACHE_KEY = 'catalog:footer_content'
+_NO_FOOTER = 'no-footer'  # Cached when the table is empty, so that case doesn't query every time either
+
+shared_cache = caches['shared']  # Seen by every process, see the module docstring
+
+
+def get_footer_content():
+    """Returns the single FooterContent row (or None), going to the database only on a cache miss."""
+    footer = shared_cache.get(FOOTER_CACHE_KEY)
+    if footer is None:
+        footer = FooterContent.objects.first() or _NO_FOOTER
+        shared_cache.set(FOOTER_CACHE_KEY, footer, None)  # Kept until a save or delete invalidates it
+    return None if footer == _NO_FOOTER else footer
+
+
+def invalidate_footer_content():
+    shared_cache.delete(FOOTER_CACHE_KEY)
+
+
+def _version_key(name):
+    return f'catalog:version:{name}'
+
+
+def cache_version(name):
+    """The current version of ``name``, see the module docstring."""
+    key = _version_key(name)
+    version = shared_cache.get(key)
+    if version is None:
+        # Start from the clock, not 1, so an evicted version can't bring back old entries
+        shared_cache.add(key, time.time_ns(), None)
+        version = shared_cache.get(key)
+    return version
+
+
+def bump_cache_version(name):
+    try:
+        shared_cache.incr(_version_key(name))  # Not atomic in files, but racing bumps still move it on
+    except ValueError:  # Not cached, the next read starts a new version anyway
+        pass
+
+
+def visit_count_text(num_visits):
+    """The visit counter sentence in the page footer."""
+    return f'You have visited this page {num_visits} time{"" if num_visits == 1 else "s"}.'
+
+
+# Stands in for the visit counter in cached pages, filled in per request when they're served
+VISIT_COUNT_MARKER = '<!--catalog:visit-count-->'
+
+
+def page_cache_key(request, page_name, versions):
+    """
+    The cache key for ``request``'s copy of a page, or None when it mustn't be cached.
+
+    Anonymous visitors share one copy per URL. Signed in users get their own copy (the
+    header shows their name and role links), tied to their CSRF cookie so the logout form's
+    token keeps matching. Without a CSRF cookie yet there's nothing safe to key on.
+    """
+    user = request.user
+    if user.is_authenticated:
+        csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        if not csrf_cookie:
+            return None
+        roles = '+'.join(sorted(get_roles(user))) or 'none'
+        scope = f'{roles}:{user.pk}:{csrf_cookie}'
+    else:
+        scope = 'anonymous'
+    stamp = ':'.join(str(cache_version(name)) for name in versions)
+    return f'catalog:page:{page_name}:{scope}:{stamp}:{request.get_full_path()}'
+
+
+def cached_page(versions=('fleet',), timeout=None):
+    """
+    Caches the whole rendered page per role and user, for GET requests that return a 200.
+
+    A cache hit doesn't run the view: it counts the visit under the page name the view
+    counted it under and fills the footer's visit counter in. The footer and accounts
+    versions are always part of the key, ``versions`` adds the ones the page's content
+    depends on. Works on async views too (async_views.py), the lookups that need the
+    database run in a thread.
+    """
+    versions = ('footer', 'accounts', *versions)
+
+    def decorator(view):
+        view_name = f'{view.__module__}.{view.__qualname__}'
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or not _page_cache_on():
+                    return await view(request, *args, **kwargs)
+                key = await sync_to_async(page_cache_key)(request, view_name, versions)
+                if key is None:
+                    return await view(request, *args, **kwargs)
+                cached = await sync_to_async(_cached_response)(request, key)
+                if cached is not None:
+                    return cached
+                request.caching_page = True  # Makes {% visit_count %} print the marker
+                response = await view(request, *args, **kwargs)
+                return _store_page(request, key, response, timeout)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not _page_cache_on():
+                return view(request, *args, **kwargs)
+            key = page_cache_key(request, view_name, versions)
+            if key is None:
+                return view(request, *args, **kwargs)
+            cached = _cached_response(request, key)
+            if cached is not None:
+                return cached
+            request.caching_page = True  # Makes {% visit_count %} print the marker
+            response = view(request, *args, **kwargs)
+            return _store_page(request, key, response, timeout)
+        return wrapper
+    return decorator
+
+
+def _page_cache_on():
+    # Read per request, so override_settings can turn it off
+    return getattr(settings, 'CATALOG_PAGE_CACHE', True)
+
+
+def _cached_response(request, key):
+    """The cached page with this visit counted, None on a miss."""
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    content, content_type, page_name = cached
+    user_id = request.user.pk if request.user.is_authenticated else None
+    response = HttpResponse(content, content_type=content_type)
+    return _fill_visit_count(response, record_visit(page_name, user_id))
+
+
+def _store_page(request, key, response, timeout):
+    """Caches a freshly rendered page if it can be, returns it with the visit counter filled in."""
+    num_visits = getattr(request, 'page_num_visits', None)
+    page_name = getattr(request, 'visit_page_name', None)
+    if response.status_code == 200 and not response.streaming and num_visits is not None:
+        # A token for a CSRF cookie that's only being set now would be wrong for the next request
+        new_csrf_cookie = request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and not request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        if page_name and not new_csrf_cookie:
+            timeout_seconds = timeout or getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 300)
+            cache.set(key, (response.content, response['Content-Type'], page_name), timeout_seconds)
+        response = _fill_visit_count(response, num_visits)
+    return response
+
+
+def _fill_visit_count(response, num_visits):
+    response.content = response.content.replace(
+        VISIT_COUNT_MARKER.encode(), visit_count_text(num_visits).encode(),
+    )
+    return response
+
+
+def visit_count(request, num_visits):
+    """What {% visit_count %} prints: the sentence, or the marker while a page is being cached."""
+    if num_visits in (None, ''):  # Pages that don't count visits
+        return ''
+    if getattr(request, 'caching_page', False):
+        request.page_num_visits = num_visits
+        return mark_safe(VISIT_COUNT_MARKER)
+    return visit_count_text(num_visits)
@@ -0,0 +1,111 @@
+"""
+System checks for the catalog app.
+
+The query plan check runs EXPLAIN on the hot car querysets from views.py and reports any
+that fall back to a full table scan. It touches the database, so Django only runs it when
+asked to:  python manage.py check --database default
+"""
+
+# Standard library imports
+import datetime
+import re
+
+# Django core imports
+from django.core import checks
+from django.db import connections
+from django.db.models import Count, F, Q
+
+# Local application imports
+from . import analytics
+from .models import CarInstance
+
+# SQLite prints "SCAN table" (no index) for a full scan, PostgreSQL prints "Seq Scan on table"
+_FULL_SCAN_PATTERNS = (
+    re.compile(r'\bSCAN (?:TABLE )?"?(?P<table>\w+)"?(?: AS \w+)?\s*$', re.MULTILINE),
+    re.compile(r'\bSeq Scan on "?(?P<table>\w+)"?'),
+)
+
+
+def hot_car_querysets():
+    """The car querysets the list, filter and lookup views run, as (label, queryset) pairs."""
+    some_day = datetime.date(2024, 1, 1)
+    after_cursor = Q(due_back__gt=some_day) | Q(due_back=some_day, id__gt=1)
+    dated = CarInstance.objects.for_list().filter(due_back__isnull=False)
+    return [
+        ('car list first page', dated.order_by('due_back', 'id')[:51]),
+        ('car list deep page', dated.filter(after_cursor).order_by('due_back', 'id')[:51]),
+        ('car list undated section', CarInstance.objects.for_list().filter(due_back__isnull=True).order_by('id')[:51]),
+        ('car list by status', dated.filtered(status='M').filter(after_cursor).order_by('due_back', 'id')[:51]),
+        ('car list by owner', dated.filtered(owner=1).filter(after_cursor).order_by('due_back', 'id')[:51]),
+        ('car list by mechanic', dated.filtered(mechanic=1).filter(after_cursor).order_by('due_back', 'id')[:51]),
+        ('overdue queue', dated.overdue(some_day).filter(after_cursor).order_by('due_back', 'id')[:51]),
+        ('customer car list', CarInstance.objects.filter(owner__user_id=1)),
+        ('mechanic work queue', CarInstance.objects.assigned_to(1).filter(status='M').select_related('car', 'owner')
+            .order_by(F('due_back').asc(nulls_last=True), 'id')[:25]),
+        ('mechanic status counts', CarInstance.objects.assigned_to(1).order_by().values_list('status').annotate(total=Count('id'))),
+        ('due back reminder batch', CarInstance.objects.filter(due_back__lte=some_day, owner__user_id__isnull=False)
+            .exclude(owner__user__email='').filter(Q(due_back__gt=some_day) | Q(id__gt=1), due_back__gte=some_day)
+            .order_by('due_back', 'id').values_list('due_back', 'id')[4999:5000]),
+        ('analytics by status', analytics.grouped('status')),
+        ('analytics by make', analytics.grouped('car_id')),
+        ('analytics by model year', analytics.grouped('modelYear')),
+        ('analytics by mechanic', analytics.grouped('mechanic_stat_id')),
+        ('analytics changes per day', analytics.changes_per_day(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))),
+        ('license plate lookup', CarInstance.objects.filter(license_plate='ABC1234')),
+        ('VIN lookup', CarInstance.objects.filter(vinNum='1HGCM82633A004352')),
+    ]
+
+
+def full_scans(plan):
+    """Returns the table names the query plan scans end to end."""
+    tables = []
+    for pattern in _FULL_SCAN_PATTERNS:
+        tables.extend(match.group('table') for match in pattern.finditer(plan))
+    return tables
+
+
+def missing_indexes(connection):
+    """Names of the CarInstance indexes and constraints that aren't in the database yet."""
+    meta = CarInstance._meta
+    expected = [index.name for index in meta.indexes] + [constraint.name for constraint in meta.constraints]
+    with connection.cursor() as cursor:
+        if meta.db_table not in connection.introspection.table_names(cursor):
+            return expected
+        existing = connection.introspection.get_constraints(cursor, meta.db_table)
+    return [name for name in expected if name not in existing]
+
+
+@checks.register(checks.Tags.database)
+def check_car_query_plans(app_configs=None, databases=None, **kwargs):
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            continue  # We only know how to read these two planners' output
+        missing = missing_indexes(connection)
+        if missing:
+            # migrate runs database checks too, so don't block the migration that adds them
+            errors.append(checks.Warning(
+                f'CarInstance indexes not created yet: {", ".join(missing)}. Skipping the query plan check.',
+                hint='Run "python manage.py makemigrations catalog" and "migrate".',
+                obj=CarInstance,
+                id='catalog.W002',
+            ))
+            continue
+        for label, queryset in hot_car_querysets():
+            try:
+                plan = queryset.using(alias).explain()
+            except Exception as exc:  # e.g. the tables haven't been migrated yet
+                errors.append(checks.Warning(
+                    f'Could not EXPLAIN the {label} query: {exc}',
+                    id='catalog.W001',
+                ))
+                continue
+            for table in full_scans(plan):
+                errors.append(checks.Error(
+                    f'The {label} query does a full table scan of {table}.',
+                    hint='Check the CarInstance indexes in models.py still match how views.py filters and orders cars.',
+                    obj=CarInstance,
+                    id='catalog.E001',
+                ))
+    return errors
@@ -1,12 +1,38 @@
 # context_processors.py
 
-from .models import FooterContent
+from django.utils.functional import SimpleLazyObject
+
+from .caching import cache_version, get_footer_content
+from .roles import get_roles
 
 def footer_content(request):
-    try:
-        footer_content = FooterContent.objects.first()  # Get the first (and only) footer content
-    except FooterContent.DoesNotExist:
-        footer_content = None  # Handle the case where no FooterContent exists
+    # Lazy, so pages that never print the footer never look it up, and cached between requests
+    return {
+        'footer_content': SimpleLazyObject(get_footer_content)
+    }
+
+def user_roles(request):
+    # Shares the per-request role lookup with the templates (used by the navbar and sidebar)
+    return {
+        'user_roles': get_roles(getattr(request, 'user', None))
+    }
+
+class CacheVersions:
+    """
+    Looks cache versions up as the template asks for them, e.g. {% cache 600 row car.pk cache_versions.fleet %}.
+    Each one is read from the shared cache once per request, however many rows ask.
+    """
+
+    def __init__(self):
+        self.versions = {}
+
+    def __getitem__(self, name):
+        if name not in self.versions:
+            self.versions[name] = cache_version(name)
+        return self.versions[name]
+
+def cache_versions(request):
+    # Lets {% cache %} fragments vary on the versions signals.py bumps
     return {
-        'footer_content': footer_content
-    }
\ No newline at end of file
+        'cache_versions': CacheVersions()
+    }
@@ -0,0 +1,91 @@
+"""Row generators for the streaming CSV/JSONL exports."""
+
+# Standard library imports
+import csv
+import json
+
+# Django core imports
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Local application imports
+from .models import CarInstance, Owner, Feedback
+
+# Column name -> ORM lookup. The car and owner columns match what import_fleet reads,
+# so an export can be loaded straight back in.
+EXPORTS = {
+    'cars': (CarInstance, {
+        'id': 'id',
+        'license_plate': 'license_plate',
+        'vinNum': 'vinNum',
+        'modelYear': 'modelYear',
+        'color': 'color',
+        'status': 'status',
+        'due_back': 'due_back',
+        'manuName': 'car__manuName',
+        'carModel': 'car__carModel',
+        'owner_first_name': 'owner__first_name',
+        'owner_last_name': 'owner__last_name',
+        'owner_phone_num': 'owner__phone_num',
+        'mechanic': 'mechanic_stat__username',
+    }),
+    'owners': (Owner, {
+        'id': 'id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'phone_num': 'phone_num',
+        'address': 'address',
+        'has_insurance': 'has_insurance',
+        'insurance_provider': 'insurance_provider',
+        'insurance_policy_number': 'insurance_policy_number',
+        'username': 'user__username',
+    }),
+    'feedback': (Feedback, {
+        'id': 'id',
+        'username': 'user__username',
+        'category': 'category',
+        'content': 'content',
+        'created_at': 'created_at',
+        'resolved': 'resolved',
+    }),
+}
+
+CHUNK_SIZE = 2000  # Rows fetched per round trip (a server-side cursor on PostgreSQL)
+LINES_PER_WRITE = 500  # Lines joined into each piece of the response
+
+
+class Echo:
+    """A file-like object for csv.writer that hands back what it's given instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(kind):
+    """Streams (columns, row tuples) for an export, ordered by primary key so no sort is needed."""
+    model, columns = EXPORTS[kind]
+    queryset = model.objects.order_by('pk').values_list(*columns.values())
+    return list(columns), queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_csv(kind):
+    columns, rows = export_rows(kind)
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)  # The header goes out before the first query runs
+    yield from _batched(writer.writerow(row) for row in rows)
+
+
+def stream_jsonl(kind):
+    columns, rows = export_rows(kind)
+    yield ''  # Starts the response before the first query runs
+    yield from _batched(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n' for row in rows)
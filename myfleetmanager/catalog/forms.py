@@ -4,7 +4,11 @@ import datetime  # for checking renewal date range.
 from django.contrib.auth.models import User, Group
 
 from django import forms
-from .models import Owner, FooterContent, Feedback, CarInstance
+from django.db import transaction
+from .models import Owner, FooterContent, Feedback, CarInstance, CarMake
+from .owners import save_user_and_owner
+from . import vin
+from .roles import invalidate_roles
 
 
 #Classes go here
@@ -27,21 +31,27 @@ class UserManagementForm(forms.ModelForm):
 
     class Meta:
         model = User
-        fields = ['username', 'email', 'password', 'groups']  # Include groups in the fields
+        fields = ['username', 'email', 'password', 'first_name', 'last_name', 'groups']  # Include groups in the fields
 
     def save(self, commit=True):
         user = super().save(commit=False)
         # Check if the password field is not empty
         if self.cleaned_data['password']:
             user.set_password(self.cleaned_data['password'])  # Only set if a new password is provided
+        elif user._state.adding:
+            user.set_unusable_password()  # Never store the blank form value as the password
+        else:
+            user.password = self.initial.get('password', user.password)  # Keep the current one
         if commit:
-            user.save()
-        # Assign the user to the selected group(s)
-        # Ensure we pass a list to the set() method
-            if self.cleaned_data['groups']:
-                user.groups.set([self.cleaned_data['groups']])  # Wrap in a list
-            else:
-                user.groups.clear()  # Clear groups if none selected
+            with transaction.atomic():
+                save_user_and_owner(user)  # Creates or renames the user's owner in the same transaction
+                # Assign the user to the selected group(s)
+                # Ensure we pass a list to the set() method
+                if self.cleaned_data['groups']:
+                    user.groups.set([self.cleaned_data['groups']])  # Wrap in a list
+                else:
+                    user.groups.clear()  # Clear groups if none selected
+            invalidate_roles(user)  # The remembered roles are stale now
         return user
 
 class OwnerForm(forms.ModelForm):
@@ -76,6 +86,50 @@ class CarInstanceForm(forms.ModelForm):
             'modelYear': forms.TextInput(attrs={'placeholder': 'e.g., 2020'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Left blank, the model year (and the make, when the VIN's manufacturer has only one) come from the VIN
+        self.fields['modelYear'].required = False
+        self.fields['car'].required = False
+        if not self.is_bound and self.instance.vinNum:
+            info = vin.decode(self.instance.vinNum)
+            if info.valid:
+                if not self.instance.modelYear and info.model_year:
+                    self.initial['modelYear'] = str(info.model_year)
+                if not self.instance.car_id:
+                    self.initial['car'] = make_for_manufacturer(info.manufacturer)
+
+    def clean_vinNum(self):
+        value = vin.normalize(self.cleaned_data.get('vinNum')) or None
+        # A car saved before VINs were checked can still be edited without retyping its VIN
+        if value and value != vin.normalize(self.instance.vinNum):
+            info = vin.decode(value)
+            if not info.valid:
+                raise forms.ValidationError(list(info.errors))
+        return value
+
+    def clean(self):
+        cleaned_data = super().clean()
+        info = vin.decode(cleaned_data['vinNum']) if cleaned_data.get('vinNum') else None
+        if not cleaned_data.get('modelYear'):
+            if info and info.model_year:
+                cleaned_data['modelYear'] = str(info.model_year)
+            else:
+                self.add_error('modelYear', 'Enter the model year, or a VIN it can be read from.')
+        if not cleaned_data.get('car'):
+            cleaned_data['car'] = make_for_manufacturer(info.manufacturer) if info else None
+            if cleaned_data['car'] is None:
+                self.add_error('car', 'Pick the make, the VIN doesn\'t tell us which one it is.')
+        return cleaned_data
+
+
+def make_for_manufacturer(manufacturer):
+    """The CarMake for a manufacturer name from the VIN, if there's exactly one (a single query)."""
+    if not manufacturer:
+        return None
+    makes = list(CarMake.objects.filter(manuName__iexact=manufacturer)[:2])
+    return makes[0] if len(makes) == 1 else None
+
 
 # Related to the page 
 class FooterContentForm(forms.ModelForm):
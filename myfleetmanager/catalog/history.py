@@ -0,0 +1,233 @@
+"""
+Status history: an append-only log of changes to a car's status and mechanic.
+
+Every CarInstance save that really changes status or mechanic_stat adds a CarStatusChange
+per changed field, re-saving a car with the same values adds nothing. The old values come
+from the saved row signals.py already reads before each save for the fleet stats, so the
+log costs no extra reads. Adding a car logs its first status (old_value NULL).
+
+Changes are only logged once their transaction commits. During a request they're held by
+StatusHistoryMiddleware and written with one INSERT when the view is done, however many
+cars it saved. Outside a request (shell, commands) they're written straight away. The bulk
+updates in catalog/bulk.py log theirs with one INSERT ... SELECT per range.
+
+Two indexes keep the reports off a full scan of the log:
+
+    status_change_entered_idx  (field, new_value, changed_at)  entered(): cars that went into M between X and Y
+    status_change_car_idx      (car, field, changed_at)        time_in_status(), and the "next change" lookup
+                                                               turnaround() does per car
+"""
+
+# Standard library imports
+import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Django core imports
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import CharField, DateTimeField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+# Local application imports
+from .models import CarInstance, CarStatusChange
+
+STATUS = CarStatusChange.STATUS
+MECHANIC = CarStatusChange.MECHANIC
+
+# Logged field -> the CarInstance attribute holding its value
+TRACKED = {STATUS: 'status', MECHANIC: 'mechanic_stat_id'}
+
+# (changes waiting to be written, who is making them) while collect_changes() is active
+_pending = ContextVar('catalog_status_changes', default=None)
+
+
+def _value(value):
+    return '' if value is None else str(value)
+
+
+def stored_values(row):
+    """{field: value} from a saved car row (a dict with status and mechanic_stat_id), None for a new car."""
+    if row is None:
+        return None
+    return {field: _value(row[attr]) for field, attr in TRACKED.items()}
+
+
+@contextmanager
+def collect_changes(user=None, write=True):
+    """
+    Holds the changes logged inside the block and writes them with one INSERT at the end,
+    tagged with ``user``. With write=False they're left in the yielded list for the caller
+    to pass to write_changes() (async code, which can't query from the event loop).
+    """
+    pending = []
+    token = _pending.set((pending, user))
+    try:
+        yield pending
+    finally:
+        _pending.reset(token)
+        if pending and write:
+            write_changes(pending)
+
+
+def write_changes(changes):
+    CarStatusChange.objects.bulk_create(changes)
+
+
+def record_changes(car, before):
+    """
+    Logs the fields that differ between ``before`` (stored_values() of the row as it was)
+    and ``car`` as just saved. Called from post_save.
+    """
+    collecting = _pending.get()
+    user = collecting[1] if collecting else None
+    changed_by = user if user is not None and user.is_authenticated else None
+    now = timezone.now()
+    changes = []
+    for field, attr in TRACKED.items():
+        old = None if before is None else before[field]
+        new = _value(getattr(car, attr))
+        if old != new:
+            changes.append(CarStatusChange(car_id=car.pk, field=field, old_value=old, new_value=new, changed_at=now, changed_by=changed_by))
+    if changes:
+        # A rolled back save never happened, so it isn't logged
+        transaction.on_commit(lambda: _write(changes))
+
+
+def _write(changes):
+    collecting = _pending.get()
+    if collecting is None:
+        CarStatusChange.objects.bulk_create(changes)
+    else:
+        collecting[0].extend(changes)
+
+
+def forget_car(car_id):
+    """Drops a deleted car's unwritten changes, its logged ones go with it (CASCADE)."""
+    collecting = _pending.get()
+    if collecting:
+        collecting[0][:] = [change for change in collecting[0] if change.car_id != car_id]
+
+
+def log_bulk_change(cars, user=None, **changes):
+    """
+    Logs ``changes`` (status=..., mechanic_stat=...) about to be applied to ``cars`` with one
+    INSERT ... SELECT per field. Only cars whose value differs are logged. Call it in the
+    same transaction as the update, before it. Returns how many changes were logged.
+    """
+    logged = 0
+    now = Value(timezone.now(), output_field=DateTimeField())
+    changed_by = Value(user.pk if user is not None and user.is_authenticated else None, output_field=IntegerField())
+    for field, attr in TRACKED.items():
+        name = attr.removesuffix('_id')
+        if name in changes or attr in changes:
+            new = changes.get(name, changes.get(attr))
+            new = _value(getattr(new, 'pk', new))
+            old = Coalesce(Cast(attr, CharField()), Value(''))
+            # Columns before expressions, that's the order Django puts them in the SELECT
+            rows = (
+                cars.order_by()
+                .annotate(old=old)
+                .exclude(old=new)
+                .values_list('id', 'old', Value(field, output_field=CharField()), Value(new, output_field=CharField()), now, changed_by)
+            )
+            select_sql, params = rows.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {CarStatusChange._meta.db_table} '
+                    f'(car_id, old_value, field, new_value, changed_at, changed_by_id) {select_sql}',
+                    params,
+                )
+                logged += cursor.rowcount
+    return logged
+
+
+def entered(value, start, end, field=STATUS):
+    """Changes that moved a car into ``value`` (e.g. 'M') with start <= changed_at < end, on status_change_entered_idx."""
+    return CarStatusChange.objects.filter(field=field, new_value=value, changed_at__gte=start, changed_at__lt=end)
+
+
+def with_left_at(changes):
+    """Annotates each change with left_at, when the same car's same field next changed (None if it hasn't yet)."""
+    following = CarStatusChange.objects.filter(
+        # The plain changed_at bound lets status_change_car_idx seek straight there, the OR breaks ties
+        Q(changed_at__gt=OuterRef('changed_at')) | Q(pk__gt=OuterRef('pk')),
+        car=OuterRef('car'), field=OuterRef('field'), changed_at__gte=OuterRef('changed_at'),
+    ).order_by('changed_at', 'pk')
+    return changes.annotate(left_at=Subquery(following.values('changed_at')[:1]))
+
+
+def turnaround(value, start, end, field=STATUS, now=None):
+    """
+    How long the cars that entered ``value`` between start and end stayed in it. Returns a dict:
+
+        entered   changes into ``value`` in the window (a car entering twice counts twice)
+        left      how many of those have moved on since
+        average   average time in ``value`` of the ones that left, None if none did
+        longest   the longest time in ``value`` so far, counting the ones still in it up to now
+    """
+    now = now or timezone.now()
+    entered_count = left = 0
+    total = longest = datetime.timedelta()
+    rows = with_left_at(entered(value, start, end, field)).values_list('changed_at', 'left_at')
+    for changed_at, left_at in rows.iterator():
+        entered_count += 1
+        if left_at is not None:
+            left += 1
+            total += left_at - changed_at
+        longest = max(longest, (left_at or now) - changed_at)
+    return {
+        'entered': entered_count,
+        'left': left,
+        'average': total / left if left else None,
+        'longest': longest if entered_count else None,
+    }
+
+
+def time_in_status(car, start=None, end=None, field=STATUS):
+    """
+    {value: timedelta} the car spent in each status (or with each mechanic) between start
+    and end, as far as the log goes. end defaults to now, start to the first logged change.
+    """
+    end = end or timezone.now()
+    changes = CarStatusChange.objects.filter(car=car, field=field, changed_at__lt=end).order_by('changed_at', 'pk')
+    current, since = None, start
+    if start is not None:
+        # What it was at the start is what the last change before the start set it to
+        current = changes.filter(changed_at__lt=start).reverse().values_list('new_value', flat=True).first()
+        changes = changes.filter(changed_at__gte=start)
+    totals = defaultdict(datetime.timedelta)
+    for changed_at, old, new in changes.values_list('changed_at', 'old_value', 'new_value'):
+        # The old value is what the car had up to this change, NULL if it didn't exist yet
+        if since is not None and old is not None:
+            totals[old] += changed_at - since
+        current, since = new, changed_at
+    if current is not None and since is not None:
+        totals[current] += end - since
+    return dict(totals)
+
+
+def car_history(car, limit=50):
+    """
+    The car's latest changes, newest first. Each gets old_display and new_display, with status
+    codes and mechanic ids turned into names (one query for the mechanics).
+    """
+    changes = list(car.status_changes.select_related('changed_by').order_by('-changed_at', '-pk')[:limit])
+    mechanic_ids = {int(value) for change in changes if change.field == MECHANIC for value in (change.old_value, change.new_value) if value}
+    names = {STATUS: dict(CarInstance.CAR_STATUS), MECHANIC: {}}
+    if mechanic_ids:
+        names[MECHANIC] = {str(pk): str(user) for pk, user in User.objects.in_bulk(mechanic_ids).items()}
+    for change in changes:
+        change.old_display = _display(names[change.field], change.old_value, change.field)
+        change.new_display = _display(names[change.field], change.new_value, change.field)
+    return changes
+
+
+def _display(names, value, field):
+    if value is None:
+        return 'added'
+    if value == '':
+        return 'No mechanic' if field == MECHANIC else 'None'
+    return names.get(value, value)  # e.g. a deleted mechanic, shown by id
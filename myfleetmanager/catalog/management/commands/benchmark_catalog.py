@@ -0,0 +1,92 @@
+"""
+Benchmarks every catalog view against a synthetic fleet and writes the results as JSON.
+
+    python manage.py benchmark_catalog --scale 1k --output bench-1k.json
+    python manage.py benchmark_catalog --scale 100k --keepdb --output bench-100k.json
+
+The data goes into a throwaway test database (never the real one). With --keepdb the seeded
+test database is kept between runs, which saves re-seeding the big fleets. Run the same
+scale and seed on two versions and diff the JSON files to spot regressions.
+"""
+
+# Standard library imports
+import json
+import logging
+import platform
+from datetime import datetime, timezone
+
+# Django core imports
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+# Local application imports
+from catalog.benchmark import SCALES, seed_fleet, sample_objects, run_benchmark
+from catalog.models import CarInstance
+
+
+class Command(BaseCommand):
+    help = 'Seeds a synthetic fleet in a test database and benchmarks every catalog URL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='1k', help=f'Number of cars: {", ".join(SCALES)} or a plain number (default 1k).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated fleet (default 0).')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per URL (default 5).')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON results (default benchmark.json).')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded test database for the next run.')
+
+    def handle(self, *args, **options):
+        scale = options['scale'].lower()
+        if scale in SCALES:
+            num_cars = SCALES[scale]
+        elif scale.isdigit():
+            num_cars = int(scale)
+        else:
+            raise CommandError(f'Unknown scale "{options["scale"]}".')
+
+        setup_test_environment(debug=False)  # Also keeps seeding out of the query log
+        # 500s and budget overruns are reported in the results instead
+        logging.getLogger('django.request').disabled = True
+        logging.getLogger('catalog.performance').disabled = True
+        runner = DiscoverRunner(verbosity=0, keepdb=options['keepdb'])
+        old_config = runner.setup_databases()
+        try:
+            if CarInstance.objects.count() == num_cars:
+                self.stdout.write('Reusing the seeded fleet from the kept test database.')
+                samples = sample_objects()
+            else:
+                if CarInstance.objects.exists():
+                    raise CommandError('The kept test database holds a different fleet, run once without --keepdb to reset it.')
+                self.stdout.write(f'Seeding {num_cars} cars (seed {options["seed"]})...')
+                samples = seed_fleet(num_cars, seed=options['seed'])
+
+            results = run_benchmark(samples, repeat=options['repeat'], progress=self.report)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'scale': scale,
+                'cars': num_cars,
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def report(self, name, result):
+        line = f'{name:<24} {result["status"]}  {result["wall_ms_median"]:>9.1f} ms  {result["queries"]:>4} queries  {result["peak_memory_kb"]:>9.1f} KB'
+        if result['over_budget']:
+            line += f'  (over its budget of {result["query_budget"]})'
+        self.stdout.write(self.style.ERROR(line) if result['status'] >= 500 or result['over_budget'] else line)
@@ -0,0 +1,102 @@
+"""
+Compares dashboard latency under concurrent load: sync views over WSGI against the async
+views over ASGI.
+
+    python manage.py benchmark_dashboards --scale 100k --requests 500 --concurrency 20
+
+Like benchmark_catalog, the fleet is seeded into a throwaway test database. Each dashboard
+is requested through Django's WSGI handler from a thread pool, then through the ASGI handler
+from one event loop, with the same number of requests in flight, first with the page cache
+off (wsgi, asgi) and then served from it (wsgi_cached, asgi_cached). p50/p99 latency and
+throughput go to the JSON output.
+"""
+
+# Standard library imports
+import json
+import logging
+import platform
+from datetime import datetime, timezone
+
+# Django core imports
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+# Local application imports
+from catalog.benchmark import SCALES, seed_fleet, sample_objects, run_dashboard_load
+from catalog.models import CarInstance
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the sync (WSGI) and async (ASGI) dashboards under concurrent load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='1k', help=f'Number of cars: {", ".join(SCALES)} or a plain number (default 1k).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated fleet (default 0).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per dashboard and handler (default 200).')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once (default 10).')
+        parser.add_argument('--output', default='benchmark-dashboards.json', help='Where to write the JSON results (default benchmark-dashboards.json).')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded test database for the next run.')
+
+    def handle(self, *args, **options):
+        scale = options['scale'].lower()
+        if scale in SCALES:
+            num_cars = SCALES[scale]
+        elif scale.isdigit():
+            num_cars = int(scale)
+        else:
+            raise CommandError(f'Unknown scale "{options["scale"]}".')
+        if options['requests'] < 2 or options['concurrency'] < 1:
+            raise CommandError('--requests must be at least 2 and --concurrency at least 1.')
+
+        setup_test_environment(debug=False)
+        logging.getLogger('django.request').disabled = True
+        logging.getLogger('catalog.performance').disabled = True
+        runner = DiscoverRunner(verbosity=0, keepdb=options['keepdb'])
+        old_config = runner.setup_databases()
+        try:
+            if CarInstance.objects.count() == num_cars:
+                self.stdout.write('Reusing the seeded fleet from the kept test database.')
+                samples = sample_objects()
+            else:
+                if CarInstance.objects.exists():
+                    raise CommandError('The kept test database holds a different fleet, run once without --keepdb to reset it.')
+                self.stdout.write(f'Seeding {num_cars} cars (seed {options["seed"]})...')
+                samples = seed_fleet(num_cars, seed=options['seed'])
+
+            results = run_dashboard_load(
+                samples, requests=options['requests'], concurrency=options['concurrency'], progress=self.report,
+            )
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'scale': scale,
+                'cars': num_cars,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def report(self, name, mode, result):
+        line = (
+            f'{name:<20} {mode:<11}  p50 {result["p50_ms"]:>8.1f} ms  p99 {result["p99_ms"]:>8.1f} ms  '
+            f'{result["requests_per_second"]:>7.1f} req/s'
+        )
+        if result['errors']:
+            line += f'  ({result["errors"]} errors)'
+        self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
@@ -0,0 +1,108 @@
+"""
+Measures write throughput with mechanics submitting edit_car_instance forms concurrently,
+under whichever database profile FLEET_DB_PROFILE selects (see settings.py).
+
+    FLEET_DB_PROFILE=sqlite python manage.py benchmark_writes --concurrency 16
+    FLEET_DB_PROFILE=sqlite-wal python manage.py benchmark_writes --concurrency 16
+
+The fleet is seeded into a throwaway test database. For SQLite that's a real file next to
+the project database rather than the usual in-memory one, since locking, journaling and
+fsyncs are what's being measured.
+"""
+
+# Standard library imports
+import json
+import logging
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Django core imports
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+# Local application imports
+from catalog.benchmark import SCALES, seed_fleet, run_write_load
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent car edits against the current database profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='1k', help=f'Number of cars: {", ".join(SCALES)} or a plain number (default 1k).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated fleet and edits (default 0).')
+        parser.add_argument('--requests', type=int, default=300, help='Edits to submit (default 300).')
+        parser.add_argument('--concurrency', type=int, default=8, help='Edits in flight at once (default 8).')
+        parser.add_argument('--output', default='benchmark-writes.json', help='Where to write the JSON results (default benchmark-writes.json).')
+
+    def handle(self, *args, **options):
+        scale = options['scale'].lower()
+        if scale in SCALES:
+            num_cars = SCALES[scale]
+        elif scale.isdigit():
+            num_cars = int(scale)
+        else:
+            raise CommandError(f'Unknown scale "{options["scale"]}".')
+        if options['requests'] < 2 or options['concurrency'] < 1:
+            raise CommandError('--requests must be at least 2 and --concurrency at least 1.')
+
+        test_file = None
+        if connection.vendor == 'sqlite':
+            # In-memory test databases don't lock or journal like the real file does
+            test_file = settings.BASE_DIR / 'benchmark-writes.sqlite3'
+            connection.settings_dict['TEST']['NAME'] = str(test_file)
+
+        setup_test_environment(debug=False)
+        logging.getLogger('django.request').disabled = True
+        logging.getLogger('catalog.performance').disabled = True
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            self.stdout.write(f'Seeding {num_cars} cars (seed {options["seed"]})...')
+            samples = seed_fleet(num_cars, seed=options['seed'])
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    journal_mode = cursor.fetchone()[0]
+            else:
+                journal_mode = None
+            self.stdout.write(f'Submitting {options["requests"]} edits, {options["concurrency"]} at a time...')
+            result = run_write_load(
+                samples, requests=options['requests'], concurrency=options['concurrency'], seed=options['seed'],
+            )
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+            if test_file:
+                # The worker threads' connections outlive the file, so SQLite leaves these behind
+                for leftover in (Path(f'{test_file}-wal'), Path(f'{test_file}-shm')):
+                    leftover.unlink(missing_ok=True)
+
+        report = {
+            'meta': {
+                'profile': settings.FLEET_DB_PROFILE,
+                'database': connection.vendor,
+                'journal_mode': journal_mode,
+                'cars': num_cars,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'result': result,
+        }
+        with open(options['output'], 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+
+        line = (
+            f'{settings.FLEET_DB_PROFILE}: {result["writes_per_second"]} writes/s, '
+            f'p50 {result["p50_ms"]} ms, p99 {result["p99_ms"]} ms, {result["failed"]} failed'
+        )
+        self.stdout.write(self.style.ERROR(line) if result['failed'] else self.style.SUCCESS(line))
@@ -0,0 +1,66 @@
+"""
+Changes the status, due back date or mechanic of many cars at once, with progress output.
+
+    python manage.py bulk_update_cars --status M --set-status A
+    python manage.py bulk_update_cars --mechanic 12 --set-mechanic none
+    python manage.py bulk_update_cars --owner 40 --set-due-back 2025-06-30
+
+Does what the car admin's bulk actions do (see catalog/bulk.py), for selections too big to
+wait on in a browser. The filters are the ones the car list uses and can be combined.
+"""
+
+# Standard library imports
+import datetime
+import time
+
+# Django core imports
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+# Local application imports
+from catalog import bulk
+from catalog.models import CarInstance
+
+
+class Command(BaseCommand):
+    help = 'Sets the status, due back date or mechanic of every car matching the filters, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=dict(CarInstance.CAR_STATUS), help='Only cars with this status.')
+        parser.add_argument('--owner', type=int, help='Only cars of this owner id.')
+        parser.add_argument('--mechanic', type=int, help='Only cars assigned to this mechanic user id.')
+        parser.add_argument('--set-status', choices=dict(CarInstance.CAR_STATUS))
+        parser.add_argument('--set-due-back', type=datetime.date.fromisoformat, help='YYYY-MM-DD')
+        parser.add_argument('--set-mechanic', help='A mechanic user id, or "none" to unassign.')
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE, help=f'Cars per UPDATE (default {bulk.BATCH_SIZE}).')
+
+    def handle(self, *args, **options):
+        changes = {}
+        if options['set_status']:
+            changes['status'] = options['set_status']
+        if options['set_due_back']:
+            changes['due_back'] = options['set_due_back']
+        if options['set_mechanic']:
+            changes['mechanic_stat'] = self.mechanic(options['set_mechanic'])
+        if not changes:
+            raise CommandError('Nothing to change, pass --set-status, --set-due-back or --set-mechanic.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        cars = CarInstance.objects.filtered(status=options['status'], owner=options['owner'], mechanic=options['mechanic'])
+        started = time.perf_counter()
+
+        def progress(done, total):
+            if options['verbosity'] > 0:
+                self.stdout.write(f'{done} of {total} cars updated ({time.perf_counter() - started:.1f}s)')
+
+        updated = bulk.update_cars(cars, progress=progress, batch_size=options['batch_size'], **changes)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} cars in {time.perf_counter() - started:.1f}s.'))
+
+    def mechanic(self, value):
+        if value.lower() == 'none':
+            return None
+        try:
+            return User.objects.get(pk=int(value))
+        except (ValueError, User.DoesNotExist):
+            raise CommandError(f'No user with id {value!r}.')
@@ -0,0 +1,458 @@
+"""
+Bulk loads vehicle types, makes, owners or cars from a CSV or JSONL file.
+
+    python manage.py import_fleet vehicle_types types.csv
+    python manage.py import_fleet makes makes.csv
+    python manage.py import_fleet owners owners.jsonl
+    python manage.py import_fleet cars cars.csv --rejects cars_rejected.csv
+
+The file is read one row at a time and written in chunks with bulk_create/bulk_update,
+so memory stays flat however big the file is. Import the files in the order above so the
+cars can find their makes and owners. Rows that fail validation are written to the reject
+file (same format as the input, plus _line and _errors columns) and the import carries on.
+
+Columns use the model field names. Yes/no columns (has_insurance) take true/false, yes/no,
+1/0 and the like in any case, and a blank one keeps the default. Foreign keys are given by
+natural key instead of id:
+    makes:  vehicleType (the vehicle type name)
+    cars:   manuName + carModel (the make), owner_first_name + owner_last_name +
+            owner_phone_num (the owner, optional), mechanic (a username, optional)
+Cars with a VIN that is already in the system are updated, everything else is created.
+An update only touches the fields the file has columns for, so a file with just VINs and
+colors leaves the cars' owners, mechanics, due dates and statuses alone.
+VINs are checked offline (see catalog/vin.py), and a car's modelYear can be left blank
+when its VIN carries it.
+"""
+
+# Standard library imports
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+
+# Django core imports
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Q
+
+# Local application imports
+from catalog.caching import bump_cache_version
+from catalog.models import VehicleType, CarMake, Owner, CarInstance
+from catalog.search import rebuild_search_index
+from catalog.stats import rebuild_fleet_stats
+from catalog import vin
+
+
+# How spreadsheets and exports tend to spell booleans
+BOOLEAN_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True, 'on': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False, 'off': False,
+}
+
+
+class RowRejected(Exception):
+    """Raised while building a row that can't be imported, carries the error messages."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class FleetImporter:
+    """Turns rows into model instances and writes them a chunk at a time."""
+
+    model = None
+    fields = []  # Plain model fields read straight from the columns
+    update_fields = []  # Fields refreshed on rows that already exist, when the file has them
+    update_columns = {}  # Update fields filled from columns not named after them, e.g. a foreign key's natural key
+    exclude_from_validation = []  # Foreign keys, which we resolve ourselves
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+
+    def load_lookups(self):
+        """Loads the in-memory lookup maps the rows are resolved against."""
+
+    def key(self, instance):
+        """The natural key that identifies an existing row, or None if the row is always new."""
+        raise NotImplementedError
+
+    def existing(self, keys):
+        """Maps the natural keys that are already in the database to their primary keys."""
+        raise NotImplementedError
+
+    def resolve(self, row, instance):
+        """Fills in the foreign keys of ``instance`` from the row."""
+
+    def prepare(self, instances):
+        """Chunk-wide lookups before writing, returns (line, instance, errors) for rows that failed them."""
+        return []
+
+    def build(self, row):
+        instance = self.model()
+        given = set()  # The fields the row has a value for, the only ones an update writes
+        for name in self.fields:
+            if name not in row:
+                continue  # Missing column, keep the model default
+            value = row[name]
+            if isinstance(value, str):
+                value = value.strip()
+            field = self.model._meta.get_field(name)
+            if value in ('', None) and field.null:
+                value = None
+            elif isinstance(field, models.BooleanField) and isinstance(value, str):
+                if not value:
+                    continue  # Blank, keep the model default
+                value = BOOLEAN_VALUES.get(value.lower(), value)  # Anything else fails validation below
+            setattr(instance, name, value)
+            given.add(name)
+        given.update(field for field, columns in self.update_columns.items() if any(column in row for column in columns))
+        instance._import_fields = given
+        # Missing columns are fine for a row that updates, write() checks them on new rows
+        instance._import_unchecked = [name for name in self.fields if name not in row]
+        self.resolve(row, instance)
+        try:
+            instance.clean_fields(exclude=self.exclude_from_validation + instance._import_unchecked)
+            instance.clean()
+        except ValidationError as exc:
+            raise RowRejected(exc.messages) from exc
+        except (AttributeError, TypeError) as exc:  # e.g. a clean() that expects a value we didn't get
+            raise RowRejected([str(exc)]) from exc
+        return instance
+
+    def write(self, instances, batch_size):
+        """Creates or updates one validated chunk, returns (line, errors) for the rows rejected here."""
+        keyed = {}
+        new = []
+        rejected = []
+        for line, instance in instances:
+            key = self.key(instance)
+            if key is None:
+                new.append((line, instance))
+            elif key in keyed:
+                rejected.append((line, ['Duplicate of an earlier row in the same chunk.']))
+            else:
+                keyed[key] = (line, instance)
+
+        existing = self.existing(list(keyed))
+        updates = defaultdict(list)  # Rows to update, by the fields they have (one set per file, unless it's ragged JSONL)
+        for key, (line, instance) in keyed.items():
+            if key in existing:
+                instance.pk = existing[key]
+                fields = tuple(field for field in self.update_fields if field in instance._import_fields)
+                if fields:
+                    updates[fields].append(instance)
+            else:
+                new.append((line, instance))
+        new, missing_columns = self.check_new(new)
+        rejected.extend(missing_columns)
+
+        with transaction.atomic():
+            if new:
+                self.model.objects.bulk_create(new, batch_size=batch_size)
+            for fields, instances in updates.items():
+                self.model.objects.bulk_update(instances, fields, batch_size=batch_size)
+        self.created += len(new)
+        self.updated += sum(len(instances) for instances in updates.values())
+        return rejected
+
+    def check_new(self, rows):
+        """Validates the fields of new rows that build() skipped for missing columns, returns (instances, rejected)."""
+        instances, rejected = [], []
+        for line, instance in rows:
+            if instance._import_unchecked:
+                checked = set(instance._import_unchecked)
+                try:
+                    instance.clean_fields(exclude=[field.name for field in self.model._meta.fields if field.name not in checked])
+                except ValidationError as exc:
+                    rejected.append((line, exc.messages))
+                    continue
+            instances.append(instance)
+        return instances, rejected
+
+
+class VehicleTypeImporter(FleetImporter):
+    model = VehicleType
+    fields = ['name']
+
+    def key(self, instance):
+        return instance.name
+
+    def existing(self, keys):
+        return dict(VehicleType.objects.filter(name__in=keys).values_list('name', 'id'))
+
+
+class CarMakeImporter(FleetImporter):
+    model = CarMake
+    fields = ['manuName', 'carModel']
+    update_fields = ['vehicleType']
+    update_columns = {'vehicleType': ('vehicleType',)}
+    exclude_from_validation = ['vehicleType']
+
+    def load_lookups(self):
+        self.vehicle_types = dict(VehicleType.objects.values_list('name', 'id'))
+
+    def resolve(self, row, instance):
+        name = (row.get('vehicleType') or '').strip()
+        if name:
+            if name not in self.vehicle_types:
+                raise RowRejected([f'Unknown vehicle type "{name}".'])
+            instance.vehicleType_id = self.vehicle_types[name]
+
+    def key(self, instance):
+        return (instance.manuName, instance.carModel)
+
+    def existing(self, keys):
+        keys = set(keys)
+        makes = CarMake.objects.filter(manuName__in={key[0] for key in keys}, carModel__in={key[1] for key in keys})
+        return {
+            (manu, model): pk for manu, model, pk in makes.values_list('manuName', 'carModel', 'id')
+            if (manu, model) in keys
+        }
+
+
+def owners_by_key(keys):
+    """
+    Looks up owners by (first_name, last_name, phone_num) with one indexed query. A blank
+    phone is stored as NULL, which IN never matches, so those are looked for with IS NULL.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    phones = {key[2] for key in keys}
+    phone_match = Q(phone_num__in=phones - {None})
+    if None in phones:
+        phone_match |= Q(phone_num__isnull=True)
+    owners = Owner.objects.filter(
+        phone_match,
+        first_name__in={key[0] for key in keys},
+        last_name__in={key[1] for key in keys},
+    ).values_list('first_name', 'last_name', 'phone_num', 'id')
+    return {(first, last, phone): pk for first, last, phone, pk in owners if (first, last, phone) in keys}
+
+
+class OwnerImporter(FleetImporter):
+    model = Owner
+    fields = [
+        'first_name', 'last_name', 'phone_num', 'address',
+        'has_insurance', 'insurance_provider', 'insurance_policy_number',
+    ]
+    update_fields = ['address', 'has_insurance', 'insurance_provider', 'insurance_policy_number']
+    exclude_from_validation = ['user']
+
+    def key(self, instance):
+        return (instance.first_name, instance.last_name, instance.phone_num)
+
+    def existing(self, keys):
+        return owners_by_key(keys)
+
+
+class CarInstanceImporter(FleetImporter):
+    model = CarInstance
+    fields = ['license_plate', 'vinNum', 'modelYear', 'color', 'status', 'due_back']
+    update_fields = ['car', 'owner', 'license_plate', 'modelYear', 'color', 'status', 'due_back', 'mechanic_stat']
+    update_columns = {
+        'car': ('manuName', 'carModel'),
+        'owner': ('owner_first_name', 'owner_last_name', 'owner_phone_num'),
+        'mechanic_stat': ('mechanic',),
+    }
+    exclude_from_validation = ['car', 'owner', 'mechanic_stat']
+
+    def load_lookups(self):
+        # Makes and mechanics are small tables, owners are looked up a chunk at a time instead
+        self.makes = {
+            (manu, model): pk for manu, model, pk in CarMake.objects.values_list('manuName', 'carModel', 'id')
+        }
+        self.users = dict(User.objects.values_list('username', 'id'))
+
+    def build(self, row):
+        instance = super().build(row)
+        if not instance.status:
+            # New cars start out available, an existing car keeps the status it has
+            instance.status = 'A'
+            instance._import_fields.discard('status')
+        return instance
+
+    def resolve(self, row, instance):
+        errors = []
+        if instance.vinNum:
+            info = vin.decode(instance.vinNum)  # Cached, so VINs seen again (re-imports, updates) cost nothing
+            instance.vinNum = info.vin
+            errors.extend(info.errors)
+            if info.valid and not instance.modelYear and info.model_year:
+                instance.modelYear = str(info.model_year)
+                instance._import_fields.add('modelYear')
+
+        make = ((row.get('manuName') or '').strip(), (row.get('carModel') or '').strip())
+        if make in self.makes:
+            instance.car_id = self.makes[make]
+        elif any(make):
+            errors.append(f'Unknown make "{make[0]} {make[1]}".')
+
+        owner = tuple((row.get(column) or '').strip() for column in ('owner_first_name', 'owner_last_name', 'owner_phone_num'))
+        # Resolved for the whole chunk in prepare(). No phone is NULL, like the owners import stores it
+        instance._import_owner_key = owner[:2] + (owner[2] or None,) if any(owner) else None
+
+        mechanic = (row.get('mechanic') or '').strip()
+        if mechanic:
+            if mechanic not in self.users:
+                errors.append(f'Unknown mechanic "{mechanic}".')
+            else:
+                instance.mechanic_stat_id = self.users[mechanic]
+        if errors:
+            raise RowRejected(errors)
+
+    def prepare(self, instances):
+        """Resolves the owners for a chunk in one query, returns the rows whose owner wasn't found."""
+        found = owners_by_key(instance._import_owner_key for _, instance in instances if instance._import_owner_key)
+        missing = []
+        for line, instance in instances:
+            key = instance._import_owner_key
+            if key is None:
+                continue
+            if key in found:
+                instance.owner_id = found[key]
+            else:
+                missing.append((line, instance, [f'Unknown owner "{key[0]} {key[1]}" ({key[2] or "no phone"}).']))
+        return missing
+
+    def key(self, instance):
+        return instance.vinNum  # Cars without a VIN can't be matched, so they're always new
+
+    def existing(self, keys):
+        return dict(CarInstance.objects.filter(vinNum__in=keys).values_list('vinNum', 'id'))
+
+
+IMPORTERS = {
+    'vehicle_types': VehicleTypeImporter,
+    'makes': CarMakeImporter,
+    'owners': OwnerImporter,
+    'cars': CarInstanceImporter,
+}
+
+
+def read_rows(path, file_format):
+    """Yields (line number, row dict) pairs without reading the whole file into memory."""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(handle, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as exc:
+                    yield line, {'_invalid': str(exc)}
+                    continue
+                yield line, row if isinstance(row, dict) else {'_invalid': 'Each line must be a JSON object.'}
+
+
+class RejectWriter:
+    """Writes rejected rows next to their line number and errors, opened on the first reject."""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.handle = None
+        self.writer = None
+        self.count = 0
+
+    def write(self, line, row, errors):
+        self.count += 1
+        if self.path is None:
+            return
+        record = {'_line': line, '_errors': '; '.join(errors)}
+        record.update({key: value for key, value in row.items() if key not in ('_line', '_errors', '_invalid')})
+        if self.handle is None:
+            self.handle = open(self.path, 'w', newline='', encoding='utf-8')
+        if self.file_format == 'csv':
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.handle, fieldnames=list(record), extrasaction='ignore')
+                self.writer.writeheader()
+            self.writer.writerow(record)
+        else:
+            self.handle.write(json.dumps(record, default=str) + '\n')
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+
+
+class Command(BaseCommand):
+    help = 'Streams owners, makes, vehicle types or cars from a CSV/JSONL file into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='What the file contains.')
+        parser.add_argument('path', help='The CSV or JSONL file to import.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format, guessed from the extension if left out.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and written per chunk (default 1000).')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: <path>.rejects.<ext>).')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'{path} does not exist.')
+        file_format = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'jsonl')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        reject_path = options['rejects'] or path.with_name(f'{path.stem}.rejects.{file_format}')
+
+        importer = IMPORTERS[options['kind']]()
+        importer.load_lookups()
+        rejects = RejectWriter(reject_path, file_format)
+        rows = read_rows(path, file_format)
+        chunks = 0
+        try:
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                self.import_chunk(importer, chunk, rejects, batch_size)
+                chunks += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Chunk {chunks}: {importer.created} created, {importer.updated} updated, {rejects.count} rejected so far')
+        finally:
+            rejects.close()
+
+        # bulk_create and bulk_update skip the signals that keep the search index, fleet stats and page caches in step
+        if importer.created or importer.updated:
+            if options['kind'] != 'vehicle_types':
+                rebuild_search_index()
+                rebuild_fleet_stats()
+            bump_cache_version('fleet')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {options["kind"]}: {importer.created} created, {importer.updated} updated, {rejects.count} rejected.'
+        ))
+        if rejects.count:
+            self.stdout.write(self.style.WARNING(f'Rejected rows were written to {reject_path}'))
+
+    def import_chunk(self, importer, chunk, rejects, batch_size):
+        rows_by_line = dict(chunk)
+        valid = []
+        for line, row in chunk:
+            if '_invalid' in row:
+                rejects.write(line, row, [row['_invalid']])
+                continue
+            try:
+                valid.append((line, importer.build(row)))
+            except RowRejected as exc:
+                rejects.write(line, row, exc.errors)
+
+        missing = importer.prepare(valid)
+        if missing:
+            missing_lines = {line for line, _, _ in missing}
+            for line, _, errors in missing:
+                rejects.write(line, rows_by_line[line], errors)
+            valid = [(line, instance) for line, instance in valid if line not in missing_lines]
+
+        for line, errors in importer.write(valid, batch_size):
+            rejects.write(line, rows_by_line[line], errors)
@@ -0,0 +1,29 @@
+"""
+Rebuilds the fleet statistics table from the car and owner tables and reports drift.
+
+    python manage.py rebuild_fleet_stats
+
+Safe to run any time (e.g. nightly from cron). Drift means something wrote to the cars or
+owners without going through save()/delete() and without rebuilding afterwards.
+"""
+
+# Standard library imports
+import time
+
+# Django core imports
+from django.core.management.base import BaseCommand
+
+# Local application imports
+from catalog.stats import rebuild_fleet_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the fleet statistics shown on the dashboards from scratch.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        drift = rebuild_fleet_stats()
+        for (dimension, key), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(self.style.WARNING(f'{dimension}[{key or "none"}]: was {stored}, now {actual}'))
+        summary = f'Fleet stats rebuilt in {time.perf_counter() - started:.1f}s'
+        self.stdout.write(self.style.SUCCESS(f'{summary}, {len(drift)} count(s) had drifted.' if drift else f'{summary}, no drift.'))
@@ -0,0 +1,63 @@
+"""
+Queues and mails the due back reminders (upcoming, overdue and escalated), see catalog/reminders.py.
+
+    python manage.py send_due_back_reminders                 # one run, e.g. hourly from cron
+    python manage.py send_due_back_reminders --loop 900      # keep running, every 15 minutes
+    python manage.py send_due_back_reminders --queue-only    # record the notices, don't mail them
+
+Runs are idempotent: a notice is only ever queued once per car, person, level and due date,
+and only unsent notices are mailed. Notices for a due date the car no longer has are marked
+skipped. Mail goes out through the EMAIL_* settings (the console unless FLEET_EMAIL_HOST is set).
+"""
+
+# Standard library imports
+import datetime
+import time
+
+# Django core imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+# Local application imports
+from catalog.reminders import BATCH_SIZE, queue_reminders, send_reminders, skip_stale_reminders
+
+
+class Command(BaseCommand):
+    help = 'Queues due back reminders for upcoming and overdue cars and emails them to owners and mechanics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--today', type=datetime.date.fromisoformat, help='Run as if it were this day (YYYY-MM-DD).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'Cars or notices per batch (default {BATCH_SIZE}).')
+        parser.add_argument('--queue-only', action='store_true', help="Queue the notices but don't send any.")
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help='Run again every SECONDS until interrupted.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['loop'] is not None and options['loop'] < 1:
+            raise CommandError('--loop must be at least 1 second.')
+        while True:
+            self.run_once(options)
+            if options['loop'] is None:
+                return
+            close_old_connections()  # Don't sit on a stale connection between runs
+            time.sleep(options['loop'])
+
+    def run_once(self, options):
+        started = time.perf_counter()
+
+        def queue_progress(level, new):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{level}: batch done, {new} new notices')
+
+        def send_progress(sent):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{sent} notices sent')
+
+        queued = queue_reminders(options['today'], batch_size=options['batch_size'], progress=queue_progress)
+        skipped = skip_stale_reminders()
+        sent = 0 if options['queue_only'] else send_reminders(batch_size=options['batch_size'], progress=send_progress)
+        levels = ', '.join(f'{count} {level}' for level, count in queued.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued {levels}; skipped {skipped} stale; sent {sent} in {time.perf_counter() - started:.1f}s.'
+        ))
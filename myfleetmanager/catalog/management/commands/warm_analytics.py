@@ -0,0 +1,42 @@
+"""
+Computes the fleet analytics ahead of time, so the dashboards find them cached (see catalog/analytics.py).
+
+    python manage.py warm_analytics              # once, e.g. after a deploy or a big import
+    python manage.py warm_analytics --loop 300   # keep them warm, every 5 minutes
+
+Only recomputes when the cached results are out of date (the fleet changed, or they
+expired), unless --force is given. The results go in the shared cache, so run it with the
+same CACHES (the same FLEET_CACHE_DIR) as the web workers, or they won't see them.
+"""
+
+# Standard library imports
+import time
+
+# Django core imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+# Local application imports
+from catalog.analytics import fleet_analytics, warm_analytics
+
+
+class Command(BaseCommand):
+    help = 'Computes and caches the fleet analytics shown on the admin dashboard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute even if the cached results are current.')
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help='Run again every SECONDS until interrupted.')
+
+    def handle(self, *args, **options):
+        if options['loop'] is not None and options['loop'] < 1:
+            raise CommandError('--loop must be at least 1 second.')
+        while True:
+            started = time.perf_counter()
+            analytics = warm_analytics() if options['force'] else fleet_analytics()
+            self.stdout.write(self.style.SUCCESS(
+                f'Analytics for {analytics["total"]} cars as of {analytics["computed_at"]} ({time.perf_counter() - started:.2f}s).'
+            ))
+            if options['loop'] is None:
+                return
+            close_old_connections()  # Don't sit on a stale connection between runs
+            time.sleep(options['loop'])
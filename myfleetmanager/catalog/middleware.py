@@ -0,0 +1,216 @@
+"""
+Per-request performance instrumentation and query budgets.
+
+Both middlewares here work under WSGI and ASGI alike, an async request never gets pushed
+through a thread just for them.
+"""
+
+# Standard library imports
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+# Django core imports
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+# Local application imports
+from .history import collect_changes, write_changes
+
+logger = logging.getLogger('catalog.performance')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a view runs more queries than its budget and budgets are enforced."""
+
+
+def query_budget(max_queries):
+    """Declares the most queries a function based view may run, e.g. @query_budget(8)."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def query_budget_for(resolver_match):
+    """
+    The query budget declared by the view behind ``resolver_match``, or None.
+
+    Class based views set a ``query_budget`` attribute, function based views use the
+    @query_budget decorator (functools.wraps carries it through login_required and friends).
+    """
+    if resolver_match is None:
+        return None
+    view = resolver_match.func
+    view_class = getattr(view, 'view_class', None)
+    return getattr(view_class or view, 'query_budget', None)
+
+
+class QueryRecorder:
+    """A database execute wrapper that counts and times every query, and spots repeats."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.lock = threading.Lock()  # An async view's queries come in from several threads at once
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.seconds += time.perf_counter() - started
+                self.count += 1
+                self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeat an earlier one in the same request, same SQL and parameters."""
+        return sum(count - 1 for count in self.statements.values())
+
+
+# The recorder of the request being served. sync_to_async copies it into the worker threads
+# async views run their queries in (async_views.run_query), so those are counted too.
+_recorder = ContextVar('catalog_query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """The execute wrapper on every connection, hands the query to the current request's recorder, if any."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Puts record_query on ``connection`` (once). signals.py does it for every new connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class PerformanceMiddleware:
+    """
+    Records total time, DB time, query count and duplicate queries for each request.
+
+    In debug mode the numbers go out on the response as Server-Timing and X-Catalog-Perf
+    headers. Otherwise they're added up per URL name and logged to "catalog.performance"
+    every CATALOG_PERF_LOG_INTERVAL seconds. Views over their query budget are logged, or
+    raise QueryBudgetExceeded when CATALOG_ENFORCE_QUERY_BUDGETS is on (use it in tests).
+    Keep this first in MIDDLEWARE so the session and auth queries are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.log_interval = getattr(settings, 'CATALOG_PERF_LOG_INTERVAL', 60)
+        self.lock = threading.Lock()
+        self.totals = defaultdict(Counter)
+        self.last_logged = time.monotonic()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def start(self):
+        # Connections opened before signals.py was loaded don't have the wrapper yet
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        recorder = QueryRecorder()
+        return recorder, _recorder.set(recorder), time.perf_counter()
+
+    def finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.seconds * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else 'unresolved'
+        if settings.DEBUG:
+            response['Server-Timing'] = f'total;dur={total_ms:.1f}, db;dur={db_ms:.1f}'
+            response['X-Catalog-Perf'] = (
+                f'view={name}; queries={recorder.count}; duplicates={recorder.duplicates}; '
+                f'total_ms={total_ms:.1f}; db_ms={db_ms:.1f}'
+            )
+        else:
+            self.record(name, total_ms, db_ms, recorder)
+
+        budget = query_budget_for(match)
+        if budget is not None and recorder.count > budget:
+            message = f'{name} ran {recorder.count} queries, over its budget of {budget}.'
+            if getattr(settings, 'CATALOG_ENFORCE_QUERY_BUDGETS', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def record(self, name, total_ms, db_ms, recorder):
+        with self.lock:
+            totals = self.totals[name]
+            totals['requests'] += 1
+            totals['total_ms'] += total_ms
+            totals['db_ms'] += db_ms
+            totals['queries'] += recorder.count
+            totals['duplicates'] += recorder.duplicates
+            if time.monotonic() - self.last_logged < self.log_interval:
+                return
+            snapshot, self.totals = self.totals, defaultdict(Counter)
+            self.last_logged = time.monotonic()
+
+        for view_name, totals in sorted(snapshot.items()):
+            requests = totals['requests']
+            logger.info(
+                '%s: %d requests, avg %.1f ms (db %.1f ms), avg %.1f queries, %d duplicate queries',
+                view_name, requests, totals['total_ms'] / requests, totals['db_ms'] / requests,
+                totals['queries'] / requests, totals['duplicates'],
+            )
+
+
+class StatusHistoryMiddleware:
+    """
+    Collects the car status and mechanic changes a request makes and writes them with one
+    INSERT once the view is done, see catalog/history.py. Goes after AuthenticationMiddleware,
+    the changes are tagged with request.user.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with collect_changes(getattr(request, 'user', None)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The INSERT can't run on the event loop, so it's written here rather than by collect_changes
+        with collect_changes(getattr(request, 'user', None), write=False) as pending:
+            response = await self.get_response(request)
+        if pending:
+            await sync_to_async(write_changes)(pending)
+        return response
@@ -4,9 +4,11 @@ from django.core.exceptions import ValidationError
 from django.db import models
 # Everything below here I have added
 from django.urls import reverse # Used in get_absolute_url() to get URL for specified ID
-from django.db.models.functions import Lower # Returns lower cased value of field
+from django.db.models.functions import Coalesce, Lower # Lower returns lower cased value of field
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Prefetch, Subquery, Value
 from django.conf import settings
 from django.contrib.auth.models import User  # Add this line to import User
+from django.utils import timezone
 
 # Direct imports are here
 from datetime import date
@@ -52,6 +54,46 @@ class CarMake(models.Model):
         """Returns the URL to access a detail record for this manufacturer."""
         return reverse('car-make-detail', args=[str(self.id)])
 
+class CarInstanceQuerySet(models.QuerySet):
+    """Reusable query building blocks for the car lists."""
+
+    def for_list(self):
+        """Pulls the make, owner and mechanic in with the car so list pages don't query per row."""
+        return self.select_related('car', 'owner', 'mechanic_stat')
+
+    def filtered(self, status=None, owner=None, mechanic=None):
+        """Applies the status/owner/mechanic filters used by the car list. Blank values are ignored."""
+        queryset = self
+        if status:
+            queryset = queryset.filter(status=status)
+        if owner:
+            queryset = queryset.filter(owner_id=owner)
+        if mechanic:
+            queryset = queryset.filter(mechanic_stat_id=mechanic)
+        return queryset
+
+    def assigned_to(self, mechanic):
+        """Cars whose mechanic_stat is ``mechanic`` (a user or user id)."""
+        return self.filter(mechanic_stat=mechanic)
+
+    def overdue(self, today=None):
+        """Cars past their due_back date, the same rule as CarInstance.is_overdue but done in SQL."""
+        return self.filter(due_back__lt=today or date.today())
+
+    def with_days_overdue(self, today=None):
+        """Annotates days_overdue, how long ago due_back was (a timedelta, negative if not due yet)."""
+        return self.annotate(days_overdue=ExpressionWrapper(
+            Value(today or date.today(), output_field=models.DateField()) - F('due_back'),
+            output_field=models.DurationField(),
+        ))
+
+    def status_counts(self):
+        """Counts cars per status code with one GROUP BY, statuses with no cars count as 0."""
+        counts = dict.fromkeys(dict(CarInstance.CAR_STATUS), 0)
+        # order_by() clears the default ordering, otherwise due_back ends up in the GROUP BY
+        counts.update(self.order_by().values_list('status').annotate(total=Count('id')))
+        return counts
+
 """Model representing a specific car in the shop"""
 class CarInstance(models.Model):
     
@@ -108,9 +150,31 @@ class CarInstance(models.Model):
         help_text="Select the current status of the car: M (Maintenance), O (Owner has vehicle), S (Scrap), A (Available), R (Ready for release)."
     )
 
+    objects = CarInstanceQuerySet.as_manager()
+
     class Meta:
         """Model representing a ordering method"""
         ordering = ['due_back']
+        # Indexes for the car list pages, (due_back, id) is the keyset pagination order
+        indexes = [
+            models.Index(fields=['due_back', 'id'], name='car_due_back_idx'),
+            models.Index(fields=['status', 'due_back', 'id'], name='car_status_due_back_idx'),
+            models.Index(fields=['owner', 'due_back', 'id'], name='car_owner_due_back_idx'),
+            models.Index(fields=['mechanic_stat', 'due_back', 'id'], name='car_mechanic_due_back_idx'),
+            # Mechanic work queues and the per-mechanic load table, answered from the index alone
+            models.Index(fields=['mechanic_stat', 'status', 'due_back', 'id'], name='car_mechanic_status_idx'),
+            models.Index(fields=['license_plate'], name='car_license_plate_idx'),
+            # Cars per model year for the fleet analytics, counted from the index alone
+            models.Index(fields=['modelYear'], name='car_model_year_idx'),
+        ]
+        # VINs are optional, but two cars can't share one
+        constraints = [
+            models.UniqueConstraint(
+                fields=['vinNum'],
+                condition=models.Q(vinNum__isnull=False),
+                name='unique_vin_when_present',
+            ),
+        ]
 
     def __str__(self):
         """String for representing the Model object."""
@@ -125,6 +189,26 @@ class CarInstance(models.Model):
         """Determines if the car is overdue based on due date and current date."""
         return bool(self.due_back and date.today() > self.due_back)
 
+class OwnerQuerySet(models.QuerySet):
+    """Reusable query building blocks for the owner pages."""
+
+    def with_car_counts(self, today=None):
+        """
+        Annotates car_count and overdue_count.
+
+        Both are correlated subqueries rather than a JOIN and GROUP BY, so on a paginated
+        list they're only worked out for the owners on the page, using the owner index on cars.
+        """
+        cars = CarInstance.objects.filter(owner=OuterRef('pk')).order_by().values('owner')
+        return self.annotate(
+            car_count=Coalesce(Subquery(cars.annotate(total=Count('id')).values('total')), 0),
+            overdue_count=Coalesce(Subquery(cars.overdue(today).annotate(total=Count('id')).values('total')), 0),
+        )
+
+    def with_cars(self):
+        """Prefetches the owner's cars with their makes, two queries however many cars there are."""
+        return self.prefetch_related(Prefetch('carinstance_set', queryset=CarInstance.objects.select_related('car')))
+
 """Model representing an owner."""
 class Owner(models.Model):
     #The line below allows the owners to login and see their version of the site
@@ -176,15 +260,23 @@ class Owner(models.Model):
 
     def clean(self):
         """Custom validation to ensure the phone number is valid."""
+        if self.phone_num is None:
+            return  # Not given yet, e.g. owners made for a new login (see owners.py)
         if not self.phone_num.isdigit():
             raise ValidationError('Phone number must contain only digits.')
 
         if len(self.phone_num) < 10:
             raise ValidationError('Phone number must be at least 10 digits long.')
 
+    objects = OwnerQuerySet.as_manager()
+
     class Meta: #orders the owners in the system as well as prevents duplicates 
         ordering = ['last_name', 'first_name']
         unique_together = ['first_name', 'last_name', 'phone_num']
+        indexes = [
+            # The owner list is keyset paginated on (last_name, id)
+            models.Index(fields=['last_name', 'id'], name='owner_last_name_idx'),
+        ]
 
     def get_absolute_url(self):
         """Returns the URL to access a particular author instance."""
@@ -234,7 +326,106 @@ class Feedback(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     resolved = models.BooleanField(default=False)
+
+    class Meta:
+        # Index paths for the feedback list: each section is filtered on resolved, and
+        # optionally category or user, then listed newest first
+        indexes = [
+            models.Index(fields=['resolved', 'category', '-created_at', '-id'], name='feedback_category_idx'),
+            models.Index(fields=['resolved', '-created_at', '-id'], name='feedback_resolved_idx'),
+            models.Index(fields=['user', 'resolved', '-created_at', '-id'], name='feedback_user_idx'),
+        ]
     
     def __str__(self):
         return f'Feedback from {self.user.username if self.user else "Anonymous"}'
+
+class PageVisit(models.Model):
+    """Running visit total for a page, per user (user is empty for anonymous visitors)."""
+    page = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['page', 'user'], name='unique_page_visit'),
+            # NULLs never clash in a unique index, so anonymous totals need their own constraint
+            models.UniqueConstraint(fields=['page'], condition=models.Q(user__isnull=True), name='unique_anonymous_page_visit'),
+        ]
+
+    def __str__(self):
+        return f'{self.page}: {self.count}'
+
+class FleetStatistic(models.Model):
+    """One precomputed fleet count, e.g. cars with status M or cars assigned to mechanic 7. See catalog/stats.py."""
+    dimension = models.CharField(max_length=30)
+    key = models.CharField(max_length=100, blank=True)  # Empty for "none", e.g. unassigned cars
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='unique_fleet_statistic'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension}[{self.key}]: {self.count}'
+
+class DueBackReminder(models.Model):
+    """A due back notice for one person about one car. Kept after sending, so no notice goes out twice. See catalog/reminders.py."""
+    UPCOMING = 'upcoming'
+    OVERDUE = 'overdue'
+    ESCALATED = 'escalated'
+    LEVELS = (
+        (UPCOMING, 'Due back soon'),
+        (OVERDUE, 'Overdue'),
+        (ESCALATED, 'Overdue, escalated'),
+    )
+
+    car = models.ForeignKey(CarInstance, on_delete=models.CASCADE)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE)
+    level = models.CharField(max_length=10, choices=LEVELS)
+    due_back = models.DateField()  # The due date the notice is about, a new due date gets new notices
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    skipped_at = models.DateTimeField(null=True, blank=True)  # Not sent, the car's due date moved before it went out
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['car', 'recipient', 'level', 'due_back'], name='unique_due_back_reminder'),
+        ]
+        indexes = [
+            # The send queue, only the notices still to go out are in it
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True, skipped_at__isnull=True), name='reminder_unsent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_level_display()} notice for {self.car} to {self.recipient}'
+
+class CarStatusChange(models.Model):
+    """One change to a car's status or mechanic. Only ever added to, never edited. See catalog/history.py."""
+    STATUS = 'status'
+    MECHANIC = 'mechanic'
+    FIELDS = (
+        (STATUS, 'Status'),
+        (MECHANIC, 'Mechanic'),
+    )
+
+    car = models.ForeignKey(CarInstance, on_delete=models.CASCADE, related_name='status_changes')
+    field = models.CharField(max_length=8, choices=FIELDS)
+    # A status code or a mechanic's user id ('' for no mechanic). old_value is NULL when the car was just added
+    old_value = models.CharField(max_length=20, null=True, blank=True)
+    new_value = models.CharField(max_length=20, blank=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            # Cars that entered a status (or went to a mechanic) between two times
+            models.Index(fields=['field', 'new_value', 'changed_at'], name='status_change_entered_idx'),
+            # One car's timeline, for time spent per status and when a car next moved on
+            models.Index(fields=['car', 'field', 'changed_at'], name='status_change_car_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.car}: {self.field} {self.old_value or "-"} -> {self.new_value or "-"} at {self.changed_at:%Y-%m-%d %H:%M}'
+
 # There should always be a trailing white space in these files 
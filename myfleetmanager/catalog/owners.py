@@ -0,0 +1,142 @@
+"""
+Creates and updates a user together with their Owner row.
+
+Every customer login is a User with an Owner holding their name and contact details. The
+functions here write the pair in one transaction with as few statements as they can: one
+INSERT per new row, and on later saves an UPDATE of only the owner fields that changed
+(nothing at all if none did). Registration, the user management pages and the admin all
+go through save_user_and_owner(), and create_users() does the same for many users at once.
+
+Users saved any other way (createsuperuser, a plain user.save()) still get their owner from
+the create_or_update_owner receiver in signals.py, which calls sync_owner_name().
+
+An owner made without a phone number gets NULL rather than the field default, NULLs never
+clash in the (first_name, last_name, phone_num) unique index, so two users with the same
+(or no) name can't block each other's owner.
+"""
+
+# Django core imports
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+# Local application imports
+from .caching import bump_cache_version
+from .models import Owner
+from .search import OWNER_INDEX
+from .stats import rebuild_fleet_stats
+
+# Set on a user while save_user_and_owner() saves it, so the signal leaves the owner alone
+PROVISIONING = '_catalog_provisioning_owner'
+
+NAME_FIELDS = ('first_name', 'last_name')
+
+
+def _new_owner(user, **owner_fields):
+    owner = Owner(user=user, first_name=user.first_name, last_name=user.last_name, phone_num=None)
+    for field, value in owner_fields.items():
+        setattr(owner, field, value)
+    return owner
+
+
+def _update_owner(owner, values):
+    """Sets ``values`` on the owner and saves only the fields that actually changed."""
+    changed = [field for field, value in values.items() if getattr(owner, field) != value]
+    for field in changed:
+        setattr(owner, field, values[field])
+    if changed:
+        owner.save(update_fields=changed)
+    return changed
+
+
+def _claim_owner(user, owner_fields):
+    """
+    Saves a new owner for the user, or links them to an existing unlinked owner with the same
+    name and phone number (e.g. one staff entered before the customer had a login).
+    """
+    owner = _new_owner(user, **owner_fields)
+    if owner.phone_num is not None:
+        existing = Owner.objects.filter(first_name=owner.first_name, last_name=owner.last_name, phone_num=owner.phone_num).first()
+        if existing is not None:
+            if existing.user_id is not None:
+                raise ValidationError(f'{existing.full_name()} with phone number {existing.phone_num} already belongs to another user.')
+            _update_owner(existing, {'user': user, **owner_fields})
+            return existing
+    owner.save()
+    return owner
+
+
+@transaction.atomic
+def save_user_and_owner(user, password=None, **owner_fields):
+    """
+    Saves ``user`` and creates or updates their Owner, returns the owner.
+
+    ``owner_fields`` are Owner field values (phone_num, address, ...). A first_name or
+    last_name among them is set on the user as well, so both rows agree. ``password``, if
+    given, is hashed onto the user.
+    """
+    for field in NAME_FIELDS:
+        if field in owner_fields:
+            setattr(user, field, owner_fields[field])
+    if password:
+        user.set_password(password)
+
+    creating = user._state.adding
+    setattr(user, PROVISIONING, True)
+    try:
+        user.save()
+    finally:
+        delattr(user, PROVISIONING)
+
+    owner = None if creating else Owner.objects.filter(user=user).first()
+    if owner is None:
+        return _claim_owner(user, owner_fields)
+    _update_owner(owner, {'first_name': user.first_name, 'last_name': user.last_name, **owner_fields})
+    return owner
+
+
+def sync_owner_name(user, created):
+    """Gives a newly saved user an owner, or copies a changed name onto their existing one."""
+    if created:
+        _new_owner(user).save()
+        return
+    owner = Owner.objects.filter(user=user).first()
+    if owner is not None:
+        _update_owner(owner, {field: getattr(user, field) for field in NAME_FIELDS})
+
+
+def create_users(rows, batch_size=500):
+    """
+    Creates users and their owners in batches, returns the number created.
+
+    Each row is a dict with a username, optionally a password (the user can't log in
+    without one), email, first_name and last_name, plus any Owner fields (phone_num,
+    address, ...). One INSERT per batch for the users and one for the owners. bulk_create
+    sends no signals, so the owner search index, fleet stats and page caches are refreshed
+    here afterwards.
+    """
+    user_fields = {'username', 'email', 'first_name', 'last_name'}
+    created = 0
+    rows = list(rows)
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            users = [
+                User(password=make_password(row.get('password')), **{field: row[field] for field in user_fields if field in row})
+                for row in batch
+            ]
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                owners = Owner.objects.bulk_create(
+                    _new_owner(user, **{field: value for field, value in row.items() if field not in user_fields and field != 'password'})
+                    for user, row in zip(users, batch)
+                )
+                OWNER_INDEX.refresh(Owner.objects.filter(pk__in=[owner.pk for owner in owners]))
+            created += len(users)
+    finally:
+        if created:
+            rebuild_fleet_stats()
+            bump_cache_version('fleet')
+            bump_cache_version('accounts')
+    return created
@@ -0,0 +1,121 @@
+"""Keyset (cursor) pagination used by the larger catalog lists."""
+
+# Standard library imports
+import base64
+import binascii
+import json
+
+# Django core imports
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor from the query string can't be decoded."""
+
+
+class KeysetPage:
+    """One page of rows plus the cursor that points at the next page."""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pages through a queryset ordered by (key, pk) using the last row seen as the cursor.
+
+    Every page is a range scan that starts where the previous one stopped, so page 500
+    costs the same as page 1. Rows with a NULL key are listed after all keyed rows.
+    The queryset may be a model queryset or a values() queryset that includes the key
+    and the primary key.
+    """
+
+    def __init__(self, queryset, key=None, per_page=50):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.pk_name = queryset.model._meta.pk.name
+        self.key = key if key != self.pk_name else None
+        self.key_field = queryset.model._meta.get_field(self.key) if self.key else None
+        self.nullable = bool(self.key_field and self.key_field.null)
+
+    # Cursors are opaque strings: urlsafe base64 of [section, key value, pk]
+    def encode_cursor(self, row, section):
+        key_value = self._value(row, self.key) if section == 'key' else None
+        if key_value is not None:
+            key_value = str(key_value)
+        payload = json.dumps([section, key_value, self._value(row, self.pk_name)])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            section, key_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if section not in ('key', 'null'):
+                raise ValueError(section)
+            if section == 'key' and self.key_field is not None:
+                key_value = self.key_field.to_python(key_value)
+            return section, key_value, int(pk)
+        except (binascii.Error, TypeError, ValueError, ValidationError) as exc:
+            raise InvalidCursor(f'Invalid cursor: {cursor!r}') from exc
+
+    def page(self, cursor=None):
+        """Returns the KeysetPage that starts right after ``cursor``."""
+        if self.key is None:
+            after_pk = self.decode_cursor(cursor)[2] if cursor else None
+            return self._null_section(self.queryset, after_pk, self.per_page)
+
+        section, key_value, after_pk = self.decode_cursor(cursor) if cursor else ('key', None, None)
+        if section == 'null':
+            return self._null_section(self.queryset.filter(**{f'{self.key}__isnull': True}), after_pk, self.per_page)
+
+        queryset = self.queryset
+        if self.nullable:
+            queryset = queryset.filter(**{f'{self.key}__isnull': False})
+        if after_pk is not None:
+            queryset = queryset.filter(
+                Q(**{f'{self.key}__gt': key_value}) |
+                Q(**{self.key: key_value, f'{self.pk_name}__gt': after_pk})
+            )
+        rows = list(queryset.order_by(self.key, self.pk_name)[:self.per_page + 1])
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            return KeysetPage(rows, self.encode_cursor(rows[-1], 'key'))
+        if not self.nullable:
+            return KeysetPage(rows, None)
+
+        # Out of keyed rows, top the page up from the NULL section
+        remaining = self.per_page - len(rows)
+        null_queryset = self.queryset.filter(**{f'{self.key}__isnull': True})
+        if remaining == 0:
+            if not null_queryset.exists():
+                return KeysetPage(rows, None)
+            return KeysetPage(rows, self.encode_cursor({self.pk_name: 0}, 'null'))
+        null_page = self._null_section(null_queryset, None, remaining)
+        return KeysetPage(rows + null_page.object_list, null_page.next_cursor)
+
+    def _null_section(self, queryset, after_pk, limit):
+        if after_pk is not None:
+            queryset = queryset.filter(**{f'{self.pk_name}__gt': after_pk})
+        rows = list(queryset.order_by(self.pk_name)[:limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return KeysetPage(rows, self.encode_cursor(rows[-1], 'null'))
+        return KeysetPage(rows, None)
+
+    @staticmethod
+    def _value(row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
@@ -0,0 +1,178 @@
+"""
+Due back reminders: who gets told about which car, and when.
+
+    upcoming   due back within the next REMINDER_DAYS_AHEAD days     the owner
+    overdue    past due back                                           the owner and the mechanic
+    escalated  ESCALATE_AFTER_DAYS or more days past due back          the owner and the mechanic
+
+A run has two steps. queue_reminders() walks the cars in each level's due_back range in
+keyset batches (on car_due_back_idx, so it reads only the cars in range, never the whole
+table) and queues a DueBackReminder per recipient with one INSERT ... SELECT per batch.
+The rows never come into Python, and a notice that's already queued or sent is skipped by
+the unique constraint (INSERT OR IGNORE / ON CONFLICT DO NOTHING). send_reminders() then
+mails the unsent ones a batch at a time over one connection and stamps them sent. Running
+either again (cron, ``manage.py send_due_back_reminders --loop``) only picks up what's new.
+
+People are only notified if they have a login with an email address. Changing a car's due
+back date re-arms its reminders, since the due date is part of what makes a notice unique.
+The notices queued for the old date are stale then: skip_stale_reminders() stamps them
+skipped instead of sending them, and send_reminders() never mails one either way.
+
+Where the mail goes is up to the EMAIL_* settings, see settings.py.
+"""
+
+# Standard library imports
+import datetime
+
+# Django core imports
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.db.models import CharField, DateTimeField, F, Q, Value
+from django.db.models.constants import OnConflict
+from django.template.loader import get_template
+from django.utils import timezone
+
+# Local application imports
+from .models import CarInstance, DueBackReminder
+
+BATCH_SIZE = 5000
+REMINDER_DAYS_AHEAD = getattr(settings, 'CATALOG_REMINDER_DAYS_AHEAD', 3)
+ESCALATE_AFTER_DAYS = getattr(settings, 'CATALOG_REMINDER_ESCALATE_AFTER_DAYS', 7)
+
+# Who a car's notices go to: (user id lookup, email lookup) from the car
+OWNER = ('owner__user_id', 'owner__user__email')
+MECHANIC = ('mechanic_stat_id', 'mechanic_stat__email')
+
+
+def reminder_levels(today, days_ahead=REMINDER_DAYS_AHEAD, escalate_after=ESCALATE_AFTER_DAYS):
+    """(level, due_back range filter, recipients) for each level on ``today``."""
+    one_day = datetime.timedelta(days=1)
+    escalate_on = today - datetime.timedelta(days=escalate_after)
+    return [
+        (DueBackReminder.UPCOMING, Q(due_back__gte=today, due_back__lte=today + datetime.timedelta(days=days_ahead)), (OWNER,)),
+        (DueBackReminder.OVERDUE, Q(due_back__gt=escalate_on, due_back__lte=today - one_day), (OWNER, MECHANIC)),
+        (DueBackReminder.ESCALATED, Q(due_back__lte=escalate_on), (OWNER, MECHANIC)),
+    ]
+
+
+def car_batches(cars, batch_size=BATCH_SIZE):
+    """
+    Splits ``cars`` into querysets of up to batch_size cars each, in (due_back, id) order.
+
+    Each batch is a keyset range on car_due_back_idx: finding where it ends reads that many
+    index entries and nothing else, so the walk costs the same at the millionth car as at
+    the first.
+    """
+    ordered = cars.order_by('due_back', 'id')
+    after = None
+    while True:
+        rest = ordered
+        if after is not None:
+            # The plain due_back bound is what lets the index seek straight to the cursor,
+            # the OR on its own is only checked row by row after the range scan
+            rest = rest.filter(Q(due_back__gt=after[0]) | Q(id__gt=after[1]), due_back__gte=after[0])
+        last = rest.values_list('due_back', 'id')[batch_size - 1:batch_size].first()
+        if last is None:
+            yield rest
+            return
+        yield rest.filter(Q(due_back__lt=last[0]) | Q(id__lte=last[1]), due_back__lte=last[0])
+        after = last
+
+
+def _insert_reminders(batch, user_id, level):
+    """Queues the batch's notices with one INSERT ... SELECT, skipping ones already there. Returns how many are new."""
+    # Columns before expressions, that's the order Django puts them in the SELECT
+    rows = batch.order_by().values_list(
+        'id', user_id, 'due_back', Value(level, output_field=CharField()), Value(timezone.now(), output_field=DateTimeField()),
+    )
+    select_sql, params = rows.query.sql_with_params()
+    table = DueBackReminder._meta.db_table
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    on_conflict = connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{insert} {table} (car_id, recipient_id, due_back, level, created_at) {select_sql} {on_conflict}',
+            params,
+        )
+        return cursor.rowcount
+
+
+def queue_reminders(today=None, batch_size=BATCH_SIZE, progress=None):
+    """
+    Queues the notices due on ``today``, returns {level: new notices}.
+
+    ``progress(level, new)`` is called after every batch of cars.
+    """
+    today = today or datetime.date.today()
+    queued = {}
+    for level, in_range, recipients in reminder_levels(today):
+        queued[level] = 0
+        for user_id, email in recipients:
+            # Recipients without a login or without an email address can't be told
+            cars = CarInstance.objects.filter(in_range, **{f'{user_id}__isnull': False}).exclude(**{email: ''})
+            for batch in car_batches(cars, batch_size):
+                new = _insert_reminders(batch, user_id, level)
+                queued[level] += new
+                if progress:
+                    progress(level, new)
+    return queued
+
+
+SUBJECTS = {
+    DueBackReminder.UPCOMING: 'Car {plate} is due back on {due_back}',
+    DueBackReminder.OVERDUE: 'Car {plate} is overdue (was due back {due_back})',
+    DueBackReminder.ESCALATED: 'Still overdue: car {plate} was due back {due_back}',
+}
+
+
+def reminder_message(row, template):
+    """The email for one queued notice, ``row`` as read by send_reminders()."""
+    return EmailMessage(
+        subject=SUBJECTS[row['level']].format(plate=row['car__license_plate'], due_back=row['due_back']),
+        body=template.render(row),
+        to=[row['recipient__email']],
+    )
+
+
+def unsent_reminders():
+    """The notices still to go out, on reminder_unsent_idx."""
+    return DueBackReminder.objects.filter(sent_at__isnull=True, skipped_at__isnull=True)
+
+
+def skip_stale_reminders():
+    """
+    Stamps the unsent notices whose car is no longer due back on the notice's date (moved,
+    or returned) as skipped, with one UPDATE. Returns how many were skipped.
+    """
+    return unsent_reminders().exclude(car__due_back=F('due_back')).update(skipped_at=timezone.now())
+
+
+def send_reminders(batch_size=BATCH_SIZE, progress=None):
+    """
+    Mails every unsent notice that still matches its car's due date, returns how many were sent.
+
+    Each batch goes out over one mail connection and is then stamped sent with one UPDATE.
+    If sending fails part way through a batch, that batch stays unsent and is retried on the
+    next run, so a few people may get that notice twice. Stale notices are left for
+    skip_stale_reminders(), even one that goes stale during the run is never mailed.
+    """
+    sent = 0
+    unsent = unsent_reminders()
+    rows = unsent.filter(car__due_back=F('due_back')).order_by('id').values(
+        'id', 'level', 'due_back', 'recipient__email', 'recipient__first_name',
+        'car_id', 'car__license_plate', 'car__car__manuName', 'car__car__carModel',
+    )
+    last_id = 0
+    template = get_template('emails/due_back_reminder.txt')  # Loaded once, not per message
+    with get_connection() as mail:
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return sent
+            mail.send_messages([reminder_message(row, template) for row in batch])
+            last_id = batch[-1]['id']
+            # Just the ones mailed, stale notices in the same id range are skip_stale_reminders()' job
+            sent += unsent.filter(id__in=[row['id'] for row in batch]).update(sent_at=timezone.now())
+            if progress:
+                progress(sent)
@@ -0,0 +1,38 @@
+"""Resolves which role groups a user belongs to, once per request."""
+
+# Group names used across the site
+ADMIN = 'Admin'
+MECHANICS = 'Mechanics'
+CUSTOMER = 'Customer'
+
+_CACHE_ATTR = '_catalog_role_names'
+
+
+def get_roles(user):
+    """
+    Returns a frozenset of the user's group names.
+
+    The groups are loaded with a single query and remembered on the user object. Since
+    request.user is built fresh for every request, this means one group lookup per request
+    no matter how many permission checks the page runs.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, _CACHE_ATTR, None)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, _CACHE_ATTR, roles)
+    return roles
+
+
+def has_role(user, *names):
+    """True if the user is in any of the given groups."""
+    return not get_roles(user).isdisjoint(names)
+
+
+def invalidate_roles(user):
+    """Forgets the remembered groups so the next check reloads them."""
+    try:
+        delattr(user, _CACHE_ATTR)
+    except AttributeError:
+        pass
@@ -0,0 +1,192 @@
+"""
+Full-text search over cars and owners.
+
+On SQLite the text lives in two FTS5 tables, catalog_car_search (plate, VIN, owner name and
+phone, make and model) and catalog_owner_search (name and phone), keyed by the row's primary
+key. They're created after migrate, kept in step by the receivers in signals.py and can be
+rebuilt from scratch with ``manage.py rebuild_search_index``. Results are ranked with bm25,
+so a plate or VIN hit beats an owner name that happens to match.
+
+Other databases (or a SQLite built without FTS5) fall back to icontains lookups, which
+are correct but scan the table.
+"""
+
+# Standard library imports
+import re
+
+# Django core imports
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+# Local application imports
+from .models import CarInstance, Owner
+
+_TOKEN = re.compile(r'\w+')
+
+
+class SearchIndex:
+    """One FTS5 table mirroring ``model``, one column per ORM lookup in ``columns``."""
+
+    def __init__(self, table, model, columns, weights):
+        self.table = table
+        self.model = model
+        self.columns = columns  # FTS column -> ORM lookup
+        self.weights = weights  # bm25 weight per column, same order as columns
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+            f'USING fts5({", ".join(self.columns)}, prefix=\'2 3\')'
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def rows(self, queryset):
+        """The SELECT that feeds the index, as (sql, params)."""
+        rows = queryset.order_by().values_list('pk', *self.columns.values())
+        return rows.query.sql_with_params()
+
+    def refresh(self, queryset):
+        """Re-indexes the rows in ``queryset`` with one DELETE and one INSERT ... SELECT."""
+        if not search_enabled():
+            return
+        ids_sql, ids_params = queryset.order_by().values('pk').query.sql_with_params()
+        rows_sql, rows_params = self.rows(queryset)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({ids_sql})', ids_params)
+            cursor.execute(f'INSERT INTO {self.table}(rowid, {", ".join(self.columns)}) {rows_sql}', rows_params)
+
+    def remove(self, pk):
+        if not search_enabled():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        """Drops and refills the whole table, returns the number of rows indexed."""
+        with connection.cursor() as cursor:
+            self.drop(cursor)
+            self.create(cursor)
+            rows_sql, rows_params = self.rows(self.model.objects.all())
+            cursor.execute(f'INSERT INTO {self.table}(rowid, {", ".join(self.columns)}) {rows_sql}', rows_params)
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, query, limit):
+        """Primary keys matching ``query``, best match first."""
+        match = fts_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, {weights}) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def fallback_ids(self, query, limit):
+        """Same contract as ranked_ids() for databases without FTS5: every word must match some column."""
+        condition = Q()
+        for token in _TOKEN.findall(query):
+            token_condition = Q()
+            for lookup in self.columns.values():
+                token_condition |= Q(**{f'{lookup}__icontains': token})
+            condition &= token_condition
+        if not condition:
+            return []
+        return list(self.model.objects.filter(condition).order_by('pk').values_list('pk', flat=True)[:limit])
+
+
+CAR_INDEX = SearchIndex(
+    'catalog_car_search',
+    CarInstance,
+    {
+        'license_plate': 'license_plate',
+        'vin': 'vinNum',
+        'owner_first_name': 'owner__first_name',
+        'owner_last_name': 'owner__last_name',
+        'owner_phone': 'owner__phone_num',
+        'make': 'car__manuName',
+        'model': 'car__carModel',
+    },
+    weights=[10.0, 10.0, 2.0, 3.0, 5.0, 1.0, 1.0],
+)
+
+OWNER_INDEX = SearchIndex(
+    'catalog_owner_search',
+    Owner,
+    {
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'phone': 'phone_num',
+    },
+    weights=[2.0, 3.0, 5.0],
+)
+
+INDEXES = (CAR_INDEX, OWNER_INDEX)
+
+_enabled = {}  # Database alias -> whether FTS5 works there, checked once per process
+
+
+def search_enabled():
+    """True when the default database is SQLite with FTS5 compiled in."""
+    if connection.alias not in _enabled:
+        enabled = False
+        if connection.vendor == 'sqlite':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+                    enabled = bool(cursor.fetchone()[0])
+            except DatabaseError:
+                enabled = False
+        _enabled[connection.alias] = enabled
+    return _enabled[connection.alias]
+
+
+def fts_query(query):
+    """
+    Turns what the user typed into a safe FTS5 query: every word must match, as a prefix.
+
+    "smith 555" becomes '"smith"* AND "555"*'. Quoting each word keeps FTS5 syntax
+    (AND, NEAR, column filters, stray quotes) out of user input.
+    """
+    return ' AND '.join(f'"{token}"*' for token in _TOKEN.findall(query))
+
+
+def create_search_tables(**kwargs):
+    """post_migrate hook, creates the FTS tables if they aren't there yet (and fills new ones)."""
+    if not search_enabled():
+        return
+    existing = set(connection.introspection.table_names())
+    for index in INDEXES:
+        if index.table not in existing:
+            index.rebuild()
+
+
+def rebuild_search_index():
+    """Rebuilds every search table, returns {table: rows indexed}. Does nothing without FTS5."""
+    if not search_enabled():
+        return {}
+    return {index.table: index.rebuild() for index in INDEXES}
+
+
+def _ordered(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def search(query, car_limit=50, owner_limit=20):
+    """Returns (cars, owners) matching ``query``, each list best match first."""
+    if search_enabled():
+        car_ids = CAR_INDEX.ranked_ids(query, car_limit)
+        owner_ids = OWNER_INDEX.ranked_ids(query, owner_limit)
+    else:
+        car_ids = CAR_INDEX.fallback_ids(query, car_limit)
+        owner_ids = OWNER_INDEX.fallback_ids(query, owner_limit)
+    cars = _ordered(CarInstance.objects.for_list(), car_ids) if car_ids else []
+    owners = _ordered(Owner.objects.all(), owner_ids) if owner_ids else []
+    return cars, owners
@@ -1,14 +1,143 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Owner
+from .models import Owner, FooterContent, CarInstance, CarMake, VehicleType, FleetStatistic
+from .caching import bump_cache_version, invalidate_footer_content
+from .roles import invalidate_roles
+from .middleware import install_query_recorder
+from .search import CAR_INDEX, OWNER_INDEX
+from . import history, owners, stats
 
 @receiver(post_save, sender=User)
-def create_or_update_owner(sender, instance, created, **kwargs):
+def create_or_update_owner(sender, instance, created, update_fields=None, **kwargs):
+    # save_user_and_owner() writes the owner itself
+    if getattr(instance, owners.PROVISIONING, False):
+        return
+    # e.g. the last_login update on every login
+    if update_fields is not None and not set(owners.NAME_FIELDS) & set(update_fields):
+        return
+    owners.sync_owner_name(instance, created)
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_cached_roles(sender, instance, **kwargs):
+    # Group changes made through the admin or forms drop the user's remembered roles
+    if isinstance(instance, User):
+        invalidate_roles(instance)
+    bump_cache_version('accounts')
+
+@receiver([post_save, post_delete], sender=FooterContent)
+def refresh_footer_cache(sender, **kwargs):
+    # Covers edit_footer_content and FooterContentAdmin alike
+    invalidate_footer_content()
+    bump_cache_version('footer')
+
+@receiver([post_save, post_delete], sender=CarInstance)
+@receiver([post_save, post_delete], sender=Owner)
+@receiver([post_save, post_delete], sender=CarMake)
+@receiver([post_save, post_delete], sender=VehicleType)
+def expire_fleet_pages(sender, **kwargs):
+    # Cached dashboards and car rows include the fleet's data
+    bump_cache_version('fleet')
+
+# The user fields cached pages show (names in the header and lists) or depend on
+ACCOUNT_PAGE_FIELDS = {'username', 'first_name', 'last_name', 'is_active'}
+
+@receiver(post_save, sender=User)
+def expire_account_pages(sender, update_fields=None, **kwargs):
+    # Not on the last_login save every login makes, that would empty the page cache each time
+    if update_fields is not None and not ACCOUNT_PAGE_FIELDS & set(update_fields):
+        return
+    bump_cache_version('accounts')
+
+@receiver(post_delete, sender=User)
+def expire_deleted_account_pages(sender, **kwargs):
+    bump_cache_version('accounts')
+
+# Search index upkeep. Bulk writes (import_fleet, queryset updates) skip these and refresh the index themselves
+@receiver(post_save, sender=CarInstance)
+def index_car(sender, instance, **kwargs):
+    CAR_INDEX.refresh(CarInstance.objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=CarInstance)
+def unindex_car(sender, instance, **kwargs):
+    CAR_INDEX.remove(instance.pk)
+
+@receiver(post_save, sender=Owner)
+def index_owner(sender, instance, **kwargs):
+    # The owner's name and phone are indexed with each of their cars too
+    OWNER_INDEX.refresh(Owner.objects.filter(pk=instance.pk))
+    CAR_INDEX.refresh(CarInstance.objects.filter(owner=instance))
+
+@receiver(post_delete, sender=Owner)
+def unindex_owner(sender, instance, **kwargs):
+    OWNER_INDEX.remove(instance.pk)
+
+@receiver(post_save, sender=CarMake)
+def index_make(sender, instance, **kwargs):
+    CAR_INDEX.refresh(CarInstance.objects.filter(car=instance))
+
+# Fleet statistics upkeep, see catalog/stats.py. Bulk writes rebuild the stats themselves
+@receiver(pre_save, sender=CarInstance)
+def remember_car_stat_keys(sender, instance, **kwargs):
+    # Read from the saved row, the instance may already hold the new values. The status
+    # history (catalog/history.py) works out what changed from the same read
+    row = stats.stored_car(instance.pk) if instance.pk else None
+    instance._fleet_stat_keys = stats.stored_car_keys(instance.pk, row) if row else set()
+    instance._stored_history_values = history.stored_values(row)
+
+@receiver(post_save, sender=CarInstance)
+def count_car(sender, instance, **kwargs):
+    after = stats.car_keys(instance.car_id, instance.status, instance.mechanic_stat_id)
+    stats.move_counts(getattr(instance, '_fleet_stat_keys', set()), after)
+
+@receiver(post_save, sender=CarInstance)
+def log_status_change(sender, instance, **kwargs):
+    history.record_changes(instance, getattr(instance, '_stored_history_values', None))
+
+@receiver(post_delete, sender=CarInstance)
+def uncount_car(sender, instance, **kwargs):
+    stats.move_counts(stats.car_keys(instance.car_id, instance.status, instance.mechanic_stat_id), set())
+    history.forget_car(instance.pk)
+
+@receiver(post_save, sender=Owner)
+def count_owner(sender, instance, created, **kwargs):
     if created:
-        Owner.objects.create(user=instance, first_name=instance.first_name, last_name=instance.last_name)
-    else:
-        if hasattr(instance, 'owner'):
-            instance.owner.first_name = instance.first_name
-            instance.owner.last_name = instance.last_name
-            instance.owner.save()
\ No newline at end of file
+        stats.move_counts(set(), {('owners', stats.TOTAL)})
+
+@receiver(post_delete, sender=Owner)
+def uncount_owner(sender, instance, **kwargs):
+    stats.move_counts({('owners', stats.TOTAL)}, set())
+
+@receiver(pre_save, sender=CarMake)
+def remember_vehicle_type(sender, instance, **kwargs):
+    instance._old_vehicle_type_id = CarMake.objects.filter(pk=instance.pk).values_list('vehicleType_id', flat=True).first() if instance.pk else None
+
+@receiver(post_save, sender=CarMake)
+def move_vehicle_type_counts(sender, instance, created, **kwargs):
+    # Every car of the make changes vehicle type with it
+    if not created and instance._old_vehicle_type_id != instance.vehicleType_id:
+        cars = CarInstance.objects.filter(car=instance).count()
+        stats.move_between('vehicle_type', instance._old_vehicle_type_id, instance.vehicleType_id, cars)
+
+@receiver(post_delete, sender=User)
+def unassign_mechanic_counts(sender, instance, **kwargs):
+    # The user's cars were unassigned with a bulk SET NULL, which sends no car signals
+    stored = FleetStatistic.objects.filter(dimension='mechanic', key=str(instance.pk)).values_list('count', flat=True).first()
+    stats.move_between('mechanic', instance.pk, None, stored or 0)
+
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    # PerformanceMiddleware counts queries on every thread's connections, async views use several
+    install_query_recorder(connection)
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # The sqlite-wal database profile tunes every new connection, see settings.py
+    pragmas = getattr(settings, 'CATALOG_SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,150 @@
+"""
+Fleet statistics kept in the FleetStatistic table, so the dashboards read counts instead of
+counting.
+
+Dimensions and their keys:
+
+    cars          'all'                  every car
+    owners        'all'                  every owner
+    status        CarInstance status     cars per status code
+    vehicle_type  VehicleType id or ''   cars per vehicle type of their make
+    mechanic      User id or ''          cars per assigned mechanic
+
+Saving or deleting a car or owner moves the affected counts by one, and changing a make's
+vehicle type or deleting a mechanic moves their cars over in one go (receivers in
+signals.py). Bulk writes skip those signals, so they call rebuild_fleet_stats() afterwards,
+and ``manage.py rebuild_fleet_stats`` rebuilds the table from scratch and reports any drift.
+Overdue counts depend on today's date, so they're still counted (on an index) when asked.
+"""
+
+# Django core imports
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+# Local application imports
+from .models import CarInstance, CarMake, FleetStatistic, Owner
+
+TOTAL = 'all'
+DIMENSIONS = ('cars', 'owners', 'status', 'vehicle_type', 'mechanic')
+
+
+def _key(value):
+    return '' if value is None else str(value)
+
+
+def car_keys(car_id, status, mechanic_id):
+    """The (dimension, key) pairs a car with these values is counted under."""
+    vehicle_type_id = None
+    if car_id is not None:
+        vehicle_type_id = CarMake.objects.filter(pk=car_id).values_list('vehicleType_id', flat=True).first()
+    return {
+        ('cars', TOTAL),
+        ('status', _key(status)),
+        ('vehicle_type', _key(vehicle_type_id)),
+        ('mechanic', _key(mechanic_id)),
+    }
+
+
+def stored_car(pk):
+    """The saved row's vehicle type, status and mechanic as a dict, None if it isn't saved."""
+    return CarInstance.objects.filter(pk=pk).values('car__vehicleType_id', 'status', 'mechanic_stat_id').first()
+
+
+def stored_car_keys(pk, row=None):
+    """The keys a car is counted under right now, read from its saved row (empty if it isn't saved)."""
+    if row is None:
+        row = stored_car(pk)
+    if row is None:
+        return set()
+    return {
+        ('cars', TOTAL),
+        ('status', _key(row['status'])),
+        ('vehicle_type', _key(row['car__vehicleType_id'])),
+        ('mechanic', _key(row['mechanic_stat_id'])),
+    }
+
+
+def move_counts(before, after):
+    """Takes one off every key only in ``before`` and adds one to every key only in ``after``."""
+    changes = [(key, -1) for key in before - after] + [(key, 1) for key in after - before]
+    if not changes:
+        return
+    with transaction.atomic():
+        for (dimension, key), delta in changes:
+            _bump(dimension, key, delta)
+
+
+def move_between(dimension, old_key, new_key, count):
+    """Moves ``count`` from one key to another, for changes that move many cars at once."""
+    if not count or old_key == new_key:
+        return
+    with transaction.atomic():
+        _bump(dimension, _key(old_key), -count)
+        _bump(dimension, _key(new_key), count)
+
+
+def _bump(dimension, key, delta):
+    rows = FleetStatistic.objects.filter(dimension=dimension, key=key)
+    if rows.update(count=F('count') + delta):
+        return
+    # A key seen for the first time. Until the table has been built once there's nothing
+    # to add to, the first read rebuilds it with this change included.
+    if not FleetStatistic.objects.filter(dimension='cars', key=TOTAL).exists():
+        return
+    try:
+        with transaction.atomic():
+            FleetStatistic.objects.create(dimension=dimension, key=key, count=delta)
+    except IntegrityError:  # Created by another process in the meantime
+        rows.update(count=F('count') + delta)
+
+
+def count_fleet():
+    """Counts everything from the source tables, {(dimension, key): count}. One GROUP BY per dimension."""
+    counts = {
+        ('cars', TOTAL): CarInstance.objects.count(),
+        ('owners', TOTAL): Owner.objects.count(),
+    }
+    cars = CarInstance.objects.order_by()  # No default ordering, or due_back ends up in the GROUP BY
+    for dimension, lookup in (('status', 'status'), ('vehicle_type', 'car__vehicleType_id'), ('mechanic', 'mechanic_stat_id')):
+        for value, total in cars.values_list(lookup).annotate(total=Count('id')):
+            counts[(dimension, _key(value))] = total
+    return counts
+
+
+def stored_stats():
+    return {(dimension, key): count for dimension, key, count in FleetStatistic.objects.values_list('dimension', 'key', 'count')}
+
+
+def rebuild_fleet_stats():
+    """Replaces the whole table with fresh counts, returns {(dimension, key): (stored, actual)} for every mismatch."""
+    with transaction.atomic():
+        stored = stored_stats()
+        actual = count_fleet()
+        FleetStatistic.objects.all().delete()
+        FleetStatistic.objects.bulk_create(
+            FleetStatistic(dimension=dimension, key=key, count=count) for (dimension, key), count in actual.items()
+        )
+    drift = {}
+    for key in stored.keys() | actual.keys():
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift[key] = (stored.get(key, 0), actual.get(key, 0))
+    return drift
+
+
+def fleet_stats():
+    """
+    All the stored counts as {dimension: {key: count}}, one small query whatever the fleet size.
+
+    Builds the table first if it has never been built (e.g. right after migrate).
+    """
+    stored = stored_stats()
+    if ('cars', TOTAL) not in stored:
+        rebuild_fleet_stats()
+        stored = stored_stats()
+    stats = {dimension: {} for dimension in DIMENSIONS}
+    for (dimension, key), count in stored.items():
+        if count and dimension in stats:
+            stats[dimension][key] = count
+    stats['cars'].setdefault(TOTAL, 0)
+    stats['owners'].setdefault(TOTAL, 0)
+    return stats
@@ -2,10 +2,11 @@
 
 from django import template
 
+from catalog.caching import visit_count as visit_count_sentence
+
 register = template.Library()
 
-@register.filter
-def get_item(user_list, user_id):
-    """Retrieve the username from the user list based on the user_id."""
-    user = next((user for user in user_list if user.id == user_id), None)
-    return user.username if user else "Unknown User"  # Return a default message if user is not found
+@register.simple_tag(takes_context=True)
+def visit_count(context, num_visits):
+    """The footer's "You have visited this page N times." line, see caching.cached_page."""
+    return visit_count_sentence(context.get('request'), num_visits)
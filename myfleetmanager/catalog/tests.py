@@ -1,3 +1,655 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import re
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+
+from . import bulk, history, search, stats, vin
+from .admin import BatchProgress
+from .analytics import fleet_analytics
+from .benchmark import seed_fleet
+from .caching import bump_cache_version, cache_version
+from .context_processors import cache_versions
+from .forms import CarInstanceForm
+from .middleware import PerformanceMiddleware, QueryBudgetExceeded, StatusHistoryMiddleware, query_budget
+from .models import CarInstance, CarMake, CarStatusChange, DueBackReminder, Owner, VehicleType
+from .owners import create_users, save_user_and_owner
+from .pagination import InvalidCursor, KeysetPaginator
+from .reminders import queue_reminders, send_reminders, skip_stale_reminders
+
+
+@override_settings(CATALOG_ENFORCE_QUERY_BUDGETS=True, DEBUG=False)
+class QueryBudgetTests(TestCase):
+    """The busiest list and detail pages stay within their query budgets on a seeded fleet."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.samples = seed_fleet(300)
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.client.force_login(self.samples['users']['admin'])
+
+    def test_car_list_within_budget(self):
+        response = self.client.get(reverse('cars'))
+        self.assertEqual(response.status_code, 200)
+        # A filtered page and the one after it too
+        response = self.client.get(reverse('cars'), {'status': 'M'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('next_page_query', response.context)
+        self.assertEqual(self.client.get(f"{reverse('cars')}?{response.context['next_page_query']}").status_code, 200)
+
+    def test_owner_detail_within_budget(self):
+        owner = CarInstance.objects.exclude(owner=None).order_by('id').first().owner
+        response = self.client.get(reverse('owner-detail', args=[owner.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_feedback_list_within_budget(self):
+        self.assertEqual(self.client.get(reverse('feedback_list')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('feedback_list'), {'category': 'general'}).status_code, 200)
+
+    def test_over_budget_view_raises(self):
+        @query_budget(1)
+        def greedy_view(request):
+            for _ in range(3):
+                CarInstance.objects.count()
+            return HttpResponse('ok')
+
+        def get_response(request):
+            request.resolver_match = ResolverMatch(greedy_view, (), {}, url_name='greedy')
+            return greedy_view(request)
+
+        middleware = PerformanceMiddleware(get_response)
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(RequestFactory().get('/greedy/'))
+
+    @override_settings(CATALOG_ENFORCE_QUERY_BUDGETS=False)
+    def test_over_budget_view_only_logs_when_not_enforced(self):
+        @query_budget(1)
+        def greedy_view(request):
+            CarInstance.objects.count()
+            CarInstance.objects.count()
+            return HttpResponse('ok')
+
+        def get_response(request):
+            request.resolver_match = ResolverMatch(greedy_view, (), {}, url_name='greedy')
+            return greedy_view(request)
+
+        with self.assertLogs('catalog.performance', 'WARNING'):
+            response = PerformanceMiddleware(get_response)(RequestFactory().get('/greedy/'))
+        self.assertEqual(response.status_code, 200)
+
+
+class ImportFleetTests(TestCase):
+    def import_csv(self, kind, text):
+        directory = Path(tempfile.mkdtemp())
+        path = directory / f'{kind}.csv'
+        path.write_text(text)
+        call_command('import_fleet', kind, str(path), stdout=io.StringIO())
+        return directory / f'{kind}.rejects.csv'
+
+    def test_reimporting_owners_without_a_phone_updates_them(self):
+        owners = 'first_name,last_name,phone_num,address\nAnn,Lee,,1 Road\nBob,Ray,5551234567,2 Road\n'
+        self.import_csv('owners', owners)
+        self.import_csv('owners', owners.replace('1 Road', '9 Road'))
+        self.assertEqual(Owner.objects.filter(first_name='Ann', phone_num=None).count(), 1)
+        self.assertEqual(Owner.objects.get(first_name='Ann').address, '9 Road')
+        self.assertEqual(Owner.objects.count(), 2)
+
+        # Cars find a phone-less owner too
+        rejects = self.import_csv('cars', 'license_plate,modelYear,color,owner_first_name,owner_last_name,owner_phone_num\nAB1,2020,red,Ann,Lee,\n')
+        self.assertFalse(rejects.exists())
+        self.assertEqual(CarInstance.objects.get(license_plate='AB1').owner.first_name, 'Ann')
+
+    def test_reimporting_cars_only_updates_the_columns_in_the_file(self):
+        self.import_csv('owners', 'first_name,last_name,phone_num\nAnn,Lee,5551230001\n')
+        User.objects.create_user('mick', first_name='Mick')
+        self.import_csv('cars', (
+            'vinNum,license_plate,color,status,due_back,owner_first_name,owner_last_name,owner_phone_num,mechanic\n'
+            '1HGCM82633A004352,AB1,red,M,2024-05-10,Ann,Lee,5551230001,mick\n'
+        ))
+        rejects = self.import_csv('cars', 'vinNum,color\n1HGCM82633A004352,blue\n')
+        self.assertFalse(rejects.exists())
+        car = CarInstance.objects.get()
+        self.assertEqual(car.color, 'blue')
+        self.assertEqual((car.status, car.due_back, car.license_plate), ('M', datetime.date(2024, 5, 10), 'AB1'))
+        self.assertEqual((car.owner.first_name, car.mechanic_stat.username), ('Ann', 'mick'))
+
+        # A new car still needs the columns it's missing
+        rejects = self.import_csv('cars', 'vinNum,color\n,green\n')
+        self.assertIn('cannot be blank', rejects.read_text())
+
+        # A blank status keeps the car's, a blank due date clears it
+        self.import_csv('cars', 'vinNum,status,due_back\n1HGCM82633A004352,,\n')
+        car.refresh_from_db()
+        self.assertEqual((car.status, car.due_back), ('M', None))
+
+    def test_boolean_columns_accept_common_spellings(self):
+        rejects = self.import_csv('owners', (
+            'first_name,last_name,phone_num,has_insurance\n'
+            'Ann,Lee,5551230001,yes\nBob,Ray,5551230002,false\nCy,Ng,5551230003,TRUE\n'
+            'Di,Po,5551230004,0\nEd,Oh,5551230005,\nFay,Ux,5551230006,maybe\n'
+        ))
+        insured = dict(Owner.objects.values_list('first_name', 'has_insurance'))
+        self.assertEqual(insured, {'Ann': True, 'Bob': False, 'Cy': True, 'Di': False, 'Ed': False})
+        self.assertIn('maybe', rejects.read_text())
+
+
+class SharedCacheTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_version_bumps_reach_other_processes(self):
+        # Another worker has its own cache objects, pointed at the same files
+        location = settings.CACHES['shared']['LOCATION']
+        other_worker = FileBasedCache(location, {})
+        version = cache_version('fleet')
+        self.assertEqual(other_worker.get('catalog:version:fleet'), version)
+        bump_cache_version('fleet')
+        self.assertNotEqual(other_worker.get('catalog:version:fleet'), version)
+        self.assertEqual(other_worker.get('catalog:version:fleet'), cache_version('fleet'))
+
+    def test_templates_read_each_version_once_per_request(self):
+        versions = cache_versions(RequestFactory().get('/'))['cache_versions']
+        with mock.patch('catalog.context_processors.cache_version', return_value=1) as lookup:
+            for _ in range(20):
+                versions['fleet'], versions['accounts']
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_logging_in_keeps_the_account_pages(self):
+        user = User.objects.create_user('ann', first_name='Ann', password='pw')
+        version = cache_version('accounts')
+        self.assertTrue(self.client.login(username='ann', password='pw'))  # Saves last_login
+        self.assertEqual(cache_version('accounts'), version)
+        user.first_name = 'Anne'
+        user.save(update_fields=['first_name'])
+        self.assertNotEqual(cache_version('accounts'), version)
+
+    def test_renaming_a_mechanic_keeps_the_analytics(self):
+        mechanic = User.objects.create_user('mick', first_name='Mick')
+        CarInstance.objects.create(license_plate='AN1', mechanic_stat=mechanic)
+        self.assertIn('mick', [row['label'] for row in fleet_analytics()['mechanic']])
+        mechanic.username = 'mickey'
+        mechanic.save()
+        with mock.patch('catalog.analytics.compute_analytics') as compute_analytics:
+            labels = [row['label'] for row in fleet_analytics()['mechanic']]
+        compute_analytics.assert_not_called()
+        self.assertIn('mickey', labels)
+
+    def test_warm_analytics_fills_the_shared_cache(self):
+        call_command('warm_analytics', stdout=io.StringIO())
+        with mock.patch('catalog.analytics.compute_analytics') as compute_analytics:
+            analytics = fleet_analytics()
+        compute_analytics.assert_not_called()
+        self.assertEqual(analytics['total'], CarInstance.objects.count())
+
+
+class AsyncPageCacheTests(TransactionTestCase):
+    """The async dashboards are cached like their sync counterparts (async views need a real transaction)."""
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.samples = seed_fleet(20)
+
+    def test_async_admin_dashboard_is_cached(self):
+        self.client.force_login(self.samples['users']['admin'])
+        # The first visit sets the CSRF cookie signed in pages are keyed on, the second is cached
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('async_admin_dashboard')).status_code, 200)
+        with mock.patch('catalog.async_views.fleet_stats') as fleet_stats:
+            response = self.client.get(reverse('async_admin_dashboard'))
+        fleet_stats.assert_not_called()
+        self.assertIn(b'visited this page 3 times.', response.content)
+
+    @override_settings(DEBUG=True, CATALOG_PAGE_CACHE=False)
+    def test_async_view_queries_are_counted(self):
+        # The gathered queries run on worker threads' connections, they count all the same
+        self.async_client.force_login(self.samples['users']['admin'])
+
+        async def get():
+            return await self.async_client.get(reverse('async_admin_dashboard'))
+
+        response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        # The session and user, then fleet stats, overdue cars, visits, footer and charts in the workers
+        queries = int(re.search(r'queries=(\d+)', response['X-Catalog-Perf']).group(1))
+        self.assertGreaterEqual(queries, 5)
+
+    def test_async_home_page_is_cached_for_visitors(self):
+        self.assertEqual(self.client.get(reverse('async_index')).status_code, 200)
+        with mock.patch('catalog.async_views.get_footer_content') as get_footer_content:
+            response = self.client.get(reverse('async_index'))
+        get_footer_content.assert_not_called()
+        self.assertIn(b'visited this page 2 times.', response.content)
+
+
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.samples = seed_fleet(250)
+
+    def test_batch_progress_is_reported_to_the_admin(self):
+        admin_user = self.samples['users']['admin']
+        progress = BatchProgress(RequestFactory().get('/'), 'Set status')
+        progress.request.user = admin_user
+        updated = bulk.update_cars(CarInstance.objects.all(), progress=progress, batch_size=100, user=admin_user, status='M')
+        self.assertEqual(updated, CarInstance.objects.count())
+        self.assertEqual((progress.batches, progress.done), (3, updated))
+        self.assertEqual(progress.summary(), ' in 3 batches')
+
+    def test_admin_action_messages_the_result(self):
+        self.client.force_login(User.objects.create_superuser('staff', first_name='Staff', password='x'))
+        cars = list(CarInstance.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        response = self.client.post(reverse('admin:catalog_carinstance_changelist'), {
+            'action': 'set_status', 'status': 'R', '_selected_action': cars,
+        }, follow=True)
+        self.assertContains(response, 'updated 5 cars.')
+        self.assertEqual(CarInstance.objects.filter(pk__in=cars, status='R').count(), 5)
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.today = datetime.date(2024, 5, 10)
+        self.owner_user = owner_user = User.objects.create_user('owner', 'owner@example.com', first_name='Olive')
+        mechanic = User.objects.create_user('mechanic', 'mechanic@example.com', first_name='Mick')
+        owner = Owner.objects.get(user=owner_user)  # Made along with the login, see owners.py
+        self.upcoming = CarInstance.objects.create(license_plate='UP1', owner=owner, due_back=self.today + datetime.timedelta(days=1))
+        self.overdue = CarInstance.objects.create(
+            license_plate='OD1', owner=owner, mechanic_stat=mechanic, due_back=self.today - datetime.timedelta(days=2),
+        )
+
+    def test_queueing_twice_adds_nothing(self):
+        first = queue_reminders(self.today)
+        self.assertEqual(first, {DueBackReminder.UPCOMING: 1, DueBackReminder.OVERDUE: 2, DueBackReminder.ESCALATED: 0})
+        self.assertEqual(sum(queue_reminders(self.today).values()), 0)
+        self.assertEqual(DueBackReminder.objects.count(), 3)
+
+        self.assertEqual(send_reminders(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        queue_reminders(self.today)
+        self.assertEqual(send_reminders(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_stale_notices_in_a_sent_batch_stay_unsent(self):
+        def notice(car, level, due_back):
+            return DueBackReminder.objects.create(car=car, recipient=self.owner_user, level=level, due_back=due_back)
+
+        notice(self.upcoming, DueBackReminder.UPCOMING, self.upcoming.due_back)
+        stale = notice(self.overdue, DueBackReminder.UPCOMING, self.today)  # Its date has moved since
+        notice(self.overdue, DueBackReminder.OVERDUE, self.overdue.due_back)
+        self.assertEqual(send_reminders(), 2)
+        stale.refresh_from_db()
+        self.assertIsNone(stale.sent_at)
+        self.assertEqual(skip_stale_reminders(), 1)
+
+    def test_emails_are_not_html_escaped(self):
+        self.owner_user.first_name = "O'Brien"
+        self.owner_user.save()
+        queue_reminders(self.today)
+        send_reminders()
+        self.assertIn("Hello O'Brien,", mail.outbox[0].body)
+
+    def test_moved_due_date_skips_the_old_notice(self):
+        queue_reminders(self.today)
+        self.upcoming.due_back = self.today + datetime.timedelta(days=20)
+        self.upcoming.save()
+        # Even before the stale ones are stamped, they aren't sent
+        self.assertEqual(send_reminders(), 2)
+        self.assertEqual(skip_stale_reminders(), 1)
+        stale = DueBackReminder.objects.get(car=self.upcoming)
+        self.assertIsNone(stale.sent_at)
+        self.assertIsNotNone(stale.skipped_at)
+        self.assertEqual([message.to for message in mail.outbox], [['owner@example.com'], ['mechanic@example.com']])
+
+        # Moving it back into range re-arms it, and the new notice goes out
+        self.upcoming.due_back = self.today + datetime.timedelta(days=2)
+        self.upcoming.save()
+        self.assertEqual(queue_reminders(self.today)[DueBackReminder.UPCOMING], 1)
+        self.assertEqual(send_reminders(), 1)
+
+
+class OwnerProvisioningTests(TestCase):
+    def test_new_user_gets_an_owner(self):
+        owner = save_user_and_owner(User(username='ann', first_name='Ann', last_name='Lee'), password='pw', phone_num='5551230001')
+        self.assertEqual((owner.first_name, owner.last_name, owner.phone_num), ('Ann', 'Lee', '5551230001'))
+        self.assertTrue(owner.user.check_password('pw'))
+        self.assertEqual(Owner.objects.count(), 1)
+
+    def test_saving_again_only_updates_what_changed(self):
+        user = User(username='ann', first_name='Ann', last_name='Lee')
+        owner = save_user_and_owner(user, address='1 Road')
+        with self.assertNumQueries(4):  # SAVEPOINT, the user UPDATE, the owner lookup, RELEASE
+            save_user_and_owner(user, address='1 Road')
+        save_user_and_owner(user, first_name='Anne', address='2 Road')
+        owner.refresh_from_db()
+        self.assertEqual((owner.first_name, owner.address), ('Anne', '2 Road'))
+        self.assertEqual(User.objects.get(pk=user.pk).first_name, 'Anne')
+
+    def test_claims_an_owner_entered_before_the_login(self):
+        walk_in = Owner.objects.create(first_name='Bob', last_name='Ray', phone_num='5551230002')
+        owner = save_user_and_owner(User(username='bob'), first_name='Bob', last_name='Ray', phone_num='5551230002')
+        self.assertEqual(owner.pk, walk_in.pk)
+        self.assertEqual(owner.user.username, 'bob')
+        self.assertEqual(Owner.objects.count(), 1)
+
+        # Nobody else can claim it now
+        with self.assertRaises(ValidationError):
+            save_user_and_owner(User(username='bob2'), first_name='Bob', last_name='Ray', phone_num='5551230002')
+        self.assertFalse(User.objects.filter(username='bob2').exists())
+
+    def test_users_saved_elsewhere_still_get_an_owner(self):
+        user = User.objects.create_user('cy', first_name='Cy', last_name='Ng')
+        self.assertEqual(Owner.objects.get(user=user).first_name, 'Cy')
+        user.last_name = 'Wong'
+        user.save()
+        self.assertEqual(Owner.objects.get(user=user).last_name, 'Wong')
+
+    def test_create_users_in_batches(self):
+        rows = [{'username': f'u{i}', 'first_name': f'F{i}', 'last_name': 'L', 'phone_num': f'555000{i:04}'} for i in range(5)]
+        self.assertEqual(create_users(rows, batch_size=2), 5)
+        self.assertEqual(Owner.objects.filter(user__username__startswith='u').count(), 5)
+        self.assertEqual(Owner.objects.get(user__username='u3').phone_num, '5550000003')
+
+
+class StatusHistoryTests(TransactionTestCase):
+    """Changes are written once their transaction commits, so these need real transactions."""
+
+    def setUp(self):
+        self.mechanic = User.objects.create_user('mick', first_name='Mick')
+        self.car = CarInstance.objects.create(license_plate='HS1', status='A')
+
+    def changes(self, car=None):
+        return list(CarStatusChange.objects.filter(car=car or self.car).order_by('pk').values_list('field', 'old_value', 'new_value'))
+
+    def test_only_real_changes_are_logged(self):
+        self.assertEqual(self.changes(), [('status', None, 'A'), ('mechanic', None, '')])
+        self.car.save()  # Same values, nothing new
+        self.car.status = 'M'
+        self.car.mechanic_stat = self.mechanic
+        self.car.save()
+        self.assertEqual(self.changes()[2:], [('status', 'A', 'M'), ('mechanic', '', str(self.mechanic.pk))])
+
+    def test_rolled_back_changes_are_not_logged(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.car.status = 'S'
+            self.car.save()
+            raise RuntimeError
+        self.assertEqual(len(self.changes()), 2)
+
+    def test_one_insert_for_a_whole_request(self):
+        cars = [CarInstance.objects.create(license_plate=f'HS{i}', status='A') for i in range(2, 6)]
+        with CaptureQueriesContext(connection) as queries, history.collect_changes(self.mechanic):
+            for car in cars:
+                car.status = 'R'
+                car.save()
+        inserts = [query for query in queries if query['sql'].startswith(f'INSERT INTO "{CarStatusChange._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(CarStatusChange.objects.filter(new_value='R', changed_by=self.mechanic).count(), 4)
+
+    def test_async_requests_collect_changes_too(self):
+        def set_status(status):
+            self.car.status = status
+            self.car.save()
+
+        async def get_response(request):
+            await sync_to_async(set_status)('R')
+            return HttpResponse('ok')
+
+        middleware = StatusHistoryMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = self.mechanic
+        self.assertEqual(async_to_sync(middleware)(request).status_code, 200)
+        # Tagged with the request's user, so it went through the middleware
+        self.assertTrue(CarStatusChange.objects.filter(car=self.car, new_value='R', changed_by=self.mechanic).exists())
+
+    def test_bulk_updates_log_the_cars_that_change(self):
+        other = CarInstance.objects.create(license_plate='HS2', status='M')
+        bulk.update_cars(CarInstance.objects.filter(pk__in=[self.car.pk, other.pk]), user=self.mechanic, status='M')
+        self.assertEqual(self.changes()[-1], ('status', 'A', 'M'))
+        self.assertEqual(len(self.changes(other)), 2)  # Already M, only its creation
+        self.assertEqual(history.time_in_status(self.car).keys(), {'A', 'M'})
+
+
+class VinTests(TestCase):
+    def with_check_digit(self, vin_number):
+        return vin_number[:8] + vin.check_digit(vin_number) + vin_number[9:]
+
+    def test_known_good_vins(self):
+        honda = vin.decode(' 1hgcm82633a004352 ')
+        self.assertTrue(honda.valid)
+        self.assertEqual((honda.vin, honda.manufacturer, honda.country, honda.model_year), ('1HGCM82633A004352', 'Honda', 'United States', 2003))
+        # The textbook example, its check digit is X
+        self.assertEqual(vin.check_digit('1M8GDM9AXKP042788'), 'X')
+        self.assertEqual(vin.decode('1M8GDM9AXKP042788').model_year, 1989)
+
+    def test_known_bad_vins(self):
+        self.assertIn('it should be 3', vin.decode('1HGCM82643A004352').errors[0])
+        self.assertIn('exactly 17', vin.decode('1HGCM82633A00435').errors[0])
+        self.assertIn("can't contain I, O", vin.decode('1HGCM82633AOI4352').errors[0])
+        self.assertTrue(any('model year' in error for error in vin.decode(self.with_check_digit('1HGCM826X0A004352')).errors))
+
+    def test_north_american_year_cycle_comes_from_position_seven(self):
+        self.assertEqual(vin.decode(self.with_check_digit('1HGCM82603A004352')).model_year, 2003)  # A digit, the 1980 cycle
+        self.assertEqual(vin.decode(self.with_check_digit('1HGCM8A603A004352')).model_year, 2033)  # A letter, the 2010 cycle
+        self.assertEqual(vin.decode(self.with_check_digit('1HGCM8A60AA004352')).model_year, 2010)
+
+    def test_other_vins_take_the_latest_year_not_in_the_future(self):
+        self.assertEqual(vin.model_year('WVWZZZ1JZYW000001', this_year=2024), 2000)
+        self.assertEqual(vin.model_year('WVWZZZ1JZAW000001', this_year=2024), 2010)
+        self.assertEqual(vin.model_year('WVWZZZ1JZ3W000001', this_year=2024), 2003)
+        self.assertEqual(vin.model_year('WVWZZZ1JZ3W000001', this_year=2032), 2033)  # Next year's models
+        # No check digit outside North America, so a "wrong" one is fine
+        info = vin.decode('WVWZZZ1JZYW000001')
+        self.assertTrue(info.valid)
+        self.assertEqual((info.manufacturer, info.country), ('Volkswagen', 'Germany'))
+
+
+class CarInstanceFormTests(TestCase):
+    def setUp(self):
+        self.accord = CarMake.objects.create(manuName='Honda', carModel='Accord')
+
+    def test_make_and_year_are_prefilled_from_the_vin(self):
+        form = CarInstanceForm(instance=CarInstance(vinNum='1HGCM82633A004352'))
+        self.assertEqual(form.initial['modelYear'], '2003')
+        self.assertEqual(form.initial['car'], self.accord)
+
+    def test_blank_make_and_year_come_from_the_vin(self):
+        form = CarInstanceForm(data={'vinNum': '1hgcm82633a004352', 'license_plate': 'AB1', 'color': 'red', 'status': 'A'})
+        self.assertTrue(form.is_valid(), form.errors)
+        car = form.save()
+        self.assertEqual((car.vinNum, car.modelYear, car.car), ('1HGCM82633A004352', '2003', self.accord))
+
+    def test_bad_vin_is_rejected(self):
+        form = CarInstanceForm(data={'vinNum': '1HGCM82643A004352', 'license_plate': 'AB1', 'modelYear': '2003', 'car': self.accord.pk})
+        self.assertFalse(form.is_valid())
+        self.assertIn('vinNum', form.errors)
+
+    def test_cars_saved_with_a_bad_vin_can_still_be_edited(self):
+        car = CarInstance.objects.create(vinNum='1HGCM82643A004352', license_plate='AB1', modelYear='2003', car=self.accord)
+        data = {'vinNum': car.vinNum, 'license_plate': 'AB2', 'color': 'red', 'modelYear': '2003', 'car': self.accord.pk, 'status': 'A'}
+        form = CarInstanceForm(data=data, instance=car)
+        self.assertTrue(form.is_valid(), form.errors)
+        # A different bad VIN is still caught
+        form = CarInstanceForm(data=dict(data, vinNum='1HGCM82653A004352'), instance=car)
+        self.assertFalse(form.is_valid())
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make = CarMake.objects.create(manuName='Honda', carModel='Civic')
+        today = datetime.date(2024, 5, 1)
+        # Repeated dates so the pk tie-break matters, and NULLs mixed in between them
+        for number, days in enumerate([3, None, 1, 3, None, 0, 3, None, 1, 5]):
+            due_back = today + datetime.timedelta(days=days) if days is not None else None
+            CarInstance.objects.create(car=make, license_plate=f'KP{number}', color='red', due_back=due_back)
+
+    def walk(self, queryset, per_page):
+        paginator = KeysetPaginator(queryset, key='due_back', per_page=per_page)
+        rows, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            self.assertLessEqual(len(page), per_page)
+            rows.extend(page)
+            if not page.has_next:
+                return rows
+            cursor = page.next_cursor
+
+    def expected(self):
+        cars = CarInstance.objects.all()
+        keyed = sorted(cars.exclude(due_back=None), key=lambda car: (car.due_back, car.pk))
+        return [car.pk for car in keyed] + sorted(cars.filter(due_back=None).values_list('pk', flat=True))
+
+    def test_every_row_once_with_nulls_last(self):
+        # 7 keyed rows: 1 and 2 split a date, 7 ends right on the last keyed row, 10 is one page
+        for per_page in (1, 2, 3, 7, 10, 50):
+            with self.subTest(per_page=per_page):
+                rows = self.walk(CarInstance.objects.all(), per_page)
+                self.assertEqual([car.pk for car in rows], self.expected())
+
+    def test_values_querysets_page_the_same_way(self):
+        rows = self.walk(CarInstance.objects.values('id', 'due_back'), 4)
+        self.assertEqual([row['id'] for row in rows], self.expected())
+
+    def test_bad_cursors_are_rejected(self):
+        paginator = KeysetPaginator(CarInstance.objects.all(), key='due_back', per_page=2)
+        bad_section = base64.urlsafe_b64encode(json.dumps(['nope', None, 1]).encode()).decode()
+        bad_date = base64.urlsafe_b64encode(json.dumps(['key', 'not a date', 1]).encode()).decode()
+        for cursor in ('!!!', 'bm90IGpzb24', bad_section, bad_date):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+
+class FleetStatsTests(TestCase):
+    def setUp(self):
+        self.suv = VehicleType.objects.create(name='SUV')
+        self.sedan = VehicleType.objects.create(name='Sedan')
+        self.crv = CarMake.objects.create(manuName='Honda', carModel='CR-V', vehicleType=self.suv)
+        self.civic = CarMake.objects.create(manuName='Honda', carModel='Civic', vehicleType=self.sedan)
+        self.mechanic = User.objects.create_user('wrench', first_name='Wren', last_name='Ch')
+        self.owner = Owner.objects.create(first_name='Ann', last_name='Lee')
+        self.cars = [
+            CarInstance.objects.create(car=make, license_plate=f'FS{number}', color='red', owner=self.owner, status=status)
+            for number, (make, status) in enumerate([(self.crv, 'A'), (self.civic, 'M'), (self.civic, 'A')])
+        ]
+        stats.fleet_stats()  # Builds the table, from here on the signals keep it up to date
+
+    def assertStatsMatchRebuild(self):
+        counted = {key: count for key, count in stats.stored_stats().items() if count}
+        self.assertEqual(counted, stats.count_fleet())
+        self.assertEqual(stats.rebuild_fleet_stats(), {})
+
+    def test_saves_keep_the_stats_in_step(self):
+        car = self.cars[0]
+        car.status = 'R'
+        car.save()
+        self.assertStatsMatchRebuild()
+        car.mechanic_stat = self.mechanic
+        car.car = self.civic
+        car.save()
+        self.assertStatsMatchRebuild()
+        # Saving with nothing changed moves nothing
+        car.save()
+        self.assertStatsMatchRebuild()
+        CarInstance.objects.create(car=None, license_plate='FS9', color='blue', mechanic_stat=self.mechanic)
+        self.assertStatsMatchRebuild()
+
+    def test_reassigning_mechanics(self):
+        other = User.objects.create_user('spanner')
+        for car in self.cars:
+            car.mechanic_stat = self.mechanic
+            car.save()
+        self.assertStatsMatchRebuild()
+        self.cars[1].mechanic_stat = other
+        self.cars[1].save()
+        self.assertStatsMatchRebuild()
+        # Deleting the user unassigns their cars with one SET NULL
+        self.mechanic.delete()
+        self.assertStatsMatchRebuild()
+        self.assertEqual(stats.fleet_stats()['mechanic'][''], 2)
+
+    def test_a_make_changing_type_moves_its_cars(self):
+        self.civic.vehicleType = self.suv
+        self.civic.save()
+        self.assertStatsMatchRebuild()
+        self.assertEqual(stats.fleet_stats()['vehicle_type'][str(self.suv.pk)], 3)
+
+    def test_deletes(self):
+        self.cars[1].delete()
+        self.assertStatsMatchRebuild()
+        spare = Owner.objects.create(first_name='Bo', last_name='Ng')
+        self.assertStatsMatchRebuild()
+        spare.delete()
+        self.assertStatsMatchRebuild()
+
+    def test_bulk_updates_and_drift(self):
+        bulk.update_cars(CarInstance.objects.all(), status='S')
+        self.assertStatsMatchRebuild()
+        # A write that skips the signals shows up as drift, and the rebuild fixes it
+        CarInstance.objects.filter(pk=self.cars[0].pk).update(status='O')
+        drift = stats.rebuild_fleet_stats()
+        self.assertEqual(drift, {('status', 'S'): (3, 2), ('status', 'O'): (0, 1)})
+        self.assertStatsMatchRebuild()
+
+    def test_move_counts_only_touches_changed_keys(self):
+        before = stats.car_keys(self.crv.pk, 'A', None)
+        stats.move_counts(before, stats.car_keys(self.crv.pk, 'M', None))
+        counts = stats.fleet_stats()
+        self.assertEqual((counts['cars'][stats.TOTAL], counts['status']['A'], counts['status']['M']), (3, 1, 2))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = Owner.objects.create(first_name="Mary", last_name="O'Brien", phone_num='5551234')
+        civic = CarMake.objects.create(manuName='Honda', carModel='Civic')
+        cls.car = CarInstance.objects.create(car=civic, license_plate='NEAR1', color='red', owner=cls.owner)
+        CarInstance.objects.create(car=civic, license_plate='XYZ9', color='blue')
+
+    def test_fts_query_quotes_every_word(self):
+        self.assertEqual(search.fts_query('smith 555'), '"smith"* AND "555"*')
+        self.assertEqual(search.fts_query('smith "555'), '"smith"* AND "555"*')
+        self.assertEqual(search.fts_query('a OR b NEAR(c)'), '"a"* AND "OR"* AND "b"* AND "NEAR"* AND "c"*')
+        self.assertEqual(search.fts_query('license_plate:x* -y ^z'), '"license_plate"* AND "x"* AND "y"* AND "z"*')
+        self.assertEqual(search.fts_query('"" * ( )'), '')
+
+    def check_search(self):
+        # Quotes, apostrophes and FTS5 operators are matched as plain words, never parsed
+        for query in ("O'Brien", '"mary', 'mary"', 'near1', 'NEAR(mary', '5551*'):
+            with self.subTest(query=query):
+                self.assertEqual(search.search(query)[0], [self.car])
+        # Every word has to match, operators included, so none of these find anything
+        for query in ('"mary" OR xyz9', 'mary AND', 'honda NOT xyz9', 'last_name:brien', '" * ()'):
+            with self.subTest(query=query):
+                self.assertEqual(search.search(query), ([], []))
+        self.assertEqual(search.search("o'brien")[1], [self.owner])
+
+    def test_search(self):
+        if not search.search_enabled():
+            self.skipTest('SQLite was built without FTS5')
+        search.rebuild_search_index()
+        self.check_search()
+
+    def test_search_without_fts(self):
+        with mock.patch('catalog.search.search_enabled', return_value=False):
+            self.check_search()
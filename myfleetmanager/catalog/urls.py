@@ -1,7 +1,7 @@
 """ Declares urls for the web app to use and reference"""
 
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
 from .views import (
     OwnerCreateView, 
@@ -39,6 +39,8 @@ urlpatterns = [
     path('my-cars/', CustomerCarListView.as_view(), name='customer_car_list'),
     path('car/<int:pk>/', views.CarDetailView.as_view(), name='car-detail'),
     path('car/edit/<int:car_id>/', views.edit_car_instance, name='edit_car_instance'),
+    path('cars/overdue/', views.OverdueQueueView.as_view(), name='overdue_queue'),
+    path('search/', views.search_view, name='search'),
 
     #OWNER oriented paths go here
     path('owner/create/', OwnerCreateView.as_view(), name='owner-create'),
@@ -57,9 +59,21 @@ urlpatterns = [
     # Admin Paths go here
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('admin/feedback/', feedback_list_view, name='feedback_list'),
+    path('admin/export/<str:kind>/', views.export_view, name='export'),
+    path('admin/analytics/', views.fleet_analytics_view, name='fleet_analytics'),
 
     # Mechanics Paths go here
     path('mechanics/dashboard/', views.mechanic_dashboard, name='mechanics_dashboard'),
+    path('admin/mechanics/', views.mechanic_workload_view, name='mechanic_workload'),
+
+    # Async dashboards, run their queries concurrently when served over ASGI
+    path('async/', async_views.async_home_page, name='async_index'),
+    path('async/admin/dashboard/', async_views.async_admin_dashboard, name='async_admin_dashboard'),
+    path('async/customer/', async_views.async_customer_dashboard, name='async_customer_dashboard'),
+
+    # Read-only JSON API paths go here
+    path('api/analytics/', api.api_analytics, name='api_analytics'),
+    path('api/<str:resource_name>/', api.api_list, name='api'),
 
     # User Management Paths go here
     path('users/', user_list, name='user_list'),
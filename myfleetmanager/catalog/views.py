@@ -2,6 +2,7 @@
 
 # Standard library imports
 from collections import defaultdict
+from datetime import date, timedelta
 
 # Django core imports
 from django.contrib.auth import authenticate, login
@@ -9,15 +10,29 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError  # Add this line
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Q
+from django.http import Http404, JsonResponse, QueryDict, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 from django.views import generic
 from django.views.generic import ListView, DetailView, TemplateView, CreateView
 from django.views.generic.edit import UpdateView
 
 # Local application imports
 from .models import Owner, VehicleType, CarMake, CarInstance, FooterContent, Feedback
+from .pagination import KeysetPaginator, InvalidCursor
+from .exports import EXPORTS, stream_csv, stream_jsonl
+from .middleware import query_budget
+from .visits import record_visit
+from .owners import save_user_and_owner
+from .caching import cached_page
+from .search import search
+from .stats import TOTAL, fleet_stats
+from .analytics import BREAKDOWNS as ANALYTICS_BREAKDOWNS, fleet_analytics
+from . import history, roles
+from .roles import has_role
 from .forms import (
     UserRegisterForm,
     OwnerForm,
@@ -31,6 +46,7 @@ from .forms import (
 # Views go under here
 # function based views go here
 
+@cached_page()
 def home_page(request):
     if request.user.is_authenticated:
         num_visits = increment_page_visits(request, 'home')
@@ -44,11 +60,11 @@ def home_page(request):
         }
 
         # Redirect to respective dashboards based on user group
-        if request.user.groups.filter(name='Customer').exists():
+        if is_customer(request.user):
             return redirect('customer_dashboard')  
-        elif request.user.groups.filter(name='Admin').exists():
+        elif is_admin(request.user):
             return redirect('admin_dashboard')  
-        elif request.user.groups.filter(name='Mechanics').exists():
+        elif is_mechanic(request.user):
             return redirect('mechanics_dashboard') 
         else:
             return render(request, 'no_auth_home.html', context)
@@ -61,13 +77,15 @@ def owner_success_view(request):
     num_visits = increment_page_visits(request, 'owner_success')
     return render(request, 'owner_success.html', {'num_visits': num_visits})
 
-'''Implements a helper function to count the page visits'''
+'''Implements a helper function to count the page visits (per user, written to the database in batches)'''
 def increment_page_visits(request, page_name):
-    session_key = f'num_visits_{page_name}'
-    num_visits = request.session.get(session_key, 0)
-    num_visits += 1
-    request.session[session_key] = num_visits
-    return num_visits
+    user_id = request.user.pk if request.user.is_authenticated else None
+    request.visit_page_name = page_name  # cached_page counts later visits under the same name
+    return record_visit(page_name, user_id)
+
+'''Pairs status_counts() results with their display labels for the dashboards'''
+def status_summary(counts):
+    return [(label, counts.get(code, 0)) for code, label in CarInstance.CAR_STATUS]
 
 
 # Defining page separation by group classes here 
@@ -97,8 +115,7 @@ class IsOwnerOrAdminMixin(UserPassesTestMixin):
 
 class AdminOrMechanicRequiredMixin(UserPassesTestMixin):
     def test_func(self):
-        return self.request.user.groups.filter(name='Admin').exists() or \
-               self.request.user.groups.filter(name='Mechanics').exists()
+        return is_admin_or_mechanic(self.request.user)
 
 
 class IsOwnerAdminOrMechanicMixin(UserPassesTestMixin):
@@ -123,11 +140,11 @@ def login_view(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
-            if user.groups.filter(name='Customer').exists():
+            if is_customer(user):
                 return redirect('customer_dashboard')
-            elif user.groups.filter(name='Admin').exists():
+            elif is_admin(user):
                 return redirect('admin_dashboard')
-            elif user.groups.filter(name='Mechanics').exists():
+            elif is_mechanic(user):
                 return redirect('mechanic_dashboard')
             else:
                 return redirect('some_other_dashboard')
@@ -141,27 +158,14 @@ def register_view(request):
         owner_form = OwnerForm(request.POST)
 
         if user_form.is_valid() and owner_form.is_valid():
-            user = user_form.save()
-
-            # Check if the owner already exists for this user
-            owner, created = Owner.objects.get_or_create(user=user)  # This will not create a new owner if one exists
-            
-            # Update the owner fields if they already exist
-            if not created:
-                # Optionally update existing fields if needed
-                owner.first_name = owner_form.cleaned_data['first_name']
-                owner.last_name = owner_form.cleaned_data['last_name']
-                owner.phone_num = owner_form.cleaned_data['phone_num']
-                owner.save()  # Save updates
-
+            # One transaction, one INSERT for the user and one for their owner
+            user = user_form.save(commit=False)
+            try:
+                save_user_and_owner(user, password=user_form.cleaned_data['password'], **owner_form.cleaned_data)
+            except ValidationError as exc:  # The owner details belong to someone else's login
+                owner_form.add_error(None, exc)
             else:
-                # If created, assign the fields from the form
-                owner.first_name = owner_form.cleaned_data['first_name']
-                owner.last_name = owner_form.cleaned_data['last_name']
-                owner.phone_num = owner_form.cleaned_data['phone_num']
-                owner.save()  # Save new owner
-
-            return redirect('owner_success.html')  # Redirect after successful registration
+                return redirect('owner_success.html')  # Redirect after successful registration
 
     else:
         user_form = UserRegisterForm()
@@ -176,30 +180,60 @@ def register_view(request):
 
 """Admin Separation"""
 def is_admin(user):
-    return user.groups.filter(name='Admin').exists() # Or check for a specific group
+    return has_role(user, roles.ADMIN)
 
 
 @login_required
 @user_passes_test(is_admin)
+@cached_page()
 def admin_dashboard(request):
     # Add any admin-specific data to the context
     num_visits = increment_page_visits(request, 'admin_dashboard')
-    footer_content = FooterContent.objects.first()  # Get the first (and only) footer content
 
-    # Get the counts of cars and owners
-    num_instances = CarInstance.objects.count()  # Count of all car instances
-    num_owners = Owner.objects.count()  # Count of all owners
+    # The totals come precomputed from the fleet stats table, see stats.py
+    fleet = fleet_stats()
+    num_overdue = CarInstance.objects.overdue().count()  # Depends on today, counted on the due_back index
 
     context = {
         'user': request.user,
         'num_visits': num_visits,
-        'footer_content': footer_content,
-        'num_instances': num_instances, 
-        'num_owners': num_owners,  
+        'num_instances': fleet['cars'][TOTAL],
+        'num_owners': fleet['owners'][TOTAL],
+        'num_overdue': num_overdue,
+        'charts': dashboard_charts(),  # Cached, see analytics.py
     }
     return render(request, 'dashboards/admin_dashboard.html', context)  # Ensure this matches your template path
 
 
+'''The cached fleet analytics as (title, rows) charts for the dashboard templates, see analytics.py'''
+def analytics_charts(analytics, timeline=True):
+    charts = [(title, analytics[name]) for name, title in ANALYTICS_BREAKDOWNS]
+    if timeline:
+        days = [dict(row, label=row['day']) for row in analytics['status_changes']]
+        charts.append((f'Status changes per day, last {len(days)} days', days))
+    return charts
+
+
+'''The admin dashboard's charts: the breakdowns, without the per day timeline'''
+def dashboard_charts():
+    return analytics_charts(fleet_analytics(), timeline=False)
+
+
+@login_required
+@user_passes_test(is_admin)
+@query_budget(12)  # A cache miss runs the breakdowns, a hit none of them
+@cached_page()
+def fleet_analytics_view(request):
+    analytics = fleet_analytics()
+    context = {
+        'total': analytics['total'],
+        'computed_at': parse_datetime(analytics['computed_at']),
+        'charts': analytics_charts(analytics),
+        'num_visits': increment_page_visits(request, 'fleet_analytics'),
+    }
+    return render(request, 'dashboards/fleet_analytics.html', context)
+
+
 @login_required
 @user_passes_test(is_admin)
 def user_list(request):
@@ -221,26 +255,7 @@ def add_user(request):
     if request.method == "POST":
         form = UserManagementForm(request.POST)
         if form.is_valid():
-            user = form.save()  # Save the user first
-
-            # Check for existing owner
-            first_name = request.POST.get('first_name')
-            last_name = request.POST.get('last_name')
-            phone_num = request.POST.get('phone_num')
-
-            owner, created = Owner.objects.get_or_create(
-                first_name=first_name,
-                last_name=last_name,
-                phone_num=phone_num,
-                defaults={'user': user}
-            )
-
-            if not created:
-                # If the owner already exists, you might want to update or handle it
-                # For example, you can assign the user to the existing owner
-                owner.user = user
-                owner.save()
-
+            form.save()  # Saves the user with their owner, see UserManagementForm.save
             return redirect('user_list')  # Redirect after saving
     else:
         form = UserManagementForm()
@@ -278,12 +293,10 @@ def user_detail(request, user_id):
     user = get_object_or_404(User, pk=user_id)
 
     num_visits = increment_page_visits(request, 'user_detail') 
-    footer_content = FooterContent.objects.first()  # Fetch footer content if needed
 
     context = {
         'user': user,
         'num_visits': num_visits,
-        'footer_content': footer_content,
     }
     return render(request, 'user_management/user_detail.html', context)
 
@@ -298,7 +311,7 @@ def delete_feedback(request, feedback_id):
 
 
 @login_required
-@user_passes_test(lambda user: user.groups.filter(name='Admin').exists())
+@user_passes_test(is_admin)
 def resolve_feedback(request, feedback_id):
     feedback = get_object_or_404(Feedback, pk=feedback_id)
     feedback.resolved = True
@@ -307,41 +320,64 @@ def resolve_feedback(request, feedback_id):
 
 
 @login_required
-@user_passes_test(lambda user: user.groups.filter(name='Admin').exists())
+@user_passes_test(is_admin)
+@query_budget(8)
 def feedback_list_view(request):
-    users = User.objects.all()
     categories = Feedback.CATEGORY_CHOICES
-    selected_user = request.GET.get('user', None)
+    selected_user = None
     selected_category = request.GET.get('category', None)
+    username = request.GET.get('username', '').strip()
+    user_id = request.GET.get('user', '')
+
+    # Newest first, with the user joined in so rows don't look their username up one by one
+    feedback_queryset = Feedback.objects.select_related('user').order_by('-created_at', '-id')
+
+    # Find the one user being filtered on by username (or id, for old links) instead of listing everyone
+    if username or user_id.isdigit():
+        lookup = {'username': username} if username else {'pk': int(user_id)}
+        selected_user = User.objects.filter(**lookup).only('id', 'username').first()
+        if selected_user is not None:
+            feedback_queryset = feedback_queryset.filter(user=selected_user)
+        else:
+            feedback_queryset = feedback_queryset.none()
 
-    feedback_queryset = Feedback.objects.all()
-
-    if selected_user:
-        try:
-            selected_user = int(selected_user)
-            feedback_queryset = feedback_queryset.filter(user_id=selected_user)
-        except ValueError:
-            selected_user = None
-
+    if selected_category not in dict(categories):
+        selected_category = None
     if selected_category:
         feedback_queryset = feedback_queryset.filter(category=selected_category)
 
-    # Separate feedback into resolved and unresolved
-    unresolved_feedback = feedback_queryset.filter(resolved=False)
-    resolved_feedback = feedback_queryset.filter(resolved=True)
+    # Separate feedback into resolved and unresolved, each paged on its own. resolved__in is
+    # used because resolved=False comes out as "NOT resolved", which SQLite can't use an index for
+    unresolved_feedback = feedback_page(request, feedback_queryset.filter(resolved__in=[False]), 'unresolved_page')
+    resolved_feedback = feedback_page(request, feedback_queryset.filter(resolved__in=[True]), 'resolved_page')
 
     context = {
         'unresolved_feedback': unresolved_feedback,
         'resolved_feedback': resolved_feedback,
-        'users': users,
         'categories': categories,
         'selected_user': selected_user,
+        'username': username or (selected_user.username if selected_user else ''),
         'selected_category': selected_category,
     }
 
     return render(request, 'page_management/feedback_list.html', context)
 
 
+FEEDBACK_PAGE_SIZE = 25
+
+'''Pages one feedback section, with links that keep the other section's page and the filters'''
+def feedback_page(request, queryset, page_param):
+    page = Paginator(queryset, FEEDBACK_PAGE_SIZE).get_page(request.GET.get(page_param))
+    query = request.GET.copy()
+    if page.has_previous():
+        query[page_param] = page.previous_page_number()
+        page.previous_query = query.urlencode()
+    if page.has_next():
+        query[page_param] = page.next_page_number()
+        page.next_query = query.urlencode()
+    return page
+
+
 @login_required
 @user_passes_test(is_admin)  
 def edit_footer_content(request):
@@ -358,35 +394,127 @@ def edit_footer_content(request):
     return render(request, 'page_management/edit_footer_content.html', {'form': form})
 
 
+@login_required
+@user_passes_test(is_admin)
+def export_view(request, kind):
+    # Streams a whole table as CSV (default) or JSONL without holding it in memory
+    if kind not in EXPORTS:
+        raise Http404(f'Unknown export "{kind}"')
+    if request.GET.get('format') == 'jsonl':
+        response = StreamingHttpResponse(stream_jsonl(kind), content_type='application/x-ndjson')
+        extension = 'jsonl'
+    else:
+        response = StreamingHttpResponse(stream_csv(kind), content_type='text/csv')
+        extension = 'csv'
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+    return response
+
+
 """Mechanics Separation"""
 def is_mechanic(user):
-    return user.groups.filter(name='Mechanics').exists() # Or check for a specific group
+    return has_role(user, roles.MECHANICS)
+
+
+WORK_QUEUE_SIZE = 25  # Cars shown per status on the mechanic dashboard
+
+'''Builds a mechanic's work queue: their cars grouped by status, the most pressing due_back first'''
+def mechanic_work_queue(mechanic, per_status=WORK_QUEUE_SIZE):
+    assigned = CarInstance.objects.assigned_to(mechanic)
+    counts = assigned.status_counts()
+    queue = []
+    for code, label in CarInstance.CAR_STATUS:
+        if not counts[code]:
+            continue
+        # One index range per status, cars without a due date go last
+        cars = (
+            assigned.filter(status=code).select_related('car', 'owner')
+            .order_by(F('due_back').asc(nulls_last=True), 'id')[:per_status]
+        )
+        queue.append({'code': code, 'label': label, 'count': counts[code], 'cars': cars})
+    return queue
 
 
 @login_required
 @user_passes_test(is_mechanic)
+@query_budget(16)
+@cached_page()
 def mechanic_dashboard(request):
     # Add any mechanic-specific data to the context
     num_visits = increment_page_visits(request, 'mechanic_dashboard')
     context = {
         'user': request.user,
-        'num_visits':num_visits
-        # Add other relevant data for mechanics
+        'num_visits':num_visits,
+        'status_counts': status_summary(fleet_stats()['status']),
+        'num_overdue': CarInstance.objects.overdue().count(),
+        'work_queue': mechanic_work_queue(request.user),
+        'num_my_overdue': CarInstance.objects.assigned_to(request.user).overdue().count(),
+        'today': date.today(),
     }
-    return render(request, 'dashboards/mechanic_dashboard.html')  # Ensure this matches your template path
+    return render(request, 'dashboards/mechanic_dashboard.html', context)  # Ensure this matches your template path
+
+
+'''Per-mechanic load with one GROUP BY: assigned, overdue and per status counts, busiest first'''
+def mechanic_workload(today=None):
+    today = today or date.today()
+    counts = {
+        f'status_{code}': Count('carinstance', filter=Q(carinstance__status=code))
+        for code, _ in CarInstance.CAR_STATUS
+    }
+    return (
+        User.objects.filter(groups__name=roles.MECHANICS)
+        .annotate(
+            assigned=Count('carinstance'),
+            overdue=Count('carinstance', filter=Q(carinstance__due_back__lt=today)),
+            **counts,
+        )
+        .order_by('-assigned', 'username')
+        .values('id', 'username', 'assigned', 'overdue', *counts)
+    )
+
+
+@login_required
+@user_passes_test(is_admin)
+@query_budget(8)
+def mechanic_workload_view(request):
+    rows = list(mechanic_workload())
+    for row in rows:
+        row['statuses'] = [row[f'status_{code}'] for code, _ in CarInstance.CAR_STATUS]
+    context = {
+        'workload': rows,
+        'status_labels': [label for _, label in CarInstance.CAR_STATUS],
+        'num_visits': increment_page_visits(request, 'mechanic_workload'),
+    }
+    return render(request, 'dashboards/mechanic_workload.html', context)
 
 
 def is_admin_or_mechanic(user):
-    return user.groups.filter(name='Admin').exists() or user.groups.filter(name='Mechanics').exists()
+    return has_role(user, roles.ADMIN, roles.MECHANICS)
+
+
+'''Finds cars and owners by plate, VIN, name, phone or make, ranked by the search index'''
+@login_required
+@user_passes_test(is_admin_or_mechanic)
+@query_budget(10)
+def search_view(request):
+    query = request.GET.get('q', '').strip()[:100]
+    cars, owners = search(query) if query else ([], [])
+    context = {
+        'query': query,
+        'cars': cars,
+        'owners': owners,
+        'num_visits': increment_page_visits(request, 'search'),
+    }
+    return render(request, 'car_management/search.html', context)
 
 
 """Customer separation"""
 def is_customer(user):
-    return user.groups.filter(name='Customer').exists()
+    return has_role(user, roles.CUSTOMER)
 
 
 @login_required
 @user_passes_test(is_customer)
+@cached_page()
 def customer_dashboard(request):
     # Get the owner associated with the logged-in user
     owner = get_object_or_404(Owner, user=request.user)
@@ -406,7 +534,7 @@ def customer_dashboard(request):
 
 
 @login_required
-@user_passes_test(lambda user: is_customer(user) or is_admin(user) or is_mechanic(user))
+@user_passes_test(lambda user: has_role(user, roles.CUSTOMER, roles.ADMIN, roles.MECHANICS))
 def edit_car_instance(request, car_id):
     car_instance = get_object_or_404(CarInstance, pk=car_id)
     
@@ -450,15 +578,66 @@ class CarListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     context_object_name = 'car_list'
     template_name = 'car_management/car_list.html'
 
+    page_size = 50  # Rows per page, pages are keyset paginated on (due_back, id)
+    query_budget = 12
+    visit_page_name = 'cars'
+
     def test_func(self):
         return is_admin_or_mechanic(self.request.user)
-        
+
+    def get_filters(self):
+        """Reads the status/owner/mechanic filters from the query string, dropping anything invalid."""
+        filters = {'status': '', 'owner': '', 'mechanic': ''}
+        status = self.request.GET.get('status', '')
+        if status in dict(CarInstance.CAR_STATUS):
+            filters['status'] = status
+        for name in ('owner', 'mechanic'):
+            value = self.request.GET.get(name, '')
+            if value.isdigit():
+                filters[name] = value
+        return filters
+
     def get_queryset(self):
-        return CarInstance.objects.all()  # Show all cars to admins and mechanics
+        # Show all cars to admins and mechanics, with the make, owner and mechanic joined in
+        return CarInstance.objects.for_list().filtered(**self.get_filters())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['num_visits'] = increment_page_visits(self.request, 'cars')
+        paginator = KeysetPaginator(self.object_list, 'due_back', self.page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            page = paginator.page()  # A mangled cursor just starts over at the first page
+
+        filters = self.get_filters()
+        query = QueryDict(mutable=True)
+        query.update({name: value for name, value in filters.items() if value})
+        context['filter_query'] = query.urlencode()
+        if page.has_next:
+            query['cursor'] = page.next_cursor
+            context['next_page_query'] = query.urlencode()
+
+        context['car_list'] = context['object_list'] = page.object_list
+        context['page'] = page
+        context['filters'] = filters
+        context['status_choices'] = CarInstance.CAR_STATUS
+        context['mechanics'] = User.objects.filter(groups__name=roles.MECHANICS).only('id', 'username').order_by('username')
+        context['num_visits'] = increment_page_visits(self.request, self.visit_page_name)
+        return context
+
+
+class OverdueQueueView(CarListView):
+    """Cars past their due date, most overdue first, worked out in the database."""
+    template_name = 'car_management/overdue_queue.html'
+    visit_page_name = 'overdue_queue'
+
+    def get_queryset(self):
+        # Ordering by due_back ascending puts the latest cars first and walks the due_back index
+        return super().get_queryset().overdue().with_days_overdue()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['overdue_counts'] = status_summary(CarInstance.objects.overdue().status_counts())
         return context
 
 
@@ -469,6 +648,13 @@ class CarDetailView(LoginRequiredMixin, IsOwnerAdminOrMechanicMixin, DetailView)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['num_visits'] = increment_page_visits(self.request, f'car_detail_{self.object.pk}')
+        # The last changes and how long the car has spent in each status, see catalog/history.py
+        context['status_history'] = history.car_history(self.object)
+        statuses = dict(CarInstance.CAR_STATUS)
+        context['time_in_status'] = [
+            (statuses.get(status, status or 'None'), timedelta(seconds=round(spent.total_seconds())))
+            for status, spent in sorted(history.time_in_status(self.object).items(), key=lambda item: -item[1])
+        ]
         return context
 
 
@@ -477,12 +663,31 @@ class OwnerListView(LoginRequiredMixin, AdminOrMechanicRequiredMixin, ListView):
     model = Owner
     context_object_name = 'owner_list'
     template_name = 'owner_management/owner_list.html'
+
+    page_size = 50  # Rows per page, pages are keyset paginated on (last_name, id)
+    query_budget = 8
     
     def test_func(self):
         return is_admin(self.request.user)
 
+    def get_queryset(self):
+        # Car and overdue counts come from subqueries, worked out only for the owners on the page
+        return Owner.objects.with_car_counts()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        paginator = KeysetPaginator(self.object_list, 'last_name', self.page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            page = paginator.page()  # A mangled cursor just starts over at the first page
+        if page.has_next:
+            query = QueryDict(mutable=True)
+            query['cursor'] = page.next_cursor
+            context['next_page_query'] = query.urlencode()
+
+        context['owner_list'] = context['object_list'] = page.object_list
+        context['page'] = page
         context['num_visits'] = increment_page_visits(self.request, 'owner_list')
         return context
 
@@ -490,10 +695,21 @@ class OwnerListView(LoginRequiredMixin, AdminOrMechanicRequiredMixin, ListView):
 class OwnerDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
     model = Owner
     template_name = 'owner_management/owner_detail.html'
+    query_budget = 8
+
+    def get_queryset(self):
+        # The cars come prefetched with their makes, so the template doesn't query per car
+        return Owner.objects.with_cars()
+
+    def get_object(self, queryset=None):
+        # test_func and get() both ask for the owner, only look it up once
+        if not hasattr(self, '_owner'):
+            self._owner = super().get_object(queryset)
+        return self._owner
 
     def test_func(self):
         owner = self.get_object()  # Get the owner object
-        return self.request.user == owner.user or self.request.user.groups.filter(name='Admin').exists()
+        return self.request.user.pk == owner.user_id or is_admin(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -532,13 +748,13 @@ class OwnerEditView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def test_func(self):
         owner = self.get_object()  # Get the owner object
-        return self.request.user == owner.user or self.request.user.groups.filter(name='Admin').exists()
+        return self.request.user == owner.user or is_admin(self.request.user)
 
     def get_success_url(self):
         # Check if the user is the owner or an admin
         if self.request.user == self.get_object().user:
             return reverse('customer_dashboard')  # Redirect to the owner's dashboard
-        elif self.request.user.groups.filter(name='Admin').exists():
+        elif is_admin(self.request.user):
             owner = self.get_object()
             return reverse('owner-detail', args=[owner.pk])  # Redirect to the owner list for admins
         return super().get_success_url()  # Fallback (if needed)
@@ -0,0 +1,165 @@
+"""
+Offline VIN decoding, nothing here goes over the network.
+
+decode() checks a 17 character VIN and reads what the VIN itself says about the car:
+
+    position 1-3  WMI, the manufacturer (looked up in WMI_MANUFACTURERS below)
+    position 9    check digit, mandatory for North American VINs (first character 1-5)
+    position 10   model year code, repeats every 30 years
+
+Decoding is cached (an LRU of recently seen VINs), so decode_many() over an import file or
+the whole car table stays quick even when the same VINs come up again and again.
+Manufacturers that aren't in the table still decode, just without a manufacturer name.
+"""
+
+# Standard library imports
+import datetime
+import re
+from functools import lru_cache
+from operator import mul
+from typing import NamedTuple
+
+VIN_LENGTH = 17
+CACHE_SIZE = 65536
+
+# Letters are worth these values in the check digit sum, digits are worth themselves
+_VALUES = {
+    **{str(digit): digit for digit in range(10)},
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9,
+}
+_WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+_VIN = re.compile(r'[0-9A-HJ-NPR-Z]{17}')
+
+# Position 10, in order from 1980 (and again from 2010)
+_YEAR_CODES = 'ABCDEFGHJKLMNPRSTVWXY123456789'
+_FIRST_YEAR = 1980
+
+# First character of the VIN -> where the car was built (the usual ranges, not every code)
+COUNTRIES = {
+    '1': 'United States', '4': 'United States', '5': 'United States',
+    '2': 'Canada', '3': 'Mexico', '9': 'Brazil',
+    'J': 'Japan', 'K': 'South Korea', 'L': 'China',
+    'S': 'United Kingdom', 'V': 'France or Spain', 'W': 'Germany',
+    'Y': 'Sweden or Finland', 'Z': 'Italy',
+}
+
+# World manufacturer identifiers for the makes a shop like ours sees most. Add to it freely,
+# the names should match CarMake.manuName so forms can pick the make from the VIN.
+WMI_MANUFACTURERS = {
+    '1FA': 'Ford', '1FD': 'Ford', '1FM': 'Ford', '1FT': 'Ford', '2FA': 'Ford', '2FM': 'Ford', '3FA': 'Ford',
+    '1LN': 'Lincoln', '5LM': 'Lincoln',
+    '1G1': 'Chevrolet', '1GC': 'Chevrolet', '1GN': 'Chevrolet', '2G1': 'Chevrolet', '3GC': 'Chevrolet',
+    '1GT': 'GMC', '1GK': 'GMC', '3GT': 'GMC',
+    '1G4': 'Buick', '1G6': 'Cadillac', '1GY': 'Cadillac',
+    '1C3': 'Chrysler', '2C3': 'Chrysler', '2C4': 'Chrysler',
+    '1B3': 'Dodge', '1D7': 'Dodge', '2B3': 'Dodge', '2D3': 'Dodge', '3D7': 'Dodge',
+    '1C6': 'Ram', '3C6': 'Ram',
+    '1J4': 'Jeep', '1J8': 'Jeep', '1C4': 'Jeep',
+    '5YJ': 'Tesla', '7SA': 'Tesla',
+    '1HG': 'Honda', '2HG': 'Honda', '5FN': 'Honda', '5J6': 'Honda', 'JHM': 'Honda', 'SHH': 'Honda',
+    '19U': 'Acura', 'JH4': 'Acura',
+    '1N4': 'Nissan', '1N6': 'Nissan', '5N1': 'Nissan', '3N1': 'Nissan', 'JN1': 'Nissan', 'JN8': 'Nissan',
+    '2T1': 'Toyota', '4T1': 'Toyota', '4T3': 'Toyota', '5TD': 'Toyota', '5TF': 'Toyota',
+    'JT2': 'Toyota', 'JTD': 'Toyota', 'JTE': 'Toyota', 'JTM': 'Toyota', 'JTN': 'Toyota',
+    '2T2': 'Lexus', 'JTH': 'Lexus', 'JTJ': 'Lexus',
+    'JM1': 'Mazda', 'JM3': 'Mazda', '1YV': 'Mazda',
+    'JF1': 'Subaru', 'JF2': 'Subaru', '4S3': 'Subaru', '4S4': 'Subaru',
+    'JA3': 'Mitsubishi', 'JA4': 'Mitsubishi',
+    'KMH': 'Hyundai', 'KM8': 'Hyundai', '5NP': 'Hyundai',
+    'KNA': 'Kia', 'KND': 'Kia', '5XY': 'Kia',
+    'WBA': 'BMW', 'WBS': 'BMW', '5UX': 'BMW',
+    'WDB': 'Mercedes-Benz', 'WDD': 'Mercedes-Benz', 'W1K': 'Mercedes-Benz', '4JG': 'Mercedes-Benz',
+    'WAU': 'Audi', 'WA1': 'Audi',
+    'WVW': 'Volkswagen', 'WVG': 'Volkswagen', '1VW': 'Volkswagen', '3VW': 'Volkswagen',
+    'WP0': 'Porsche', 'WP1': 'Porsche',
+    'YV1': 'Volvo', 'YV4': 'Volvo',
+    'SAJ': 'Jaguar', 'SAL': 'Land Rover',
+    'ZFA': 'Fiat', 'ZAR': 'Alfa Romeo', 'ZFF': 'Ferrari',
+}
+
+
+class VinInfo(NamedTuple):
+    """What a VIN says about its car. ``errors`` is empty for a valid VIN."""
+    vin: str
+    errors: tuple = ()
+    wmi: str = ''
+    manufacturer: str = None
+    country: str = None
+    model_year: int = None
+
+    @property
+    def valid(self):
+        return not self.errors
+
+
+def normalize(vin):
+    """VINs are compared upper case without surrounding spaces, '' and None stay as they are."""
+    return vin.strip().upper() if vin else vin
+
+
+def check_digit(vin):
+    """The check digit (0-9 or X) a 17 character VIN should have in position 9."""
+    total = sum(map(mul, map(_VALUES.__getitem__, vin), _WEIGHTS))
+    remainder = total % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+
+def model_year(vin, this_year=None):
+    """
+    The model year from position 10, or None if it isn't a year code.
+
+    North American VINs settle which 30 year cycle it is with position 7 (a digit up to
+    2009, a letter from 2010). For the rest we take the latest year that isn't in the future.
+    """
+    index = _YEAR_CODES.find(vin[9])
+    if index < 0:
+        return None
+    year = _FIRST_YEAR + index
+    if vin[0] in '12345':
+        return year + 30 if vin[6].isalpha() else year
+    latest = (this_year or datetime.date.today().year) + 1  # Next year's models come out early
+    while year + 30 <= latest:
+        year += 30
+    return year
+
+
+def decode(vin):
+    """Decodes one VIN (any case, surrounding spaces ignored), returns a VinInfo."""
+    return _decode(normalize(vin or ''))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _decode(vin):
+    if not _VIN.fullmatch(vin):
+        if len(vin) != VIN_LENGTH:
+            return VinInfo(vin, errors=(f'A VIN is exactly {VIN_LENGTH} characters, this one has {len(vin)}.',))
+        bad = sorted({char for char in vin if char not in _VALUES})
+        return VinInfo(vin, errors=(f'A VIN can\'t contain {", ".join(bad)} (I, O and Q are never used).',))
+
+    errors = []
+    north_american = vin[0] in '12345'
+    expected = check_digit(vin)
+    if north_american and vin[8] != expected:
+        errors.append(f'The check digit (9th character) is {vin[8]}, it should be {expected}. Is a character mistyped?')
+    year = model_year(vin)
+    if north_american and year is None:
+        errors.append(f'The 10th character, {vin[9]}, isn\'t a model year code.')
+    return VinInfo(
+        vin,
+        errors=tuple(errors),
+        wmi=vin[:3],
+        manufacturer=WMI_MANUFACTURERS.get(vin[:3]),
+        country=COUNTRIES.get(vin[0]),
+        model_year=year,
+    )
+
+
+def decode_many(vins):
+    """Decodes a batch of VINs, returns {vin as given: VinInfo}. Repeats and blanks are decoded once."""
+    return {vin: decode(vin) for vin in set(vins)}
+
+
+def cache_info():
+    return _decode.cache_info()
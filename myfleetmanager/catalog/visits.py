@@ -0,0 +1,84 @@
+"""
+Write-behind page visit counters.
+
+Visits are counted in memory and in the cache, then written to the PageVisit table in one
+go every CATALOG_VISIT_FLUSH_INTERVAL seconds, after a response has gone out. Viewing a page
+therefore never writes to the database (or to the session) itself. Visits still pending
+when a worker stops are lost, at most one flush interval's worth.
+"""
+
+# Standard library imports
+import threading
+import time
+from collections import Counter
+
+# Django core imports
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.dispatch import receiver
+
+# Local application imports
+from .models import PageVisit
+
+CACHE_TIMEOUT = 60 * 60 * 24  # Totals drop out of the cache after a day without visits
+
+_pending = Counter()  # (page, user id) -> visits not written to the database yet
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _cache_key(page, user_id):
+    return f'catalog:visits:{user_id or "anonymous"}:{page}'
+
+
+def record_visit(page, user_id=None):
+    """Counts one visit to ``page`` by ``user_id`` (None for anonymous) and returns the running total."""
+    with _lock:
+        _pending[(page, user_id)] += 1
+    cache_key = _cache_key(page, user_id)
+    try:
+        return cache.incr(cache_key)
+    except ValueError:  # Not cached yet, start from what's in the table (a read, once per page and user)
+        stored = PageVisit.objects.filter(page=page, user_id=user_id).aggregate(total=Sum('count'))['total'] or 0
+        with _lock:
+            total = stored + _pending[(page, user_id)]
+        if not cache.add(cache_key, total, CACHE_TIMEOUT):
+            total = cache.incr(cache_key)  # Another request got there first
+        return total
+
+
+def flush_visits():
+    """Writes the pending visits to PageVisit, one UPDATE (or INSERT for a new row) per page and user."""
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+    with transaction.atomic():
+        for (page, user_id), visits in pending.items():
+            _add_visits(page, user_id, visits)
+    return len(pending)
+
+
+def _add_visits(page, user_id, visits):
+    rows = PageVisit.objects.filter(page=page, user_id=user_id)
+    if rows.update(count=F('count') + visits):
+        return
+    try:
+        with transaction.atomic():
+            PageVisit.objects.create(page=page, user_id=user_id, count=visits)
+    except IntegrityError:  # Another process created the row between our UPDATE and INSERT
+        rows.update(count=F('count') + visits)
+
+
+@receiver(request_finished)
+def flush_visits_periodically(sender, **kwargs):
+    interval = getattr(settings, 'CATALOG_VISIT_FLUSH_INTERVAL', 30)
+    if _pending and time.monotonic() - _last_flush >= interval:
+        flush_visits()
+
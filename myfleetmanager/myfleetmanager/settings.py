@@ -45,14 +45,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.middleware.PerformanceMiddleware', # keep first so it times everything below it
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'catalog.middleware.StatusHistoryMiddleware', # needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware', #session counter
 ]
 
 ROOT_URLCONF = 'myfleetmanager.urls'
@@ -69,6 +70,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'catalog.context_processors.footer_content',
+                'catalog.context_processors.user_roles',
+                'catalog.context_processors.cache_versions',
             ],
         },
     },
@@ -80,6 +83,14 @@ WSGI_APPLICATION = 'myfleetmanager.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# FLEET_DB_PROFILE picks how we talk to the database:
+#   sqlite      the plain SQLite file, as it has always been (default)
+#   sqlite-wal  the same file in WAL mode, with a busy timeout and tuned pragmas so readers
+#               don't block the writer and concurrent edits wait instead of failing with
+#               "database is locked" (pragmas are applied in catalog/signals.py)
+#   postgres    PostgreSQL with persistent connections, configured by the FLEET_DB_* variables
+FLEET_DB_PROFILE = os.environ.get('FLEET_DB_PROFILE', 'sqlite')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -87,6 +98,53 @@ DATABASES = {
     }
 }
 
+# Run once on every new SQLite connection when set, see catalog/signals.py
+CATALOG_SQLITE_PRAGMAS = {}
+
+if FLEET_DB_PROFILE == 'sqlite-wal':
+    DATABASES['default'].update({
+        'OPTIONS': {'timeout': 20},  # seconds a writer waits for the lock before giving up
+        'CONN_MAX_AGE': 600,  # SQLite connections are cheap, but the pragmas run per connection
+    })
+    CATALOG_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # readers and the writer no longer block each other
+        'synchronous': 'NORMAL',  # safe with WAL, fsyncs at checkpoints instead of every commit
+        'busy_timeout': 20000,  # ms, matches the timeout above
+        'cache_size': -64000,  # 64 MB page cache
+        'temp_store': 'MEMORY',
+        'mmap_size': 268435456,  # 256 MB
+    }
+elif FLEET_DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('FLEET_DB_NAME', 'fleetmanager'),
+            'USER': os.environ.get('FLEET_DB_USER', 'fleetmanager'),
+            'PASSWORD': os.environ.get('FLEET_DB_PASSWORD', ''),
+            'HOST': os.environ.get('FLEET_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('FLEET_DB_PORT', '5432'),
+            # Keep connections open between requests, and check them before reuse
+            'CONN_MAX_AGE': int(os.environ.get('FLEET_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('FLEET_DB_POOL'):
+        import django
+        if django.VERSION >= (5, 1):
+            # Built-in psycopg 3 pool, shared by the threads of a worker (needs psycopg[pool])
+            DATABASES['default']['CONN_MAX_AGE'] = 0
+            DATABASES['default']['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('FLEET_DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('FLEET_DB_POOL_MAX', 20)),
+            }
+        else:
+            # Older Django: point FLEET_DB_HOST at PgBouncer in transaction pooling mode,
+            # which can't keep server side cursors open between transactions
+            DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif FLEET_DB_PROFILE != 'sqlite':
+    raise ValueError(f'Unknown FLEET_DB_PROFILE "{FLEET_DB_PROFILE}", use sqlite, sqlite-wal or postgres.')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -137,4 +195,72 @@ LOGIN_REDIRECT_URL = '/customer/'  # Redirect customers here after login
 LOGOUT_REDIRECT_URL = '/'  # This will redirect to the home page
 
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1']
\ No newline at end of file
+ALLOWED_HOSTS = ['localhost', '127.0.0.1']
+
+# Performance instrumentation (catalog.middleware.PerformanceMiddleware)
+CATALOG_PERF_LOG_INTERVAL = 60  # seconds between aggregate performance logs when DEBUG is off
+CATALOG_ENFORCE_QUERY_BUDGETS = False  # turn on in tests to make views over their query budget fail
+
+# Page visit counters are kept in memory/cache and written to PageVisit this often (seconds)
+CATALOG_VISIT_FLUSH_INTERVAL = 30
+
+# Dashboards and the landing page are cached whole for this long (seconds), see catalog/caching.py
+CATALOG_PAGE_CACHE_TIMEOUT = 300
+CATALOG_PAGE_CACHE = True  # False renders every time, e.g. to benchmark the views themselves
+
+# Due back reminders (manage.py send_due_back_reminders): owners hear this many days ahead,
+# and overdue notices are escalated after this many days, see catalog/reminders.py
+CATALOG_REMINDER_DAYS_AHEAD = 3
+CATALOG_REMINDER_ESCALATE_AFTER_DAYS = 7
+
+# Outgoing mail (the reminders above). Without FLEET_EMAIL_HOST the emails are only printed
+# to the console, set it (and the other FLEET_EMAIL_* variables) to send them over SMTP
+EMAIL_HOST = os.environ.get('FLEET_EMAIL_HOST', '')
+if EMAIL_HOST:
+    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    EMAIL_PORT = int(os.environ.get('FLEET_EMAIL_PORT', 587))
+    EMAIL_HOST_USER = os.environ.get('FLEET_EMAIL_USER', '')
+    EMAIL_HOST_PASSWORD = os.environ.get('FLEET_EMAIL_PASSWORD', '')
+    EMAIL_USE_TLS = os.environ.get('FLEET_EMAIL_USE_TLS', '1') == '1'
+else:
+    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = os.environ.get('FLEET_EMAIL_FROM', 'Fleet Manager <fleet@localhost>')
+
+# Fleet analytics (admin dashboard charts, /catalog/api/analytics/) are cached this long
+# (seconds) unless the fleet changes first, and the per day chart covers this many days.
+# manage.py warm_analytics computes them ahead of time into the shared cache (CACHES below),
+# see catalog/analytics.py
+CATALOG_ANALYTICS_TIMEOUT = 600
+CATALOG_ANALYTICS_TIMELINE_DAYS = 30
+
+# Two caches:
+#   default  per process, in memory: cached pages, fragments and visit totals, the busy stuff
+#   shared   files in FLEET_CACHE_DIR that every worker and manage.py command on the machine
+#            sees: the cache versions signals.py bumps, the footer and the fleet analytics, so
+#            a change saved (or imported) in one process moves the others on too
+# Across machines make 'shared' a Memcached or Redis cache, see catalog/caching.py
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('FLEET_CACHE_DIR', BASE_DIR / 'cache'),
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'catalog': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
\ No newline at end of file